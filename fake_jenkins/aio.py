@@ -0,0 +1,435 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module only runs on Python 3, but sticks to Python 2 syntax so that
+# the package still byte-compiles there.
+
+import collections
+import io
+import re
+import signal
+import sys
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import unquote, parse_qsl, urlencode
+except ImportError:
+    asyncio = None
+
+from fake_jenkins.api import EVENTS_HEARTBEAT, EVENTS_POLLED, parse_wait
+from fake_jenkins.faults import APPLIED, ConnectionDropped, endpoint_for
+from fake_jenkins.limits import Admission
+
+MAX_HEAD_SIZE = 64 * 1024
+BUILD_PATH = re.compile(r'^/job/(?P<job>[^/]+(?:/job/[^/]+)*)/(?P<number>\d+)/api/json$')
+EVENTS_PATH = re.compile(r'^/job/(?P<job>[^/]+(?:/job/[^/]+)*)/events$')
+
+REASONS = {200: 'OK', 201: 'Created', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request',
+           403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class AsyncServer(object):
+    def __init__(self, app, core, threads=8, faults=None, max_in_flight=None):
+        if asyncio is None:
+            raise RuntimeError('the asyncio frontend requires Python 3')
+        self.app = app
+        self.core = core
+        self.faults = faults
+        self.admission = Admission(max_in_flight)
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.waiters = BuildWaiters(self.loop)
+        self.events = EventWaiters(self.loop)
+        self.server = None
+        core.listeners.append(self.waiters.on_build_event)
+        # After the events of the core, which streams read once woken up
+        core.listeners.append(self.events.on_event)
+
+    def bind(self, host, port):
+        self.server = self.loop.run_until_complete(
+            self.loop.create_server(lambda: HttpProtocol(self), host, port, backlog=4096, reuse_address=True))
+        return self.server.sockets[0].getsockname()[1]
+
+    def serve_forever(self):
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def close(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.executor.shutdown(wait=False)
+        self.loop.close()
+
+    def handle(self, environ):
+        future = self.loop.create_future()
+        # Requests waiting for a thread count as in flight, they are what makes latency collapse
+        if not self.admission.enter():
+            status, headers, body = simple_response(503, b'Service Unavailable')
+            future.set_result((status, headers + [('Retry-After', '1')], body))
+            return future
+        future.add_done_callback(lambda _: self.admission.leave())
+        fault = None
+        endpoint = endpoint_for(self.app.url_map, environ) if self.faults is not None and self.faults.rules else None
+        if endpoint is not None:
+            # Injected delays are timers on the loop rather than sleeping threads. Other paths, such as
+            # namespaces, are left to the application.
+            environ[APPLIED] = self.faults
+            fault = self.faults.decide(endpoint, environ['REQUEST_METHOD'])
+        if fault is not None and fault.delay:
+            self.loop.call_later(fault.delay, self._handle, environ, future, fault)
+        else:
+            self._handle(environ, future, fault)
+        return future
+
+    def _handle(self, environ, future, fault):
+        if fault is not None and fault.drop:
+            future.set_result(None)
+            return
+        if fault is not None and fault.status is not None:
+            future.set_result(fault.response())
+            return
+        match = BUILD_PATH.match(environ['PATH_INFO'])
+        query = parse_qsl(environ['QUERY_STRING'], keep_blank_values=True)
+        wait = [value for name, value in query if name == 'wait']
+        if match and wait:
+            # The wait happens here, without holding a thread, and the Api sees a plain request
+            environ['QUERY_STRING'] = urlencode([(name, value) for name, value in query if name != 'wait'])
+            try:
+                timeout = parse_wait(wait[-1])
+            except ValueError:
+                future.set_result(simple_response(400, b'wait must be a number of seconds'))
+                return
+            waited = self.waiters.wait(self._build_exists, match.group('job').replace('/job/', '/'),
+                                       int(match.group('number')), timeout)
+            waited.add_done_callback(lambda _: self._dispatch(environ, future))
+        else:
+            self._dispatch(environ, future)
+
+    def _build_exists(self, job_name, number):
+        job = self.core.jobs.get(job_name)
+        return job is not None and number < job.next_build_number
+
+    def _dispatch(self, environ, future):
+        environ[EVENTS_POLLED] = True
+        running = self.loop.run_in_executor(self.executor, call_application, self.app, environ)
+
+        def done(running):
+            if isinstance(running.exception(), ConnectionDropped):
+                future.set_result(None)
+            elif running.exception() is not None:
+                future.set_result(simple_response(500, b'Internal Server Error'))
+            else:
+                status, headers, body = running.result()
+                match = EVENTS_PATH.match(environ['PATH_INFO'])
+                if isinstance(body, StreamedBody) and match:
+                    body.job_name = match.group('job').replace('/job/', '/')
+                future.set_result((status, headers, body))
+
+        running.add_done_callback(done)
+
+
+class BuildWaiters(object):
+    def __init__(self, loop):
+        self.loop = loop
+        # Futures by job name, then by the build number they wait for
+        self.waiting = collections.defaultdict(lambda: collections.defaultdict(list))
+
+    def wait(self, exists, job_name, number, timeout):
+        future = self.loop.create_future()
+        if exists(job_name, number) or timeout <= 0:
+            future.set_result(None)
+            return future
+
+        self.waiting[job_name][number].append(future)
+        handle = self.loop.call_later(timeout, self._expire, job_name, number, future)
+        future.add_done_callback(lambda _: handle.cancel())
+        # The build may have been created while the waiter was registered
+        if exists(job_name, number):
+            self._fire(job_name, number)
+        return future
+
+    def on_build_event(self, event, job, build):
+        # Called from request and scheduler threads
+        if event == 'build_created' and job.name in self.waiting:
+            self.loop.call_soon_threadsafe(self._fire, job.name, build.number)
+
+    def _fire(self, job_name, number):
+        numbers = self.waiting.get(job_name, {})
+        for waited in [waited for waited in numbers if waited <= number]:
+            for future in numbers.pop(waited):
+                if not future.done():
+                    future.set_result(None)
+        if not numbers:
+            self.waiting.pop(job_name, None)
+
+    def _expire(self, job_name, number, future):
+        futures = self.waiting.get(job_name, {}).get(number, [])
+        if future in futures:
+            futures.remove(future)
+            if not futures:
+                del self.waiting[job_name][number]
+                if not self.waiting[job_name]:
+                    del self.waiting[job_name]
+        if not future.done():
+            future.set_result(None)
+
+
+class EventWaiters(object):
+    def __init__(self, loop):
+        self.loop = loop
+        # Futures by job name, woken up by the next event of their job
+        self.waiting = collections.defaultdict(set)
+
+    def subscribe(self, job_name, timeout):
+        future = self.loop.create_future()
+        self.waiting[job_name].add(future)
+        handle = self.loop.call_later(timeout, self._expire, future)
+
+        def done(_):
+            handle.cancel()
+            futures = self.waiting.get(job_name)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self.waiting[job_name]
+
+        future.add_done_callback(done)
+        return future
+
+    def on_event(self, event, job, build):
+        # Called from request and scheduler threads
+        if job.name in self.waiting:
+            self.loop.call_soon_threadsafe(self._fire, job.name)
+
+    def _fire(self, job_name):
+        for future in list(self.waiting.get(job_name, ())):
+            if not future.done():
+                future.set_result(None)
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_result(None)
+
+
+class HttpProtocol(asyncio.Protocol if asyncio else object):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.busy = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def data_received(self, data):
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.buffer.extend(data)
+        if not self.busy:
+            self._next_request()
+
+    def _next_request(self):
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > MAX_HEAD_SIZE:
+                self._respond(simple_response(431, b''), close=True)
+            return
+
+        try:
+            request_line, headers = parse_head(bytes(self.buffer[:end]).decode('latin-1'))
+            method, target, version = request_line.split(' ')
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            self._respond(simple_response(400, b'Bad Request'), close=True)
+            return
+        if len(self.buffer) < end + 4 + length:
+            return
+        body = bytes(self.buffer[end + 4:end + 4 + length])
+        del self.buffer[:end + 4 + length]
+
+        connection = headers.get('connection', '').lower()
+        close = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+        environ = make_environ(self.transport, method, target, version, headers, body)
+
+        self.busy = True
+        self.server.handle(environ).add_done_callback(
+            lambda future: self._respond(future.result(), close=close, head=method == 'HEAD'))
+
+    def _respond(self, response, close=False, head=False):
+        if response is None:
+            # Dropped by an injected fault, without an answer
+            self.busy = False
+            if self.transport is not None:
+                self.transport.abort()
+            return
+        status, headers, body = response
+        if self.transport is None:
+            self._finish(body, close)
+            return
+
+        streamed = isinstance(body, StreamedBody)
+        lines = ['HTTP/1.1 {0}'.format(status)]
+        names = set()
+        for name, value in headers:
+            lines.append('{0}: {1}'.format(name, value))
+            names.add(name.lower())
+        if streamed:
+            lines.append('Transfer-Encoding: chunked')
+        elif 'content-length' not in names and not status.startswith(('204', '304')):
+            lines.append('Content-Length: {0}'.format(len(body)))
+        if close:
+            lines.append('Connection: close')
+        self.transport.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') +
+                             (b'' if head or streamed else body))
+
+        if streamed and not head:
+            self._stream(body, close)
+        else:
+            self._finish(body, close)
+
+    def _stream(self, body, close):
+        # Chunks are produced on the thread pool. Event streams yield an empty chunk rather than wait there for
+        # events, they wait here on the loop, subscribed before looking for events so that none is missed.
+        events = None
+        if body.job_name is not None:
+            events = self.server.events.subscribe(body.job_name, EVENTS_HEARTBEAT)
+        pending = self.server.loop.run_in_executor(self.server.executor, body.next_chunk)
+
+        def written(pending):
+            chunk = None if pending.exception() is not None else pending.result()
+            if chunk is None or self.transport is None or self.transport.is_closing():
+                if events is not None:
+                    events.cancel()
+                if self.transport is not None:
+                    self.transport.write(b'0\r\n\r\n')
+                self._finish(body, close or chunk is not None)
+                return
+            if chunk:
+                self.transport.write('{0:x}\r\n'.format(len(chunk)).encode('latin-1') + chunk + b'\r\n')
+            if chunk or events is None:
+                if events is not None:
+                    events.cancel()
+                self._stream(body, close)
+            else:
+                events.add_done_callback(lambda _: self._stream(body, close))
+
+        pending.add_done_callback(written)
+
+    def _finish(self, body, close):
+        self.busy = False
+        if isinstance(body, StreamedBody):
+            self.server.loop.run_in_executor(self.server.executor, body.close)
+        if self.transport is None:
+            return
+        if close:
+            self.transport.close()
+        elif self.buffer:
+            self._next_request()
+
+
+class StreamedBody(object):
+    def __init__(self, result):
+        self.result = result
+        self.iterator = iter(result)
+        self.job_name = None
+
+    def next_chunk(self):
+        return next(self.iterator, None)
+
+    def close(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
+
+
+def parse_head(head):
+    lines = head.split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if not _:
+            raise ValueError(line)
+        name = name.strip().lower()
+        headers[name] = headers[name] + ', ' + value.strip() if name in headers else value.strip()
+    return lines[0], headers
+
+
+def make_environ(transport, method, target, version, headers, body):
+    path, _, query = target.partition('?')
+    host, port = (transport.get_extra_info('sockname') or ('', 0))[:2]
+    peer = transport.get_extra_info('peername') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote(path, encoding='latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': peer[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        key = name.upper().replace('-', '_')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[key] = value
+        else:
+            environ['HTTP_' + key] = value
+    return environ
+
+
+def call_application(app, environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    result = app(environ, start_response)
+    if not started[0].startswith(('204', '304')) and \
+            not any(name.lower() == 'content-length' for name, _ in started[1]):
+        # Responses of unknown length, such as event streams, are sent as they are produced
+        return started[0], started[1], StreamedBody(result)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started[0], started[1], body
+
+
+def simple_response(code, body):
+    return '{0} {1}'.format(code, REASONS.get(code, '')), [('Content-Type', 'text/plain')], body
+
+
+def serve(app, core, host, port, threads=8, faults=None, max_in_flight=None):
+    server = AsyncServer(app, core, threads=threads, faults=faults, max_in_flight=max_in_flight)
+    server.bind(host, port)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        server.loop.add_signal_handler(signum, server.loop.stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
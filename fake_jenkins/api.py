@@ -12,12 +12,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 import functools
+import math
+import re
+import time
 
 import flask
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import BaseConverter
 
-from fake_jenkins.core import MissingResource, BuildParameter
+from fake_jenkins.auth import Authenticator, CRUMB_FIELD, check_token
+from fake_jenkins.cache import ResponseCache
+from fake_jenkins.core import InvalidJobName, InvalidView, JobNotFound, MissingResource, UnsupportedOperation
+from fake_jenkins.faults import Faults, InvalidFaults
+from fake_jenkins.limits import HOLDING, RateLimiter, default_burst
+from fake_jenkins.manifest import InvalidManifest, load_manifest, job_spec
+from fake_jenkins.metrics import Metrics, Profiler
+from fake_jenkins.validation import string
+from fake_jenkins.views import ALL_VIEW, FOLDER_CLASS, MULTIBRANCH_CLASS, listing_body
+
+
+CONSOLE_CHUNK_SIZE = 64 * 1024
+PROGRESSIVE_TEXT_SIZE = 1024 * 1024
+MAX_WAIT = 300
+MAX_BATCH_BUILDS = 100000
+EVENTS_HEARTBEAT = 15
+# Set by servers that wait for events on their own, event streams then yield an empty chunk instead of waiting
+EVENTS_POLLED = 'fake_jenkins.events_polled'
 
 
 def exception_handler(fn):
@@ -27,52 +50,145 @@ def exception_handler(fn):
             return fn(self, *args, **kwargs)
         except MissingResource:
             flask.abort(404)
+        except InvalidTree:
+            flask.abort(400)
+        except (InvalidManifest, InvalidJobName, InvalidView, InvalidFaults, UnsupportedOperation) as e:
+            return flask.make_response(str(e), 400)
 
     return wrapper
 
 
 class Api(object):
-    def __init__(self, core):
+    def __init__(self, core, cache_size=1024, profile_rate=0.0, users=None, require_crumb=False, faults=None,
+                 limiter=None):
         self.core = core
+        self.faults = faults or Faults()
+        self.limiter = limiter or RateLimiter()
+        self.auth = Authenticator(users=users, require_crumb=require_crumb)
+        self.cache = ResponseCache(size=cache_size)
+        self.profiler = Profiler(rate=profile_rate)
+        self.metrics = Metrics()
+        self.request_count = self.metrics.counter('fake_jenkins_requests_total', 'Requests handled',
+                                                  labels=('endpoint', 'method', 'status'))
+        self.request_latency = self.metrics.histogram('fake_jenkins_request_duration_seconds',
+                                                      'Time spent handling requests', labels=('endpoint',))
+        self.metrics.gauge('fake_jenkins_jobs', 'Jobs defined', lambda: len(self.core.jobs))
+        self.metrics.gauge('fake_jenkins_builds', 'Builds kept by all jobs',
+                           lambda: sum(len(job.builds) for job in list(self.core.jobs.values())))
+        self.metrics.gauge('fake_jenkins_queue_items', 'Builds waiting in the queue',
+                           self.core.queue.count_pending_items)
 
     def hook_to(self, server):
         self.app = server
-        self.app.add_url_rule('/buildByToken/build', view_func=self.build, methods=['GET'])
-        self.app.add_url_rule('/buildByToken/buildWithParameters', view_func=self.build_with_parameters, methods=['GET'])
-        self.app.add_url_rule('/job/<job_name>', view_func=self.create_job, methods=['POST'])
-        self.app.add_url_rule('/job/<job_name>/api/json', view_func=self.get_job, methods=['GET'])
-        self.app.add_url_rule('/job/<job_name>/<build_number>/api/json', view_func=self.get_build, methods=['GET'])
+        self.app.url_map.converters['job'] = JobPathConverter
+        self._add_url_rule('/buildByToken/build', view_func=self.build, methods=['GET'], public=True)
+        self._add_url_rule('/buildByToken/buildWithParameters', view_func=self.build_with_parameters, methods=['GET'],
+                           public=True)
+        self._add_url_rule('/buildByToken/batch', view_func=self.build_batch, methods=['POST'], public=True)
+        self._add_url_rule('/crumbIssuer/api/json', view_func=self.get_crumb, methods=['GET'])
+        self._add_url_rule('/api/json', view_func=self.get_root, methods=['GET'])
+        self._add_url_rule('/view/<view_name>', view_func=self.create_view, methods=['POST'])
+        self._add_url_rule('/view/<view_name>/api/json', view_func=self.get_view, methods=['GET'])
+        self._add_url_rule('/job/<job:job_name>', view_func=self.create_job, methods=['POST'])
+        self._add_url_rule('/jobs', view_func=self.create_jobs, methods=['POST'])
+        self._add_url_rule('/job/<job:job_name>/api/json', view_func=self.get_job, methods=['GET'])
+        self._add_url_rule('/job/<job:job_name>/events', view_func=self.get_job_events, methods=['GET'])
+        self._add_url_rule('/job/<job:job_name>/<build_number>/api/json', view_func=self.get_build, methods=['GET'])
+        self._add_url_rule('/job/<job:job_name>/<build_number>/logText/progressiveText',
+                          view_func=self.get_progressive_text, methods=['GET'])
+        self._add_url_rule('/job/<job:job_name>/<build_number>/consoleText', view_func=self.get_console_text,
+                          methods=['GET'])
+        self._add_url_rule('/queue/api/json', view_func=self.get_queue, methods=['GET'])
+        self._add_url_rule('/queue/item/<int:item_id>/api/json', view_func=self.get_queue_item, methods=['GET'])
+        self._add_url_rule('/queue/cancelItem', view_func=self.cancel_queue_item, methods=['POST'])
+        self._add_url_rule('/snapshot', view_func=self.snapshot, methods=['POST'])
+        self._add_url_rule('/snapshot/restore', view_func=self.restore_snapshot, methods=['POST'])
+        self._add_url_rule('/faults', view_func=self.get_faults, methods=['GET'])
+        self._add_url_rule('/faults', view_func=self.set_faults, methods=['POST'])
+        self._add_url_rule('/faults', view_func=self.clear_faults, methods=['DELETE'])
+        self._add_url_rule('/metrics', view_func=self.get_metrics, methods=['GET'])
+        self._add_url_rule('/metrics/profile', view_func=self.get_profile, methods=['GET'])
+
+    def _add_url_rule(self, rule, view_func, methods, public=False):
+        # Public routes authenticate with job tokens rather than users and crumbs
+        if not public:
+            view_func = self._authenticated(view_func)
+        self.app.add_url_rule(rule, view_func=self._instrumented(view_func), methods=methods)
+
+    def _authenticated(self, view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            credentials = None
+            if self.auth.users:
+                credentials = flask.request.authorization
+                if credentials is None or not self.auth.check_user(credentials.username, credentials.password):
+                    response = flask.make_response('Authentication required', 401)
+                    response.headers['WWW-Authenticate'] = 'Basic realm="Jenkins"'
+                    return response
+            if self.auth.require_crumb and credentials is None and flask.request.method == 'POST':
+                crumb = flask.request.headers.get(CRUMB_FIELD) or flask.request.args.get(CRUMB_FIELD)
+                if not self.auth.check_crumb(flask.request.remote_addr, crumb):
+                    return flask.make_response('No valid crumb was included in the request', 403)
+            return view_func(*args, **kwargs)
+
+        return wrapper
 
+    def _instrumented(self, view_func):
+        endpoint = view_func.__name__
+
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            status = 500
+            try:
+                if self.profiler.sampled():
+                    response = self.profiler.profile(endpoint, view_func, *args, **kwargs)
+                else:
+                    response = view_func(*args, **kwargs)
+                response = self.app.make_response(response)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.code
+                raise
+            finally:
+                self.request_count.inc((endpoint, flask.request.method, status))
+                self.request_latency.observe((endpoint,), time.time() - start)
+
+        return wrapper
+
+    @exception_handler
     def create_job(self, job_name):
-        params = {}
         request_data = flask.request.data
-        if request_data == '':
-            data = {}
-        else:
-            data = json.loads(flask.request.data)
-        if data:
-            if 'auth_token' in data:
-                params['auth_token'] = data['auth_token']
-
-            if 'parameters' in data:
-                params['parameters'] = []
-                for parameter in data['parameters']:
-                    params['parameters'].append(BuildParameter(name=parameter['name'],
-                                   default_value=parameter['default_value']))
-        self.core.create_job(name=job_name, **params)
+        try:
+            data = json.loads(request_data.decode('utf-8')) if request_data else {}
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return flask.make_response('job must be a JSON object', 400)
+        self.core.create_job(**job_spec(data, job_name))
+        return flask.make_response('', 201)
+
+    @exception_handler
+    def create_jobs(self):
+        self.core.create_jobs(load_manifest(flask.request.get_data()))
         return flask.make_response('', 201)
 
     @exception_handler
     def build_with_parameters(self):
         parameters = {k: v for k, v in flask.request.args.items()}
 
-        job_name = parameters.pop('job')
-        token = parameters.pop('token')
-        job = self.core.get_job(job_name)
+        job_name = parameters.pop('job', None)
+        token = parameters.pop('token', None)
+        job = self._job_for_token(job_name, token)
+        if job.multibranch:
+            return multibranch_response()
+        limited = self._rate_limited([(job, token, 1)])
+        if limited is not None:
+            return limited
 
-        if token == job.auth_token:
-            if job.create_build(**parameters):
-                return 'Scheduled.'
+        if check_token(job.auth_token, token):
+            return scheduled_response(self.core.queue.schedule(job, parameters))
         else:
             return flask.make_response('Authentication required', 403)
 
@@ -80,42 +196,539 @@ class Api(object):
     def build(self):
         job_name = flask.request.args.get('job')
         token = flask.request.args.get('token')
-        job = self.core.get_job(job_name)
+        job = self._job_for_token(job_name, token)
+        if job.multibranch:
+            return multibranch_response()
         if len(job.parameters) > 0:
             return flask.make_response('use buildWithParameters for this build', 400)
+        limited = self._rate_limited([(job, token, 1)])
+        if limited is not None:
+            return limited
 
-        if token == job.auth_token:
-            if job.create_build():
-                return 'Scheduled.'
+        if check_token(job.auth_token, token):
+            return scheduled_response(self.core.queue.schedule(job))
         else:
             return flask.make_response('Authentication required', 403)
 
+    def _job_for_token(self, job_name, token):
+        if job_name is None and token is not None:
+            return self.core.find_job_by_token(token)
+        return self.core.get_job(job_name)
+
+    def _rate_limited(self, triggers):
+        # Single triggers are counted before checking their token, so that wrong tokens are limited too
+        demands = collections.OrderedDict()
+        for job, token, count in triggers:
+            if self.limiter.rate is not None:
+                key = ('client', self.limiter.client_key(flask.request.remote_addr, token, job.name))
+                demands.setdefault(key, [self.limiter.rate, self.limiter.burst, 0])[2] += count
+            if job.rate_limit is not None:
+                burst = job.rate_burst if job.rate_burst is not None else default_burst(job.rate_limit)
+                demands.setdefault(('job', job.name), [job.rate_limit, burst, 0])[2] += count
+        if not demands:
+            return None
+        wait = self.limiter.take([(key, rate, burst, count) for key, (rate, burst, count) in demands.items()])
+        if wait == 0:
+            return None
+        response = flask.make_response('Too many builds triggered, retry later', 429)
+        response.headers['Retry-After'] = str(int(math.ceil(wait)))
+        return response
+
+    @exception_handler
+    def build_batch(self):
+        try:
+            data = json.loads(flask.request.get_data().decode('utf-8'))
+        except ValueError:
+            return flask.make_response('builds must be a JSON list', 400)
+        if isinstance(data, dict):
+            data = data.get('builds')
+        if not isinstance(data, list) or \
+                not all(isinstance(entry, dict) and string(entry.get('job')) for entry in data):
+            return flask.make_response('builds must be a list of {"job": ..., "token": ..., "parameters": ...}', 400)
+        for entry in data:
+            count = entry.get('count', 1)
+            if not isinstance(entry.get('parameters') or {}, dict) or isinstance(count, bool) or \
+                    not isinstance(count, int) or count < 1:
+                return flask.make_response('parameters must be a mapping and count a positive integer', 400)
+        if sum(entry.get('count', 1) for entry in data) > MAX_BATCH_BUILDS:
+            return flask.make_response('a batch triggers at most {0} builds'.format(MAX_BATCH_BUILDS), 400)
+
+        batches = collections.OrderedDict()
+        triggers = []
+        for entry in data:
+            job = self.core.get_job(entry['job'])
+            if not check_token(job.auth_token, entry.get('token')):
+                return flask.make_response('Authentication required', 403)
+            if job.multibranch:
+                return multibranch_response()
+            count = entry.get('count', 1)
+            batches.setdefault(job.name, (job, []))[1].extend([entry.get('parameters') or {}] * count)
+            triggers.append((job, entry.get('token'), count))
+        limited = self._rate_limited(triggers)
+        if limited is not None:
+            return limited
+
+        next_numbers = {}
+        for name, (job, parameters_list) in batches.items():
+            next_numbers[name] = job.create_builds(parameters_list)[0].number
+
+        builds = []
+        for entry in data:
+            count = entry.get('count', 1)
+            builds.append({'job': entry['job'], 'number': next_numbers[entry['job']], 'count': count})
+            next_numbers[entry['job']] += count
+
+        response = flask.make_response(json.dumps({'builds': builds}), 201)
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    @exception_handler
+    def create_view(self, view_name):
+        try:
+            data = json.loads(flask.request.data.decode('utf-8')) if flask.request.data else {}
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not string(data.get('include_regex')):
+            return flask.make_response('include_regex must be a string', 400)
+        self.core.create_view(view_name, data['include_regex'])
+        return flask.make_response('', 201)
+
+    @exception_handler
+    def get_root(self):
+        listing = self.core.get_view(ALL_VIEW)
+        return self._listing_response(listing, ('root',), (listing.version, self.core.views.version), {
+            '_class': 'hudson.model.Hudson',
+            'mode': 'NORMAL',
+            'nodeDescription': 'the master Jenkins node',
+            'nodeName': '',
+            'numExecutors': self.core.queue.executors or 0,
+            'primaryView': view_reference(ALL_VIEW),
+            'url': flask.request.url_root,
+            'useCrumbs': self.auth.require_crumb,
+            'useSecurity': bool(self.auth.users),
+            'views': [view_reference(name) for name in self.core.views.names()],
+        })
+
+    @exception_handler
+    def get_view(self, view_name):
+        listing = self.core.get_view(view_name)
+        return self._listing_response(listing, ('view', view_name), listing.version,
+                                      dict(view_reference(view_name), description=None, property=[]))
+
+    def _listing_response(self, listing, key, version, data):
+        # Jobs are serialized as they change, a listing only joins them
+        key += (flask.request.args.get('tree'), flask.request.url_root)
+        cached = self.cache.get(key, version)
+        if cached is None:
+            body = listing_body(data, listing.render(flask.request.url_root))
+            if 'tree' in flask.request.args:
+                body = json.dumps(apply_tree(json.loads(body.decode('utf-8')),
+                                             parse_tree(flask.request.args['tree']))).encode('utf-8')
+            cached = self.cache.put(key, version, body)
+        return json_response(cached)
+
     @exception_handler
     def get_job(self, job_name):
-        job = self.core.get_job(job_name)
-        response = flask.make_response(json.dumps(job_to_api_dict(job)))
+        try:
+            job = self.core.get_job(job_name)
+        except JobNotFound:
+            return self._get_folder(job_name)
+        if job.multibranch:
+            return self._get_folder(job_name, MULTIBRANCH_CLASS)
+        job.discard_old_builds()
+        version = job.version
+        key = (job.name, None, flask.request.args.get('tree'), flask.request.url_root)
+
+        cached = self.cache.get(key, version)
+        if cached is None:
+            tree = parse_tree(flask.request.args['tree']) if 'tree' in flask.request.args else DEFAULT_JOB_TREE
+            cached = self.cache.put(key, version, json.dumps(job_to_api_dict(job, tree)).encode('utf-8'))
+        return json_response(cached)
+
+    def _get_folder(self, name, folder_class=FOLDER_CLASS):
+        data = folder_to_api_dict(name, self.core.list_folder(name), folder_class)
+        if 'tree' in flask.request.args:
+            data = apply_tree(data, parse_tree(flask.request.args['tree']))
+        response = flask.make_response(json.dumps(data))
         response.headers['Content-Type'] = 'application/json'
         return response
 
     @exception_handler
     def get_build(self, job_name, build_number):
         job = self.core.get_job(job_name)
-        build = job.get_build(int(build_number))
-        response = flask.make_response(json.dumps(build_to_api_dict(build)))
+        if 'wait' in flask.request.args:
+            try:
+                timeout = parse_wait(flask.request.args['wait'])
+            except ValueError:
+                return flask.make_response('wait must be a number of seconds', 400)
+            if job.next_build_number <= int(build_number):
+                holding = flask.request.environ.get(HOLDING)
+                if holding is not None and not holding.enter():
+                    return _holding_response()
+                try:
+                    job.wait_for_build(int(build_number), timeout)
+                finally:
+                    if holding is not None:
+                        holding.leave()
+        job.discard_old_builds()
+        version = job.version
+        key = (job.name, int(build_number), flask.request.args.get('tree'), flask.request.url_root)
+
+        cached = self.cache.get(key, version)
+        if cached is None:
+            data = build_to_api_dict(job.get_build(int(build_number)))
+            if 'tree' in flask.request.args:
+                data = apply_tree(data, parse_tree(flask.request.args['tree']))
+            cached = self.cache.put(key, version, json.dumps(data).encode('utf-8'))
+        return json_response(cached)
+
+    @exception_handler
+    def get_job_events(self, job_name):
+        job = self.core.get_job(job_name)
+        try:
+            after = int(flask.request.headers.get('Last-Event-ID') or
+                        flask.request.args.get('since', self.core.events.last_id))
+        except ValueError:
+            return flask.make_response('since must be an event id', 400)
+        polled = flask.request.environ.get(EVENTS_POLLED, False)
+        holding = flask.request.environ.get(HOLDING)
+        if holding is not None and not holding.enter():
+            return _holding_response()
+
+        def stream():
+            position = after
+            written = time.time()
+            yield 'retry: 1000\n\n'
+            while True:
+                events = self.core.events.wait(job.name, position, 0 if polled else EVENTS_HEARTBEAT)
+                if not events:
+                    # Servers polling the stream wait up to a heartbeat between polls, a second early is close enough
+                    if polled and time.time() - written < EVENTS_HEARTBEAT - 1:
+                        yield ''
+                        continue
+                    yield ': keep-alive\n\n'
+                for event in events:
+                    position = event.id
+                    yield 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event.id, event.event, json.dumps({
+                        'job': event.job,
+                        'number': event.number,
+                        'building': event.building,
+                        'result': event.result,
+                    }))
+                written = time.time()
+
+        response = flask.Response(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        if holding is not None:
+            response.call_on_close(holding.leave)
+        return response
+
+    @exception_handler
+    def get_progressive_text(self, job_name, build_number):
+        build = self.core.get_job(job_name).get_build(int(build_number))
+        try:
+            start = int(flask.request.args.get('start', 0))
+            if start < 0:
+                raise ValueError(start)
+        except ValueError:
+            return flask.make_response('start must be a byte offset, 0 or more', 400)
+
+        data, size = build.read_console(start, PROGRESSIVE_TEXT_SIZE)
+        response = flask.make_response(data)
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        response.headers['X-Text-Size'] = str(min(start, size) + len(data))
+        if build.building or start + len(data) < size:
+            response.headers['X-More-Data'] = 'true'
+        return response
+
+    @exception_handler
+    def get_console_text(self, job_name, build_number):
+        build = self.core.get_job(job_name).get_build(int(build_number))
+
+        def stream():
+            position = 0
+            while True:
+                data, _ = build.read_console(position, CONSOLE_CHUNK_SIZE)
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+        return flask.Response(stream(), mimetype='text/plain')
+
+    def get_queue(self):
+        items = [queue_item_to_api_dict(item) for item in self.core.queue.get_pending_items()]
+        response = flask.make_response(json.dumps({'items': items}))
         response.headers['Content-Type'] = 'application/json'
         return response
 
+    @exception_handler
+    def get_queue_item(self, item_id):
+        item = self.core.queue.get_item(item_id)
+        response = flask.make_response(json.dumps(queue_item_to_api_dict(item)))
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    @exception_handler
+    def cancel_queue_item(self):
+        try:
+            item_id = int(flask.request.args.get('id'))
+        except (TypeError, ValueError):
+            return flask.make_response('id is required', 400)
+        self.core.queue.cancel(item_id)
+        return flask.make_response('', 204)
+
+    @exception_handler
+    def snapshot(self):
+        self.core.snapshot()
+        return flask.make_response('', 204)
+
+    @exception_handler
+    def restore_snapshot(self):
+        self.core.restore()
+        return flask.make_response('', 204)
 
-def job_to_api_dict(job):
-    return {'name': job.name,
-            'builds': [
-                {'number': j.number,
-                 'url': '{0}job/{1}/{2}/'.format(flask.request.url_root, job.name, j.number)}
-                for j in job.builds.values()]}
+    def get_crumb(self):
+        response = flask.make_response(json.dumps({
+            '_class': 'hudson.security.csrf.DefaultCrumbIssuer',
+            'crumb': self.auth.crumb(flask.request.remote_addr),
+            'crumbRequestField': CRUMB_FIELD,
+        }))
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    def get_faults(self):
+        response = flask.make_response(json.dumps({'rules': self.faults.to_list()}))
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    @exception_handler
+    def set_faults(self):
+        try:
+            data = json.loads(flask.request.data.decode('utf-8')) if flask.request.data else {}
+        except ValueError:
+            return flask.make_response('faults must be JSON', 400)
+        if not isinstance(data, (dict, list)):
+            return flask.make_response('faults must be an object with rules or a list of rules', 400)
+        self.faults.set_rules(data.get('rules') if isinstance(data, dict) else data)
+        return flask.make_response('', 204)
+
+    def clear_faults(self):
+        self.faults.set_rules([])
+        return flask.make_response('', 204)
+
+    def get_metrics(self):
+        response = flask.make_response(self.metrics.render())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return response
+
+    def get_profile(self):
+        response = flask.make_response(self.profiler.report(flask.request.args.get('endpoint')))
+        response.headers['Content-Type'] = 'text/plain'
+        return response
+
+
+def _holding_response():
+    response = flask.make_response('No thread is left for event streams and waits, retry later', 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def parse_wait(value):
+    timeout = float(value)
+    # A NaN deadline never passes
+    if math.isnan(timeout) or math.isinf(timeout):
+        raise ValueError(value)
+    return min(max(timeout, 0), MAX_WAIT)
+
+
+def scheduled_response(item):
+    response = flask.make_response('Scheduled.')
+    response.headers['Location'] = '{0}queue/item/{1}/'.format(flask.request.url_root, item.id)
+    return response
+
+
+def multibranch_response():
+    return flask.make_response('multibranch projects are built through their branches', 400)
+
+
+def json_response(cached):
+    if cached.etag in flask.request.if_none_match:
+        response = flask.make_response('', 304)
+    else:
+        response = flask.make_response(cached.body)
+        response.headers['Content-Type'] = 'application/json'
+    response.set_etag(cached.etag)
+    return response
+
+
+class JobPathConverter(BaseConverter):
+    # Jobs in folders are addressed as /job/<folder>/job/<name>, and named <folder>/<name>
+    regex = '[^/]+(?:/job/[^/]+)*'
+
+    def to_python(self, value):
+        return value.replace('/job/', '/')
+
+    def to_url(self, value):
+        return '/job/'.join(BaseConverter.to_url(self, part) for part in value.split('/'))
+
+
+class InvalidTree(ValueError):
+    pass
+
+
+TreeField = collections.namedtuple('TreeField', 'tree range')
+
+TREE_FIELD_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+TREE_RANGE = re.compile(r'^(\d*)(,(\d*))?$')
+
+
+def parse_tree(expression):
+    tree, position = _parse_tree_fields(expression, 0)
+    if position != len(expression):
+        raise InvalidTree(expression)
+    return tree
+
+
+def _parse_tree_fields(expression, position):
+    fields = collections.OrderedDict()
+    while True:
+        match = TREE_FIELD_NAME.match(expression, position)
+        if match is None:
+            raise InvalidTree(expression)
+        name, position = match.group(0), match.end()
+
+        subtree = None
+        if expression.startswith('[', position):
+            subtree, position = _parse_tree_fields(expression, position + 1)
+            if not expression.startswith(']', position):
+                raise InvalidTree(expression)
+            position += 1
+
+        item_range = None
+        if expression.startswith('{', position):
+            closing = expression.find('}', position)
+            if closing == -1:
+                raise InvalidTree(expression)
+            item_range = _parse_tree_range(expression[position + 1:closing])
+            position = closing + 1
+
+        fields[name] = TreeField(subtree, item_range)
+        if not expression.startswith(',', position):
+            return fields, position
+        position += 1
+
+
+def _parse_tree_range(text):
+    match = TREE_RANGE.match(text)
+    if match is None or not text:
+        raise InvalidTree(text)
+    start = int(match.group(1)) if match.group(1) else 0
+    if match.group(2) is None:
+        return start, start + 1
+    return start, int(match.group(3)) if match.group(3) else None
+
+
+def apply_tree(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [apply_tree(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {name: apply_field(value[name], field) for name, field in tree.items() if name in value}
+    return value
+
+
+def apply_field(value, field):
+    if field.range is not None and isinstance(value, list):
+        value = value[field.range[0]:field.range[1]]
+    return apply_tree(value, field.tree)
+
+
+DEFAULT_JOB_TREE = parse_tree('name,fullName,url,builds[number,url],lastBuild[number,url],nextBuildNumber')
+DEFAULT_BUILDS_RANGE = (0, 100)
+
+JOB_FIELDS = {
+    'name': lambda job: short_name(job.name),
+    'fullName': lambda job: job.name,
+    'url': lambda job: job_url(job),
+    'lastBuild': lambda job: build_reference(job, job.last_build),
+    'nextBuildNumber': lambda job: job.next_build_number,
+}
+
+
+def job_to_api_dict(job, tree=DEFAULT_JOB_TREE):
+    result = {}
+    for name, field in tree.items():
+        if name in ('builds', 'allBuilds'):
+            start, end = field.range or (DEFAULT_BUILDS_RANGE if name == 'builds' else (0, None))
+            result[name] = [apply_tree(build_reference(job, build), field.tree)
+                            for build in job.get_builds(start, end)]
+        elif name in JOB_FIELDS:
+            result[name] = apply_field(JOB_FIELDS[name](job), field)
+    return result
+
+
+def job_url(job):
+    return name_url(job.name)
+
+
+def name_url(name):
+    return '{0}job/{1}/'.format(flask.request.url_root, name.replace('/', '/job/'))
+
+
+def view_reference(name):
+    url = flask.request.url_root if name == ALL_VIEW else '{0}view/{1}/'.format(flask.request.url_root, name)
+    return {'_class': 'hudson.model.AllView' if name == ALL_VIEW else 'hudson.model.ListView',
+            'name': name, 'url': url}
+
+
+def short_name(name):
+    return name.rpartition('/')[2]
+
+
+def build_reference(job, build):
+    if build is None:
+        return None
+    return {'number': build.number,
+            'url': '{0}{1}/'.format(job_url(job), build.number)}
+
+
+def folder_to_api_dict(name, children, folder_class=FOLDER_CLASS):
+    return {
+        '_class': folder_class,
+        'name': short_name(name),
+        'fullName': name,
+        'url': name_url(name),
+        'jobs': [{'name': short_name(child), 'url': name_url(child)} for child in children],
+    }
+
+
+def queue_item_to_api_dict(item):
+    data = {
+        'id': item.id,
+        'url': 'queue/item/{0}/'.format(item.id),
+        'task': {'name': item.job.name,
+                 'url': job_url(item.job)},
+        'params': u''.join(u'\n{0}={1}'.format(key, value) for key, value in sorted(item.parameters.items())),
+        'inQueueSince': int(item.timestamp * 1000),
+        'blocked': False,
+        'buildable': item.executable is None and not item.cancelled,
+        'cancelled': item.cancelled,
+        'why': 'Waiting for next available executor' if item.executable is None and not item.cancelled else None,
+    }
+    if item.executable is not None:
+        data['executable'] = build_reference(item.job, item.executable)
+    return data
 
 
 def build_to_api_dict(build):
     return {
+        'number': build.number,
+        'timestamp': int(build.timestamp * 1000),
+        'building': build.building,
+        'result': build.result,
+        'duration': int(build.duration * 1000),
         'actions': [
             {'causes': [
                 {'shortDescription': ''}]
@@ -0,0 +1,86 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import hmac
+import os
+import threading
+
+HASH_PREFIX = 'sha256:'
+CRUMB_FIELD = 'Jenkins-Crumb'
+
+
+def hash_token(token):
+    return HASH_PREFIX + hashlib.sha256(_bytes(token)).hexdigest()
+
+
+def check_token(expected, presented):
+    if expected is None or presented is None:
+        return expected is presented
+    if expected.startswith(HASH_PREFIX):
+        presented = hash_token(presented)
+    return hmac.compare_digest(_bytes(expected), _bytes(presented))
+
+
+class TokenIndex(object):
+    def __init__(self):
+        self.names_by_token = {}
+        self.token_by_name = {}
+        self.lock = threading.Lock()
+
+    def set(self, name, token):
+        with self.lock:
+            previous = self.token_by_name.pop(name, None)
+            if previous is not None:
+                self.names_by_token[previous].discard(name)
+                if not self.names_by_token[previous]:
+                    del self.names_by_token[previous]
+            if token is not None:
+                self.token_by_name[name] = token
+                self.names_by_token.setdefault(token, set()).add(name)
+
+    def find(self, token):
+        # Stored tokens with the hash prefix are hashes, presenting them as is does not match
+        names = None if token.startswith(HASH_PREFIX) else self.names_by_token.get(token)
+        if names is None:
+            names = self.names_by_token.get(hash_token(token))
+        # A token shared by several jobs does not designate any of them
+        if names is not None and len(names) == 1:
+            return next(iter(names))
+        return None
+
+
+class Authenticator(object):
+    def __init__(self, users=None, require_crumb=False, secret=None):
+        self.users = users or {}
+        self.require_crumb = require_crumb
+        self.secret = secret or os.urandom(32)
+
+    def check_user(self, username, password):
+        expected = self.users.get(username)
+        if expected is None:
+            # Unknown users take as long as known ones
+            check_token(HASH_PREFIX, password or '')
+            return False
+        return check_token(expected, password)
+
+    def crumb(self, client):
+        return hmac.new(self.secret, _bytes(client or ''), hashlib.sha256).hexdigest()
+
+    def check_crumb(self, client, crumb):
+        return crumb is not None and hmac.compare_digest(_bytes(self.crumb(client)), _bytes(crumb))
+
+
+def _bytes(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
@@ -0,0 +1,325 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+import fake_jenkins.main
+import fake_jenkins.server
+from fake_jenkins.core import BuildParameter, Job
+
+JOB_NAME = 'bench'
+JOB_TOKEN = 'bench'
+SEEDED_BUILDS = 100
+MEMORY_PARAMETERS = 3
+
+ENDPOINTS = ('trigger', 'job', 'build')
+DEFAULT_MIX = 'trigger=1,job=4,build=4'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='fake_jenkins-bench')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--subprocess', action='store_true',
+                        help='run the server in a child process instead of in this process')
+    target.add_argument('--url', help='benchmark an already running server instead of starting one')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes of a subprocess server')
+    parser.add_argument('--threads', type=int, default=8, help='request handling threads of the server')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run for')
+    parser.add_argument('--mix', default=DEFAULT_MIX, type=parse_mix,
+                        help='relative weights of the {0} requests (default: {1})'.format(
+                            ', '.join(ENDPOINTS), DEFAULT_MIX))
+    parser.add_argument('--memory', type=int, metavar='BUILDS',
+                        help='instead of sending requests, measure the memory taken by this many builds of a job')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    parser.add_argument('--baseline', help='results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='fraction by which requests/sec may drop, or p99 latency grow, '
+                             'before being reported as a regression')
+
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not args.subprocess:
+        parser.error('--workers requires --subprocess')
+    if args.memory is not None and (args.memory < 1 or args.subprocess or args.url or args.baseline):
+        parser.error('--memory must be at least 1, and cannot be combined with --subprocess, --url or --baseline')
+    return args
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError('unknown request {0!r}, expected one of {1}'.format(
+                name, ', '.join(ENDPOINTS)))
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid weight for {0}: {1!r}'.format(name, weight))
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError('the mix needs at least one positive weight')
+    return mix
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.memory is not None:
+        results = measure_memory(args.memory)
+    else:
+        if args.url:
+            host, port = host_and_port(args.url)
+            stop = lambda: None
+        elif args.subprocess:
+            host, port, stop = start_subprocess(args.workers, args.threads)
+        else:
+            host, port, stop = start_in_process(args.threads)
+
+        try:
+            prepare(host, port)
+            results = run(host, port, args.mix, args.concurrency, args.duration)
+        finally:
+            stop()
+
+        results['server'] = 'url' if args.url else 'subprocess' if args.subprocess else 'in-process'
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            sys.stderr.write(regression + '\n')
+        return 1 if regressions else 0
+    return 0
+
+
+def start_in_process(threads):
+    app = fake_jenkins.main.create_app()
+    server = fake_jenkins.server.PooledWSGIServer('127.0.0.1', 0, app, threads=threads)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+        fake_jenkins.main.close_app(app)
+
+    return '127.0.0.1', server.server_port, stop
+
+
+def start_subprocess(workers, threads):
+    port = _free_port()
+    devnull = open(os.devnull, 'w')
+    # Request logging would slow the server down and clutter the results
+    process = subprocess.Popen([sys.executable, '-c', 'import fake_jenkins.main; fake_jenkins.main.main()',
+                                '127.0.0.1', str(port), '--workers', str(workers), '--threads', str(threads)],
+                               stdout=devnull, stderr=devnull)
+
+    def stop():
+        process.terminate()
+        process.wait()
+        devnull.close()
+
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except socket.error:
+            if time.time() > deadline or process.poll() is not None:
+                stop()
+                raise RuntimeError('the fake_jenkins subprocess did not start')
+            time.sleep(0.1)
+    return '127.0.0.1', port, stop
+
+
+def prepare(host, port):
+    connection = httplib.HTTPConnection(host, port)
+    for path, body in [
+        ('/job/{0}'.format(JOB_NAME), {'auth_token': JOB_TOKEN,
+                                       'parameters': [{'name': 'hello', 'default_value': 'world'}]}),
+        ('/buildByToken/batch', [{'job': JOB_NAME, 'token': JOB_TOKEN, 'count': SEEDED_BUILDS}]),
+    ]:
+        status = _request(connection, 'POST', path, json.dumps(body))
+        if status >= 400:
+            raise RuntimeError('could not prepare the benchmark, POST {0} answered {1}'.format(path, status))
+    connection.close()
+
+
+def run(host, port, mix, concurrency, duration):
+    names = [name for name in ENDPOINTS if mix.get(name, 0) > 0]
+    weights = [mix[name] for name in names]
+    samples = [[] for _ in range(concurrency)]
+    deadline = time.time() + duration
+
+    def client(samples):
+        connection = httplib.HTTPConnection(host, port)
+        while time.time() < deadline:
+            name = _choose(names, weights)
+            method, path = request_for(name)
+            start = time.time()
+            try:
+                ok = _request(connection, method, path) < 400
+            except (socket.error, httplib.HTTPException):
+                connection.close()
+                ok = False
+            samples.append((name, time.time() - start, ok))
+        connection.close()
+
+    started = time.time()
+    clients = [threading.Thread(target=client, args=(client_samples,)) for client_samples in samples]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.time() - started
+
+    latencies = dict((name, []) for name in names)
+    errors = dict((name, 0) for name in names)
+    for client_samples in samples:
+        for name, latency, ok in client_samples:
+            latencies[name].append(latency)
+            if not ok:
+                errors[name] += 1
+
+    endpoints = dict((name, summarize(latencies[name], errors[name], elapsed)) for name in names)
+    return {
+        'concurrency': concurrency,
+        'duration': elapsed,
+        'mix': mix,
+        'endpoints': endpoints,
+        'total': summarize(sum(latencies.values(), []), sum(errors.values()), elapsed),
+    }
+
+
+def measure_memory(builds):
+    # Builds of a job with a few parameters, one of them set on each build and the others left to their default
+    job = Job(JOB_NAME, auth_token=None,
+              parameters=[BuildParameter(name='p{0}'.format(i), default_value='default')
+                          for i in range(MEMORY_PARAMETERS)])
+    gc.collect()
+    before = resident_memory()
+    for number in range(builds):
+        job.create_build(p0=str(number))
+    gc.collect()
+    after = resident_memory()
+    return {
+        'builds': builds,
+        'parameters': MEMORY_PARAMETERS,
+        'python': '.'.join(str(part) for part in sys.version_info[:3]),
+        'bytes_per_build': (after - before) / float(builds),
+    }
+
+
+def resident_memory():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except IOError:
+        # Only the peak is known elsewhere, in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def request_for(name):
+    if name == 'trigger':
+        return 'GET', '/buildByToken/buildWithParameters?job={0}&token={1}&hello=bench'.format(JOB_NAME, JOB_TOKEN)
+    if name == 'job':
+        return 'GET', '/job/{0}/api/json'.format(JOB_NAME)
+    return 'GET', '/job/{0}/{1}/api/json'.format(JOB_NAME, random.randint(1, SEEDED_BUILDS))
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def percentile(ordered, percent):
+    if not ordered:
+        return 0
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def compare(baseline, results, tolerance):
+    regressions = []
+    for name, current in sorted(results['endpoints'].items()):
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append('{0}: {1:.0f} requests/sec, down from {2:.0f}'.format(
+                name, current['rps'], previous['rps']))
+        if current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append('{0}: p99 of {1:.2f} ms, up from {2:.2f} ms'.format(
+                name, current['p99_ms'], previous['p99_ms']))
+    return regressions
+
+
+def _request(connection, method, path, body=None):
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def _choose(names, weights):
+    point = random.uniform(0, sum(weights))
+    for name, weight in zip(names, weights):
+        point -= weight
+        if point <= 0:
+            return name
+    return names[-1]
+
+
+def host_and_port(url):
+    address = url.split('://', 1)[-1].split('/', 1)[0]
+    host, _, port = address.partition(':')
+    return host, int(port or 80)
+
+
+def _free_port():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
@@ -0,0 +1,123 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+SKIPPED_HEADERS = ('HTTP_HOST', 'HTTP_CONNECTION', 'HTTP_KEEP_ALIVE', 'HTTP_CONTENT_LENGTH')
+
+
+class Capture(object):
+    def __init__(self, app, path, flush_interval=0.1):
+        self.app = app
+        self.path = path
+        self.flush_interval = flush_interval
+        self.started = time.time()
+        self.buffer = []
+        self.lock = threading.Lock()
+        # Workers are forked after the application is created, each needs its own flushing thread
+        self.pid = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def __call__(self, environ, start_response):
+        length = environ.get('CONTENT_LENGTH')
+        body = environ['wsgi.input'].read(int(length)) if length else b''
+        environ['wsgi.input'] = io.BytesIO(body)
+        statuses = []
+
+        def capturing_start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        start = time.time()
+        result = self.app(environ, capturing_start_response)
+        duration = time.time() - start
+        self.record(environ, body, int(statuses[-1].split(' ', 1)[0]), start, duration)
+        return result
+
+    def record(self, environ, body, status, start, duration):
+        line = json.dumps({
+            't': round(start - self.started, 6),
+            'method': environ['REQUEST_METHOD'],
+            'path': _quote(environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')),
+            'query': environ.get('QUERY_STRING', ''),
+            'headers': request_headers(environ),
+            'body': body.decode('latin-1'),
+            'status': status,
+            'duration': round(duration, 6),
+        }, separators=(',', ':'), sort_keys=True).encode('utf-8') + b'\n'
+        with self.lock:
+            self.buffer.append(line)
+            if self.pid != os.getpid() and not self.stopped.is_set():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def flush(self):
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+        if lines:
+            # One unbuffered append per flush, so that the lines of several workers do not interleave
+            with io.open(self.path, 'ab', buffering=0) as f:
+                f.write(b''.join(lines))
+
+    def close(self):
+        self.stopped.set()
+        if self.pid == os.getpid() and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+
+    def _run(self):
+        pid = os.getpid()
+        while self.pid == pid and not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception('Could not write the capture')
+
+
+def request_headers(environ):
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_') and key not in SKIPPED_HEADERS:
+            headers[key[5:].replace('_', '-').title()] = value
+    if environ.get('CONTENT_TYPE'):
+        headers['Content-Type'] = environ['CONTENT_TYPE']
+    return headers
+
+
+def read_capture(path):
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short when the server stopped
+                return
+
+
+def _quote(path):
+    # WSGI paths are unquoted, as latin-1 text on Python 3
+    return quote(path if isinstance(path, bytes) else path.encode('latin-1'), safe='/')
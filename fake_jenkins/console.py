@@ -0,0 +1,77 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import mmap
+import tempfile
+import threading
+
+SPILL_SIZE = 1024 * 1024
+
+
+class ConsoleLog(object):
+    def __init__(self, spill_size=SPILL_SIZE):
+        self.spill_size = spill_size
+        self.size = 0
+        self.chunks = []
+        self.offsets = []
+        self.file = None
+        self.map = None
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        if not data:
+            return
+        with self.lock:
+            if self.file is None and self.size + len(data) > self.spill_size:
+                self._spill()
+            if self.file is None:
+                self.offsets.append(self.size)
+                self.chunks.append(data)
+            else:
+                self.file.write(data)
+                self.file.flush()
+            self.size += len(data)
+
+    def read(self, start=0, max_size=None):
+        with self.lock:
+            end = self.size if max_size is None else min(self.size, start + max_size)
+            if start >= end:
+                return b''
+            if self.file is not None:
+                return self._mapped()[start:end]
+
+            index = bisect.bisect_right(self.offsets, start) - 1
+            data = []
+            position = self.offsets[index]
+            for chunk in self.chunks[index:]:
+                if position >= end:
+                    break
+                data.append(chunk[max(start - position, 0):end - position])
+                position += len(chunk)
+            return b''.join(data)
+
+    def _spill(self):
+        self.file = tempfile.TemporaryFile(prefix='fake_jenkins-console-')
+        for chunk in self.chunks:
+            self.file.write(chunk)
+        self.chunks = []
+        self.offsets = []
+
+    def _mapped(self):
+        if self.map is None or len(self.map) < self.size:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map
@@ -12,58 +12,658 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+from fake_jenkins.auth import TokenIndex
+from fake_jenkins.console import ConsoleLog
+from fake_jenkins.validation import string
+from fake_jenkins.views import ALL_VIEW, Views
+
+
 class Core(object):
-    def __init__(self, jobs=None):
+    def __init__(self, jobs=None, scheduler=None, executors=None, views=None):
         self.jobs = jobs or {}
+        self.lock = threading.Lock()
+        self.scheduler = scheduler
+        self.listeners = []
+        self.tokens = TokenIndex()
+        self.tree = JobTree()
+        self.views = Views(check_views(views))
+        self.changes = ChangeLog()
+        for job in self.jobs.values():
+            job.scheduler = job.scheduler or scheduler
+            job.listeners = self.listeners
+            job.changes = self.changes
+            self._index_job(job)
+        self.queue = BuildQueue(executors=executors)
+        self.events = JobEvents()
+        self.listeners.append(self.queue.on_build_event)
+        self.listeners.append(self.events.on_event)
+        self.listeners.append(self.views.on_event)
+
+    def create_job(self, name, auth_token=None, **kwargs):
+        self.create_jobs([dict(kwargs, name=name, auth_token=auth_token)])
+
+    def create_jobs(self, specs):
+        jobs = collections.OrderedDict()
+        for spec in specs:
+            job = Job(**dict({'auth_token': None, 'scheduler': self.scheduler, 'listeners': self.listeners,
+                              'changes': self.changes}, **spec))
+            jobs[job.name] = job
+        with self.lock:
+            for job in jobs.values():
+                self._check_job_name(job, jobs)
+            self._add_jobs(jobs)
+
+    def _add_jobs(self, jobs):
+        # Listeners hear about the jobs before any of their builds can be triggered
+        for job in jobs.values():
+            for listener in self.listeners:
+                listener('job_created', job, None)
+            self.changes.save_job(job.name, self.jobs)
+        self.jobs.update(jobs)
+        for job in jobs.values():
+            self._index_job(job)
+
+    def _index_job(self, job):
+        self.tokens.set(job.name, job.auth_token)
+        self.tree.add(job.name)
+        self.views.add_job(job)
 
-    def create_job(self, name, auth_token=None, parameters=None):
-        self.jobs[name] = Job(name=name, auth_token=auth_token, parameters=parameters)
+    def _unindex_job(self, name):
+        self.tokens.set(name, None)
+        self.tree.remove(name, self.jobs.__contains__)
+        self.views.remove_job(name, self._exists)
+
+    def _exists(self, name):
+        return name in self.jobs or self.tree.list(name) is not None
+
+    def snapshot(self):
+        with self.lock:
+            self.changes.start()
+
+    def restore(self):
+        with self.lock:
+            if not self.changes.active:
+                raise SnapshotNotFound()
+            jobs, builds = self.changes.take()
+            rolled_back = []
+            for job, changes in builds.items():
+                with job.lock:
+                    rolled_back.extend(job._restore_builds(changes))
+            for name, previous in jobs.items():
+                if previous is None:
+                    del self.jobs[name]
+                    self._unindex_job(name)
+                else:
+                    self.jobs[name] = previous
+            for job in set(builds) | set(job for job in jobs.values() if job is not None):
+                if self.jobs.get(job.name) is job:
+                    self._index_job(job)
+            self.queue.clear(rolled_back)
+
+    def _check_job_name(self, job, new_jobs):
+        parts = job.name.split('/')
+        if not all(parts):
+            raise InvalidJobName('{0!r} is not a valid job name'.format(job.name))
+        for depth in range(1, len(parts)):
+            folder = '/'.join(parts[:depth])
+            existing = new_jobs.get(folder) or self.jobs.get(folder)
+            # Only the direct parent of a job may be a job, the multibranch project of a branch
+            if existing is not None and not (existing.multibranch and depth == len(parts) - 1):
+                raise InvalidJobName('{0} is a job, not a folder'.format(folder))
+        if not job.multibranch and self._folder_children(job.name):
+            raise InvalidJobName('{0} is a folder, not a job'.format(job.name))
 
     def get_job(self, name):
         try:
             return self.jobs[name]
         except KeyError:
+            return self._create_branch(name)
+
+    def _create_branch(self, name):
+        # Branches of a multibranch project exist as soon as they are asked for
+        if not string(name):
+            raise JobNotFound(name)
+        project_name, _, branch = name.rpartition('/')
+        project = self.jobs.get(project_name) if project_name else None
+        if project is None or not project.multibranch:
             raise JobNotFound(name)
+        with self.lock:
+            if name not in self.jobs:
+                self._add_jobs({name: project.copy(name=name, multibranch=False)})
+        return self.jobs[name]
+
+    def list_folder(self, name=''):
+        children = self._folder_children(name)
+        if children is None:
+            job = self.jobs.get(name)
+            if job is None or not job.multibranch:
+                raise JobNotFound(name)
+            return []
+        return children
+
+    def _folder_children(self, name):
+        return self.tree.list(name)
+
+    def find_jobs(self, prefix):
+        return sorted(name for name in self.tree.find(prefix) if name in self.jobs)
+
+    def create_view(self, name, include_regex):
+        check_views({name: include_regex})
+        with self.lock:
+            self.views.create(name, include_regex, self.jobs.values())
+
+    def get_view(self, name):
+        listing = self.views.get(name)
+        if listing is None:
+            raise ViewNotFound(name)
+        return listing
+
+    def find_job_by_token(self, token):
+        name = self.tokens.find(token)
+        if name is None:
+            raise JobNotFound(token)
+        return self.get_job(name)
+
+
+def check_views(views):
+    for name, include_regex in (views or {}).items():
+        if name == ALL_VIEW:
+            raise InvalidView('the {0} view cannot be redefined'.format(ALL_VIEW))
+        try:
+            re.compile(include_regex)
+        except (re.error, TypeError) as e:
+            raise InvalidView('view {0}: invalid include_regex {1!r}: {2}'.format(name, include_regex, e))
+    return views
 
 
 class Job(object):
-    def __init__(self, name, auth_token, parameters=None):
+    def __init__(self, name, auth_token, parameters=None, max_builds=None, max_build_age=None,
+                 duration=0, outcomes=None, priority=0, console=None, console_rate=None,
+                 scheduler=None, listeners=None, multibranch=False, changes=None, rate_limit=None, rate_burst=None):
         self.name = name
         self.auth_token = auth_token
         if parameters is None:
             parameters = []
         self.parameters = parameters
+        self.max_builds = max_builds
+        self.max_build_age = max_build_age
+        self.duration = duration
+        self.outcomes = outcomes
+        self.priority = priority
+        self.console = console
+        self.console_rate = console_rate
+        self.multibranch = multibranch
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.scheduler = scheduler
+        self.listeners = [] if listeners is None else listeners
+        self.changes = changes
         self.next_build_number = 1
-        self.builds = {}
+        self.builds = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self._touch()
+
+    def copy(self, **kwargs):
+        options = dict(name=self.name, auth_token=self.auth_token, parameters=list(self.parameters),
+                       max_builds=self.max_builds, max_build_age=self.max_build_age, duration=self.duration,
+                       outcomes=self.outcomes, priority=self.priority, console=self.console,
+                       console_rate=self.console_rate, multibranch=self.multibranch, rate_limit=self.rate_limit,
+                       rate_burst=self.rate_burst, scheduler=self.scheduler, listeners=self.listeners,
+                       changes=self.changes)
+        options.update(kwargs)
+        return Job(**options)
 
     def create_build(self, **kwargs):
-        build_id = self.next_build_number
+        return self.create_builds([kwargs])[0]
+
+    def create_builds(self, parameters_list):
+        names = intern_parameter_names(tuple(parameter.name for parameter in self.parameters))
+        values = [tuple(parameters.get(parameter.name, parameter.default_value) for parameter in self.parameters)
+                  for parameters in parameters_list]
+        durations = [self._draw_duration() for _ in values]
+
+        with self.lock:
+            self._save_builds()
+            # The whole batch gets a contiguous block of build numbers
+            first_number = self.next_build_number
+            new_builds = []
+            for i, (build_values, duration) in enumerate(zip(values, durations)):
+                # Builds without anything to simulate are complete from the start
+                if self.console is None and (self.scheduler is None or duration <= 0):
+                    new_build = Build(first_number + i, parameters=build_values, parameter_names=names,
+                                      result=self._draw_result(), duration=duration)
+                else:
+                    new_build = Build(first_number + i, parameters=build_values, parameter_names=names,
+                                      building=True, result=None)
+                self.builds[new_build.number] = new_build
+                new_builds.append(new_build)
+            self.next_build_number = first_number + len(new_builds)
+            if new_builds:
+                self._discard_old_builds(new_builds[-1].timestamp)
+            self._touch()
+            self._wake_waiters()
+
+        for new_build, duration in zip(new_builds, durations):
+            self._notify('build_created', new_build)
+            if new_build.building:
+                self._start_build(new_build, duration)
+            else:
+                self._notify('build_completed', new_build)
+        return new_builds
+
+    def wait_for_build(self, number, timeout):
+        deadline = time.time() + timeout
+        with self.changed:
+            while self.next_build_number <= number:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
 
-        params = {}
-        for parameter in self.parameters:
-            params[parameter.name] = kwargs.get(parameter.name, parameter.default_value)
+    def _wake_waiters(self):
+        self.changed.notify_all()
 
-        new_build = Build(build_id, parameters=params)
-        self.builds[build_id] = new_build
-        self.next_build_number += 1
+    def _start_build(self, new_build, duration):
+        lines = None
+        if self.console is not None:
+            new_build.console = ConsoleLog()
+            new_build.console.write(CONSOLE_HEADER)
+            lines = iter(self.console(new_build) if callable(self.console) else self.console)
 
-        return new_build
+        if self.scheduler is None or duration <= 0:
+            self._complete_build(new_build, duration, lines)
+        else:
+            self.scheduler.call_later(duration, self._complete_build, new_build, duration, lines)
+            if lines is not None and self.console_rate:
+                self.scheduler.call_later(1, self._write_console, new_build, lines)
+
+    def _write_console(self, build, lines):
+        if build.building:
+            _write_lines(build.console, itertools.islice(lines, self.console_rate))
+            self.scheduler.call_later(1, self._write_console, build, lines)
+
+    def _complete_build(self, build, duration, lines=None, result=None):
+        if lines is not None:
+            _write_lines(build.console, lines)
+        with self.lock:
+            build.building = False
+            build.duration = duration
+            build.result = result or self._draw_result()
+            stored = self._save_completed_build(build)
+        if build.console is not None:
+            build.console.write(CONSOLE_FOOTER.format(build.result).encode('utf-8'))
+        if stored:
+            self._notify('build_completed', build)
+
+    def _save_completed_build(self, build):
+        if self.builds.get(build.number) is build:
+            self._touch()
+            return True
+        return self._discarded(build)
+
+    def _discarded(self, build):
+        # Discarded builds still give their executor back, unlike those rolled back or replaced by a build of the
+        # same number, which are gone along with their executor
+        return build.number not in self.builds and build.number < self.next_build_number
+
+    def _notify(self, event, build):
+        for listener in self.listeners:
+            listener(event, self, build)
+
+    def _draw_duration(self):
+        if isinstance(self.duration, (list, tuple)):
+            return random.uniform(*self.duration)
+        return self.duration
+
+    def _draw_result(self):
+        if not self.outcomes:
+            return 'SUCCESS'
+        threshold = random.uniform(0, sum(self.outcomes.values()))
+        for result, weight in sorted(self.outcomes.items()):
+            threshold -= weight
+            if threshold <= 0:
+                break
+        return result
 
     def get_build(self, build_number):
         try:
-            return self.builds[build_number]
+            build = self.builds[build_number]
         except KeyError:
             raise BuildNotFound()
+        if self.max_build_age is not None and build.timestamp < time.time() - self.max_build_age:
+            raise BuildNotFound()
+        return build
+
+    def get_builds(self, start=0, end=None):
+        with self.lock:
+            self._discard_old_builds(time.time())
+            return [self.builds[number] for number in itertools.islice(reversed(self.builds), start, end)]
+
+    def discard_old_builds(self):
+        if self.max_build_age is not None:
+            with self.lock:
+                self._discard_old_builds(time.time())
+
+    def _discard_old_builds(self, now):
+        count = len(self.builds)
+        if self.max_builds is not None:
+            while len(self.builds) > self.max_builds:
+                self._discard_oldest_build()
+        if self.max_build_age is not None:
+            while self.builds and self.builds[next(iter(self.builds))].timestamp < now - self.max_build_age:
+                self._discard_oldest_build()
+        if len(self.builds) != count:
+            self._touch()
+
+    def _discard_oldest_build(self):
+        _, build = self.builds.popitem(last=False)
+        changes = self._save_builds()
+        if changes is not None:
+            changes.discarded.append(build)
+
+    def _save_builds(self):
+        if self.changes is not None:
+            return self.changes.save_builds(self)
+
+    def _restore_builds(self, changes):
+        rolled_back = []
+        while self.builds and next(reversed(self.builds)) >= changes.next_build_number:
+            rolled_back.append(self.builds.popitem()[1])
+        if changes.discarded:
+            # Discarded builds are older than the ones left
+            builds = [build for build in changes.discarded if build.number < changes.next_build_number]
+            builds.extend(self.builds.values())
+            self.builds = collections.OrderedDict((build.number, build) for build in builds)
+        self.next_build_number = changes.next_build_number
+        self._touch()
+        return rolled_back
+
+    def _touch(self):
+        self.version = next(_versions)
+
+    @property
+    def last_build(self):
+        try:
+            return self.get_build(self.next_build_number - 1)
+        except BuildNotFound:
+            return None
+
+
+_versions = itertools.count(1)
+
+CONSOLE_HEADER = b'Started by remote host\n'
+CONSOLE_FOOTER = u'Finished: {0}\n'
+
+
+def _write_lines(console, lines):
+    console.write(b''.join(line.encode('utf-8') + b'\n' for line in lines))
+
 
 class Build(object):
-    def __init__(self, number, parameters=None):
+    __slots__ = ('number', 'timestamp', 'parameter_names', 'parameter_values', 'building', 'result', 'duration',
+                 'console')
+
+    def __init__(self, number, parameters=None, timestamp=None, parameter_names=None,
+                 building=False, result='SUCCESS', duration=0, console=None):
         if parameters is None:
             parameters = {}
+        if parameter_names is None:
+            parameter_names = intern_parameter_names(tuple(parameters))
+            parameters = tuple(parameters[name] for name in parameter_names)
         self.number = number
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.parameter_names = parameter_names
+        self.parameter_values = parameters
+        self.building = building
+        self.result = result
+        self.duration = duration
+        self.console = console
+
+    @property
+    def parameters(self):
+        return dict(zip(self.parameter_names, self.parameter_values))
+
+    def read_console(self, start=0, max_size=None):
+        if self.console is not None:
+            return self.console.read(start, max_size), self.console.size
+
+        text = CONSOLE_HEADER
+        if not self.building:
+            text += CONSOLE_FOOTER.format(self.result).encode('utf-8')
+        end = len(text) if max_size is None else start + max_size
+        return text[start:end], len(text)
+
+
+_parameter_names = {}
+
+
+def intern_parameter_names(names):
+    # Builds of a job share a single tuple of parameter names
+    return _parameter_names.setdefault(names, names)
+
+
+class JobTree(object):
+    def __init__(self):
+        # Full names of the children of each folder, by their name in the folder; '' is the root
+        self.children = {'': {}}
+        self.lock = threading.Lock()
+
+    def add(self, name):
+        with self.lock:
+            while name:
+                folder, _, child = name.rpartition('/')
+                known = folder in self.children
+                self.children.setdefault(folder, {})[child] = name
+                if known:
+                    return
+                name = folder
+
+    def remove(self, name, is_job):
+        with self.lock:
+            while name:
+                folder, _, child = name.rpartition('/')
+                children = self.children.get(folder)
+                if children is None:
+                    return
+                children.pop(child, None)
+                # Folders go away with their last job, unless they are jobs themselves
+                if children or not folder or is_job(folder):
+                    return
+                del self.children[folder]
+                name = folder
+
+    def list(self, folder):
+        with self.lock:
+            children = self.children.get(folder)
+            return None if children is None else sorted(children.values())
+
+    def find(self, prefix):
+        folder, _, start = prefix.rpartition('/')
+        with self.lock:
+            pending = [name for child, name in self.children.get(folder, {}).items() if child.startswith(start)]
+            found = []
+            while pending:
+                name = pending.pop()
+                found.append(name)
+                pending.extend(self.children.get(name, {}).values())
+        return found
+
+
+class ChangeLog(object):
+    def __init__(self):
+        self.active = False
+        # Jobs replaced since the snapshot by name, None for new names, and the builds changes of each job
+        self.jobs = {}
+        self.builds = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            self.active = True
+            self.jobs = {}
+            self.builds = {}
+
+    def take(self):
+        with self.lock:
+            jobs, builds = self.jobs, self.builds
+            self.jobs, self.builds = {}, {}
+        return jobs, builds
+
+    def save_job(self, name, jobs):
+        if self.active:
+            with self.lock:
+                if name not in self.jobs:
+                    self.jobs[name] = jobs.get(name)
+
+    def save_builds(self, job):
+        # Called under the job's lock, before its builds change
+        if self.active:
+            with self.lock:
+                changes = self.builds.get(job)
+                if changes is None:
+                    changes = self.builds[job] = BuildChanges(job.next_build_number, [])
+            return changes
+
+
+BuildChanges = collections.namedtuple('BuildChanges', 'next_build_number discarded')
+
+
+class JobEvents(object):
+    def __init__(self, size=1000):
+        self.size = size
+        self.events = {}
+        self.last_id = 0
+        self.condition = threading.Condition()
+
+    def on_event(self, event, job, build):
+        with self.condition:
+            self.last_id += 1
+            if job.name not in self.events:
+                self.events[job.name] = collections.deque(maxlen=self.size)
+            # Builds change after the fact, the event keeps their state at that time
+            self.events[job.name].append(JobEvent(self.last_id, event, job.name,
+                                                  build.number if build else None,
+                                                  build.building if build else None,
+                                                  build.result if build else None))
+            self.condition.notify_all()
+
+    def wait(self, job_name, after, timeout):
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                events = [event for event in self.events.get(job_name, ()) if event.id > after]
+                remaining = deadline - time.time()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+
+
+JobEvent = collections.namedtuple('JobEvent', 'id event job number building result')
+
+
+class BuildQueue(object):
+    def __init__(self, executors=None, max_left_items=10000):
+        self.executors = executors
+        self.max_left_items = max_left_items
+        self.pending = []
+        self.items = {}
+        self.left_items = collections.OrderedDict()
+        # Builds rather than build numbers, which a re-created job starts over
+        self.running = set()
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+
+    def schedule(self, job, parameters=None, priority=None):
+        with self.lock:
+            item = QueueItem(next(self.ids), job, parameters or {},
+                             job.priority if priority is None else priority)
+            self.items[item.id] = item
+            heapq.heappush(self.pending, (item.priority, item.id, item))
+            self._dispatch()
+        return item
+
+    def cancel(self, item_id):
+        with self.lock:
+            item = self.get_item(item_id)
+            if item.executable is None and not item.cancelled:
+                item.cancelled = True
+                self._leave(item)
+
+    def get_item(self, item_id):
+        with self.lock:
+            try:
+                return self.items[item_id]
+            except KeyError:
+                try:
+                    return self.left_items[item_id]
+                except KeyError:
+                    raise QueueItemNotFound(item_id)
+
+    def clear(self, rolled_back=()):
+        with self.lock:
+            self.pending = []
+            self.items.clear()
+            self.left_items.clear()
+            # Builds left running keep their executor until they complete, those rolled back never will
+            self.running.difference_update(rolled_back)
+
+    def get_pending_items(self):
+        with self.lock:
+            return sorted(self.items.values(), key=lambda item: (item.priority, item.id))
+
+    def count_pending_items(self):
+        return len(self.items)
+
+    def on_build_event(self, event, job, build):
+        # Builds may complete before _dispatch has added them to the running ones, which it does under the lock
+        if event == 'build_completed':
+            with self.lock:
+                if build in self.running:
+                    self.running.remove(build)
+                    self._dispatch()
+
+    def _dispatch(self):
+        while self.pending and (self.executors is None or len(self.running) < self.executors):
+            _, _, item = heapq.heappop(self.pending)
+            if item.cancelled:
+                continue
+            build = item.job.create_build(**item.parameters)
+            item.executable = build
+            if self.executors is not None and build.building:
+                self.running.add(build)
+            self._leave(item)
+
+    def _leave(self, item):
+        self.items.pop(item.id, None)
+        self.left_items[item.id] = item
+        while len(self.left_items) > self.max_left_items:
+            self.left_items.popitem(last=False)
+
+
+class QueueItem(object):
+    def __init__(self, id, job, parameters, priority):
+        self.id = id
+        self.job = job
         self.parameters = parameters
+        self.priority = priority
+        self.timestamp = time.time()
+        self.executable = None
+        self.cancelled = False
 
 
 class BuildParameter(object):
+    __slots__ = ('name', 'default_value')
+
     def __init__(self, name, default_value):
         self.name = name
         self.default_value = default_value
@@ -81,5 +681,29 @@ class JobNotFound(MissingResource):
     pass
 
 
+class InvalidJobName(FakeJenkinsError):
+    pass
+
+
+class ViewNotFound(MissingResource):
+    pass
+
+
+class InvalidView(FakeJenkinsError):
+    pass
+
+
 class BuildNotFound(MissingResource):
     pass
+
+
+class QueueItemNotFound(MissingResource):
+    pass
+
+
+class SnapshotNotFound(MissingResource):
+    pass
+
+
+class UnsupportedOperation(FakeJenkinsError):
+    pass
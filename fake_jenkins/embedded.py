@@ -0,0 +1,77 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import fake_jenkins.main
+import fake_jenkins.server
+
+
+class FakeJenkins(object):
+    def __init__(self, config=None, host='127.0.0.1', port=0, threads=8, state_dir=None):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.state_dir = state_dir
+        self.app = None
+        self.core = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/'.format(self.host, self.port)
+
+    def start(self, timeout=10):
+        self.app = fake_jenkins.main.create_app(state_dir=self.state_dir, config=self.config)
+        self.core = self.app.extensions['fake_jenkins']
+        # Binding to port 0 gets an ephemeral port, the socket listens from here on
+        self.server = fake_jenkins.server.PooledWSGIServer(
+            self.host, self.port, self.app, threads=self.threads,
+            max_in_flight=self.app.config.get('FAKE_JENKINS_MAX_IN_FLIGHT'))
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            self.stop()
+            raise RuntimeError('fake_jenkins did not start within {0} seconds'.format(timeout))
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            if self.ready.is_set():
+                self.server.shutdown()
+                self.thread.join()
+            self.server.server_close()
+            self.server = None
+        if self.app is not None:
+            fake_jenkins.main.close_app(self.app)
+            self.app = None
+
+    def client(self):
+        # Requests go straight to the WSGI application, without sockets
+        return self.app.test_client()
+
+    def _serve(self):
+        self.ready.set()
+        self.server.serve_forever()
@@ -0,0 +1,186 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import socket
+import time
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import HTTP_STATUS_CODES
+
+from fake_jenkins.core import FakeJenkinsError
+from fake_jenkins.limits import Admission
+from fake_jenkins.validation import duration, non_negative_number, positive_integer, strings
+
+# The endpoints controlling faults are never faulty themselves
+ADMIN_ENDPOINTS = frozenset(['get_faults', 'set_faults', 'clear_faults'])
+APPLIED = 'fake_jenkins.faults'
+
+try:
+    _ConnectionError = ConnectionAbortedError
+except NameError:
+    _ConnectionError = socket.error
+
+
+class Faults(object):
+    def __init__(self, rules=None):
+        self.rules = parse_rules([] if rules is None else rules)
+
+    def set_rules(self, data):
+        self.rules = parse_rules(data)
+
+    def to_list(self):
+        return [rule.data for rule in self.rules]
+
+    def decide(self, endpoint, method):
+        if endpoint in ADMIN_ENDPOINTS:
+            return None
+        for rule in self.rules:
+            if rule.matches(endpoint, method):
+                return rule.draw()
+        return None
+
+
+class Rule(object):
+    def __init__(self, data):
+        self.data = data
+        self.endpoints = data.get('endpoints')
+        self.methods = data.get('methods')
+        self.latency = data.get('latency', 0)
+        self.drop_rate = data.get('drop_rate', 0)
+        self.throttle_rate = data.get('throttle_rate', 0)
+        self.retry_after = data.get('retry_after', 1)
+        self.error_rate = data.get('error_rate', 0)
+        self.error_status = data.get('error_status', 503)
+
+    def matches(self, endpoint, method):
+        return (self.endpoints is None or endpoint in self.endpoints) and \
+            (self.methods is None or method in self.methods)
+
+    def draw(self):
+        if isinstance(self.latency, (list, tuple)):
+            delay = random.uniform(*self.latency)
+        else:
+            delay = self.latency
+        point = random.random()
+        if point < self.drop_rate:
+            return Fault(delay, drop=True)
+        point -= self.drop_rate
+        if point < self.throttle_rate:
+            return Fault(delay, status=429, retry_after=self.retry_after)
+        point -= self.throttle_rate
+        if point < self.error_rate:
+            return Fault(delay, status=self.error_status)
+        return Fault(delay) if delay else None
+
+
+class Fault(object):
+    def __init__(self, delay=0, status=None, retry_after=None, drop=False):
+        self.delay = delay
+        self.status = status
+        self.retry_after = retry_after
+        self.drop = drop
+
+    def response(self):
+        reason = HTTP_STATUS_CODES.get(self.status, '')
+        headers = [('Content-Type', 'text/plain')]
+        if self.retry_after is not None:
+            headers.append(('Retry-After', str(self.retry_after)))
+        return '{0} {1}'.format(self.status, reason), headers, reason.encode('utf-8')
+
+
+class FaultInjection(object):
+    def __init__(self, app, faults, url_map, max_delayed=None):
+        self.app = app
+        self.faults = faults
+        self.url_map = url_map
+        # Delays sleep on the request's thread. When asked for, only a few may, so that the others keep answering.
+        self.delayed = Admission(max_delayed)
+
+    def __call__(self, environ, start_response):
+        # The asyncio frontend applies faults itself, without holding a thread during delays
+        if self.faults.rules and environ.get(APPLIED) is not self.faults:
+            fault = self.faults.decide(endpoint_for(self.url_map, environ), environ['REQUEST_METHOD'])
+            if fault is not None and fault.delay:
+                if not self.delayed.enter():
+                    fault = Fault(status=503, retry_after=1)
+                else:
+                    try:
+                        time.sleep(fault.delay)
+                    finally:
+                        self.delayed.leave()
+            if fault is not None:
+                if fault.drop:
+                    raise ConnectionDropped('connection dropped by an injected fault')
+                if fault.status is not None:
+                    status, headers, body = fault.response()
+                    start_response(status, headers + [('Content-Length', str(len(body)))])
+                    return [body]
+        return self.app(environ, start_response)
+
+
+def endpoint_for(url_map, environ):
+    try:
+        return url_map.bind_to_environ(environ).match()[0]
+    except HTTPException:
+        return None
+
+
+def parse_rules(data):
+    if not isinstance(data, list):
+        raise InvalidFaults('faults must be a list of rules')
+    rules = []
+    for index, rule in enumerate(data):
+        where = 'rules[{0}]'.format(index)
+        if not isinstance(rule, dict):
+            raise InvalidFaults('{0} must be a mapping'.format(where))
+        unknown = set(rule) - set(option for option, _, _ in RULE_OPTIONS)
+        if unknown:
+            raise InvalidFaults('{0} has unknown options: {1}'.format(where, ', '.join(sorted(unknown))))
+        for option, check, expected in RULE_OPTIONS:
+            if option in rule and not check(rule[option]):
+                raise InvalidFaults('{0}.{1} must be {2}'.format(where, option, expected))
+        if sum(rule.get(option, 0) for option in ('drop_rate', 'throttle_rate', 'error_rate')) > 1:
+            raise InvalidFaults('{0} rates add up to more than 1'.format(where))
+        rules.append(Rule(rule))
+    return rules
+
+
+def _rate(value):
+    return non_negative_number(value) and value <= 1
+
+
+def _error_status(value):
+    return positive_integer(value) and 500 <= value <= 599
+
+
+RULE_OPTIONS = (
+    ('endpoints', strings, 'a list of endpoint names'),
+    ('methods', strings, 'a list of HTTP methods'),
+    ('latency', duration, 'a number of seconds or a [min, max] pair'),
+    ('drop_rate', _rate, 'a number between 0 and 1'),
+    ('throttle_rate', _rate, 'a number between 0 and 1'),
+    ('retry_after', positive_integer, 'a positive integer'),
+    ('error_rate', _rate, 'a number between 0 and 1'),
+    ('error_status', _error_status, 'a 5xx status code'),
+)
+
+
+class InvalidFaults(FakeJenkinsError):
+    pass
+
+
+class ConnectionDropped(_ConnectionError):
+    # What werkzeug's server takes for a connection dropped by the client, it answers nothing
+    pass
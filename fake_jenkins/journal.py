@@ -0,0 +1,233 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from fake_jenkins.core import Job, Build, BuildParameter, intern_parameter_names
+
+LOG_FILE = 'journal.log'
+ROTATED_LOG_FILE = 'journal.log.1'
+SNAPSHOT_FILE = 'snapshot.jsonl'
+
+
+class Journal(object):
+    def __init__(self, directory, flush_interval=0.05, snapshot_every=100000, synchronous=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.synchronous = synchronous
+        self.core = None
+        self.file = None
+        self.buffer = []
+        self.appended = 0
+        self.written = 0
+        self.records_since_snapshot = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def recover(self, core):
+        snapshot_path = self._path(SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with io.open(snapshot_path, encoding='utf-8') as snapshot:
+                for line in snapshot:
+                    self._restore_job(core, json.loads(line), replace=False)
+
+        for name in (ROTATED_LOG_FILE, LOG_FILE):
+            if os.path.exists(self._path(name)):
+                with io.open(self._path(name), encoding='utf-8') as log:
+                    for line in log:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # A torn write at the end of the log
+                            break
+                        self._replay(core, record)
+                        self.records_since_snapshot += 1
+
+        for job in core.jobs.values():
+            with job.lock:
+                job._discard_old_builds(time.time())
+            core._index_job(job)
+
+    def attach(self, core):
+        self.core = core
+        self.file = io.open(self._path(LOG_FILE), 'ab')
+        core.listeners.append(self.on_event)
+
+        for job in core.jobs.values():
+            for build in [b for b in job.builds.values() if b.building]:
+                job._complete_build(build, 0, result='ABORTED')
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if self.file is not None:
+            self.flush()
+
+    def on_event(self, event, job, build):
+        if event == 'job_created':
+            # Called under the core lock, which compaction also takes
+            self.append(['job', job_to_record(job)], wait=False)
+        elif event == 'build_created':
+            self.append(['build', job.name, build.number, build.timestamp, list(build.parameter_values)])
+        elif event == 'build_completed':
+            self.append(['done', job.name, build.number, build.result, build.duration])
+
+    def append(self, record, wait=True):
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self.condition:
+            self.buffer.append(line)
+            self.appended += 1
+            sequence = self.appended
+            if wait and self.synchronous:
+                while self.written < sequence and not self.stopped:
+                    self.condition.wait()
+
+    def flush(self):
+        with self.condition:
+            lines, self.buffer = self.buffer, []
+            sequence = self.appended
+            if lines:
+                self.file.write(b''.join(lines))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.records_since_snapshot += len(lines)
+            self.written = sequence
+            self.condition.notify_all()
+
+    def compact(self):
+        with self.core.lock:
+            with self.condition:
+                self.flush()
+                self.file.close()
+                os.rename(self._path(LOG_FILE), self._path(ROTATED_LOG_FILE))
+                self.file = io.open(self._path(LOG_FILE), 'ab')
+                self.records_since_snapshot = 0
+            jobs = list(self.core.jobs.values())
+
+        temporary_path = self._path(SNAPSHOT_FILE + '.tmp')
+        with io.open(temporary_path, 'wb') as snapshot:
+            for job in jobs:
+                snapshot.write(json.dumps(job_to_snapshot(job), separators=(',', ':')).encode('utf-8') + b'\n')
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.rename(temporary_path, self._path(SNAPSHOT_FILE))
+        os.remove(self._path(ROTATED_LOG_FILE))
+        self._sync_directory()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                self.condition.wait(self.flush_interval)
+            try:
+                self.flush()
+                if self.records_since_snapshot >= self.snapshot_every:
+                    self.compact()
+            except Exception:
+                logging.getLogger(__name__).exception('Could not write the journal')
+
+    def _replay(self, core, record):
+        kind = record[0]
+        if kind == 'job':
+            self._restore_job(core, record[1], replace=True)
+            return
+
+        job = core.jobs.get(record[1])
+        if job is None:
+            return
+        if kind == 'build':
+            _, _, number, timestamp, values = record
+            job.builds[number] = Build(number, parameters=tuple(values), timestamp=timestamp,
+                                       parameter_names=_parameter_names(job), building=True, result=None)
+            job.next_build_number = max(job.next_build_number, number + 1)
+        elif kind == 'done' and record[2] in job.builds:
+            build = job.builds[record[2]]
+            build.building, build.result, build.duration = False, record[3], record[4]
+
+    def _restore_job(self, core, data, replace):
+        # Jobs from the configuration file keep their configuration, only their builds are restored
+        job = None if replace else core.jobs.get(data['name'])
+        if job is None:
+            job = Job(name=data['name'], auth_token=data['auth_token'],
+                      parameters=[BuildParameter(name=name, default_value=value)
+                                  for name, value in data['parameters']],
+                      max_builds=data['max_builds'], max_build_age=data['max_build_age'],
+                      duration=data['duration'], outcomes=data['outcomes'], priority=data['priority'],
+                      console=data['console'], console_rate=data['console_rate'],
+                      multibranch=data.get('multibranch', False),
+                      rate_limit=data.get('rate_limit'), rate_burst=data.get('rate_burst'),
+                      scheduler=core.scheduler, listeners=core.listeners, changes=core.changes)
+        names = _parameter_names(job)
+        for number, timestamp, values, building, result, duration in data.get('builds', []):
+            job.builds[number] = Build(number, parameters=tuple(values), timestamp=timestamp, parameter_names=names,
+                                       building=building, result=result, duration=duration)
+        job.next_build_number = data.get('next_build_number', 1)
+        core.jobs[job.name] = job
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def job_to_record(job):
+    return {
+        'name': job.name,
+        'auth_token': job.auth_token,
+        'parameters': [[parameter.name, parameter.default_value] for parameter in job.parameters],
+        'max_builds': job.max_builds,
+        'max_build_age': job.max_build_age,
+        'duration': job.duration,
+        'outcomes': job.outcomes,
+        'priority': job.priority,
+        'console': None if callable(job.console) else job.console,
+        'console_rate': job.console_rate,
+        'multibranch': job.multibranch,
+        'rate_limit': job.rate_limit,
+        'rate_burst': job.rate_burst,
+    }
+
+
+def job_to_snapshot(job):
+    data = job_to_record(job)
+    with job.lock:
+        data['next_build_number'] = job.next_build_number
+        data['builds'] = [[build.number, build.timestamp, build.parameter_values, build.building, build.result,
+                           build.duration]
+                          for build in job.builds.values()]
+    return data
+
+
+def _parameter_names(job):
+    return intern_parameter_names(tuple(parameter.name for parameter in job.parameters))
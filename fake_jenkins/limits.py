@@ -0,0 +1,121 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import math
+import threading
+import time
+
+from fake_jenkins.core import FakeJenkinsError
+from fake_jenkins.validation import positive_integer, positive_number
+
+CLIENT_KEYS = ('ip', 'token', 'job')
+# Set by servers where requests waiting for builds or events hold a thread, to the Admission bounding them
+HOLDING = 'fake_jenkins.holding'
+
+
+class RateLimiter(object):
+    def __init__(self, rate=None, burst=None, key='ip', max_clients=10000, clock=time.time):
+        if rate is not None and not positive_number(rate):
+            raise InvalidRateLimit('rate must be a positive number of requests per second')
+        if burst is not None and not positive_integer(burst):
+            raise InvalidRateLimit('burst must be an integer of at least 1')
+        if key not in CLIENT_KEYS:
+            raise InvalidRateLimit('key must be one of {0}'.format(', '.join(CLIENT_KEYS)))
+        self.rate = rate
+        self.burst = burst if burst is not None or rate is None else default_burst(rate)
+        self.key = key
+        self.max_buckets = max_clients
+        self.clock = clock
+        # Least recently used first
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def client_key(self, ip, token, job_name):
+        if self.key == 'job':
+            return job_name
+        if self.key == 'token' and token is not None:
+            return token
+        return ip
+
+    def take(self, demands):
+        # Demands are (key, rate, burst, count), either all are taken or none.
+        # Returns 0, or the seconds to wait before they could be.
+        with self.lock:
+            now = self.clock()
+            buckets = [(self._bucket(key, rate, burst, now), count) for key, rate, burst, count in demands]
+            wait = max([bucket.wait(count) for bucket, count in buckets] or [0])
+            if wait == 0:
+                for bucket, count in buckets:
+                    bucket.tokens -= count
+            return wait
+
+    def _bucket(self, key, rate, burst, now):
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            bucket = Bucket(rate, burst, now)
+            while len(self.buckets) >= self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            bucket.refill(rate, burst, now)
+        self.buckets[key] = bucket
+        return bucket
+
+
+class Bucket(object):
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.rate = rate
+        self.burst = burst
+        self.updated = now
+
+    def wait(self, count):
+        # A request for more than the burst is let through on a full bucket, which then owes the difference
+        needed = min(count, self.burst)
+        if self.tokens >= needed:
+            return 0
+        return (needed - self.tokens) / self.rate
+
+
+def default_burst(rate):
+    # One second worth of requests
+    return max(1, int(math.ceil(rate)))
+
+
+class Admission(object):
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            if self.limit is not None and self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+class InvalidRateLimit(FakeJenkinsError):
+    pass
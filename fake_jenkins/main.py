@@ -12,20 +12,193 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
+import atexit
+import os
+import tempfile
+
 from flask import Flask
 
 import fake_jenkins.api
 import fake_jenkins.core
+import fake_jenkins.faults
+import fake_jenkins.limits
+import fake_jenkins.manifest
+import fake_jenkins.scheduler
+import fake_jenkins.server
 
 import sys
 
-def main():
+
+def create_app(state_file=None, state_dir=None, config=None, capture_file=None):
     app = Flask('fake_jenkins')
     app.config.from_envvar('FAKE_JENKINS_CONFIG_FILE', silent=True)
+    app.config.update(config or {})
+
+    scheduler = fake_jenkins.scheduler.Scheduler()
+    scheduler.start()
+
+    state_file = state_file or app.config.get('FAKE_JENKINS_STATE_FILE')
+    state_dir = state_dir or app.config.get('FAKE_JENKINS_STATE_DIR')
+    capture_file = capture_file or app.config.get('FAKE_JENKINS_CAPTURE_FILE')
+
+    jobs = dict(app.config.get('FAKE_JENKINS_JOBS') or {})
+    if app.config.get('FAKE_JENKINS_JOBS_MANIFEST'):
+        specs = fake_jenkins.manifest.load_manifest_file(app.config['FAKE_JENKINS_JOBS_MANIFEST'])
+        jobs.update(fake_jenkins.manifest.jobs_from_specs(specs))
+    configured_jobs = list(jobs.values())
+    if state_file:
+        # Modules of optional modes are only imported when used, to keep startup fast
+        from fake_jenkins.shared import SharedCore
+        core = SharedCore(state_file, jobs=jobs,
+                          scheduler=scheduler,
+                          executors=app.config.get('FAKE_JENKINS_EXECUTORS'),
+                          views=app.config.get('FAKE_JENKINS_VIEWS'))
+    else:
+        core = fake_jenkins.core.Core(jobs=jobs,
+                                      scheduler=scheduler,
+                                      executors=app.config.get('FAKE_JENKINS_EXECUTORS'),
+                                      views=app.config.get('FAKE_JENKINS_VIEWS'))
+        if state_dir:
+            from fake_jenkins.journal import Journal
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir)
+            journal = Journal(state_dir)
+            journal.recover(core)
+            journal.attach(core)
+            app.extensions['fake_jenkins_journal'] = journal
+
+        def create_namespace():
+            # Each namespace starts from the configured jobs, in memory
+            namespace = Flask('fake_jenkins')
+            namespace.config.update(app.config)
+            core = fake_jenkins.core.Core(jobs=dict((job.name, job.copy()) for job in configured_jobs),
+                                          scheduler=scheduler,
+                                          executors=app.config.get('FAKE_JENKINS_EXECUTORS'),
+                                          views=app.config.get('FAKE_JENKINS_VIEWS'))
+            _hook_api(namespace, core)
+            return namespace
 
-    core = fake_jenkins.core.Core(jobs=app.config.get('FAKE_JENKINS_JOBS'))
-    api = fake_jenkins.api.Api(core)
+    _hook_api(app, core)
+    if not state_file:
+        from fake_jenkins.namespaces import Namespaces
+        app.wsgi_app = Namespaces(app.wsgi_app, create_namespace)
+    if capture_file:
+        from fake_jenkins.capture import Capture
+        app.wsgi_app = Capture(app.wsgi_app, capture_file)
+        app.extensions['fake_jenkins_capture'] = app.wsgi_app
+    return app
+
+
+def close_app(app):
+    # Stops the threads started by create_app, once the app is done serving
+    core = app.extensions['fake_jenkins']
+    if core.scheduler is not None:
+        core.scheduler.stop()
+    if 'fake_jenkins_journal' in app.extensions:
+        app.extensions['fake_jenkins_journal'].stop()
+    if 'fake_jenkins_capture' in app.extensions:
+        app.extensions['fake_jenkins_capture'].close()
+
+
+def _hook_api(app, core):
+    api = fake_jenkins.api.Api(core,
+                               profile_rate=app.config.get('FAKE_JENKINS_PROFILE_RATE', 0),
+                               users=app.config.get('FAKE_JENKINS_USERS'),
+                               require_crumb=app.config.get('FAKE_JENKINS_REQUIRE_CRUMB', False),
+                               faults=fake_jenkins.faults.Faults(app.config.get('FAKE_JENKINS_FAULTS')),
+                               limiter=fake_jenkins.limits.RateLimiter(**app.config.get('FAKE_JENKINS_RATE_LIMIT', {})))
     api.hook_to(app)
-    app.run(host=sys.argv[1],
-            port=int(sys.argv[2]),
-            debug=True)
+    app.wsgi_app = fake_jenkins.faults.FaultInjection(
+        app.wsgi_app, api.faults, app.url_map,
+        max_delayed=app.config.get('FAKE_JENKINS_MAX_DELAYED_REQUESTS'))
+    app.extensions['fake_jenkins'] = core
+    app.extensions['fake_jenkins_faults'] = api.faults
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='fake_jenkins')
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of pre-forked worker processes')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='number of request handling threads per worker')
+    parser.add_argument('--state-file',
+                        help='sqlite file holding jobs and builds, shared by all workers')
+    parser.add_argument('--state-dir',
+                        help='directory holding a journal and snapshots of jobs and builds, '
+                             'recovered on restart')
+    parser.add_argument('--capture',
+                        help='append every request and its response status and duration to this file, '
+                             'to be replayed with fake_jenkins-replay')
+    parser.add_argument('--max-in-flight', type=int,
+                        help='answer 503 to requests beyond this many being handled or waiting for a thread, '
+                             'in each worker')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='serve with an asyncio event loop, handlers run on --threads threads '
+                             '(Python 3 only)')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable the reloader and the interactive debugger')
+
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.threads < 1:
+        parser.error('--workers and --threads must be at least 1')
+    if args.max_in_flight is not None and (args.max_in_flight < 1 or args.debug or
+                                           (args.threads == 1 and not args.asyncio)):
+        parser.error('--max-in-flight must be at least 1, and requires --threads or --asyncio')
+    if args.debug and (args.workers > 1 or args.threads > 1):
+        parser.error('--debug cannot be combined with --workers or --threads')
+    if args.asyncio and (args.debug or args.workers > 1):
+        parser.error('--asyncio cannot be combined with --debug or --workers')
+    if args.state_dir and (args.state_file or args.workers > 1):
+        parser.error('--state-dir cannot be combined with --state-file or --workers')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    state_file = args.state_file
+    if state_file is None and args.workers > 1:
+        state_file = _temporary_state_file()
+
+    app = create_app(state_file=state_file, state_dir=args.state_dir, capture_file=args.capture)
+    max_in_flight = args.max_in_flight or app.config.get('FAKE_JENKINS_MAX_IN_FLIGHT')
+    try:
+        if args.asyncio:
+            from fake_jenkins.aio import serve
+            serve(app,
+                  app.extensions['fake_jenkins'],
+                  host=args.host,
+                  port=args.port,
+                  threads=args.threads,
+                  faults=app.extensions['fake_jenkins_faults'],
+                  max_in_flight=max_in_flight)
+        elif args.debug:
+            app.run(host=args.host,
+                    port=args.port,
+                    debug=True)
+        else:
+            fake_jenkins.server.serve(app,
+                                      host=args.host,
+                                      port=args.port,
+                                      workers=args.workers,
+                                      threads=args.threads,
+                                      max_in_flight=max_in_flight,
+                                      on_exit=lambda: close_app(app))
+    finally:
+        close_app(app)
+
+
+def _temporary_state_file():
+    fd, path = tempfile.mkstemp(prefix='fake_jenkins-', suffix='.sqlite')
+    os.close(fd)
+
+    @atexit.register
+    def cleanup():
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return path
@@ -0,0 +1,117 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+
+from fake_jenkins.core import FakeJenkinsError, BuildParameter, Job
+from fake_jenkins.validation import boolean, duration, integer, non_negative_number, optional, positive_integer, \
+    positive_number, string, strings
+
+
+def load_manifest(content):
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise InvalidManifest('manifest is not valid UTF-8: {0}'.format(e))
+    try:
+        data = json.loads(content)
+    except ValueError:
+        # Only imported for manifests that are not JSON, to keep startup fast
+        try:
+            import yaml
+        except ImportError:
+            raise InvalidManifest('manifest is not valid JSON, and PyYAML is not installed to read YAML')
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise InvalidManifest('manifest is neither valid JSON nor YAML: {0}'.format(e))
+    return parse_manifest(data)
+
+
+def load_manifest_file(path):
+    with io.open(path, 'rb') as manifest:
+        return load_manifest(manifest.read())
+
+
+def parse_manifest(data):
+    if isinstance(data, dict):
+        data = data.get('jobs')
+    if not isinstance(data, list):
+        raise InvalidManifest('manifest must be a list of jobs, or a mapping with a "jobs" list')
+
+    specs = []
+    names = set()
+    for index, job in enumerate(data):
+        where = 'jobs[{0}]'.format(index)
+        if not isinstance(job, dict):
+            raise InvalidManifest('{0} must be a mapping'.format(where))
+        unknown = set(job) - set(option for option, _, _ in JOB_OPTIONS) - {'name', 'parameters'}
+        if unknown:
+            raise InvalidManifest('{0} has unknown options: {1}'.format(where, ', '.join(sorted(unknown))))
+        if not string(job.get('name')) or not job.get('name'):
+            raise InvalidManifest('{0}.name must be a non-empty string'.format(where))
+        if job['name'] in names:
+            raise InvalidManifest('{0}.name {1!r} is a duplicate'.format(where, job['name']))
+        names.add(job['name'])
+        specs.append(job_spec(job, job['name'], where))
+    return specs
+
+
+def job_spec(data, name, where='job'):
+    spec = {'name': name}
+    for option, check, expected in JOB_OPTIONS:
+        if option in data:
+            if not check(data[option]):
+                raise InvalidManifest('{0}.{1} must be {2}'.format(where, option, expected))
+            spec[option] = data[option]
+
+    if 'parameters' in data:
+        if not isinstance(data['parameters'], list):
+            raise InvalidManifest('{0}.parameters must be a list'.format(where))
+        spec['parameters'] = []
+        for index, parameter in enumerate(data['parameters']):
+            if not isinstance(parameter, dict) or not string(parameter.get('name')):
+                raise InvalidManifest('{0}.parameters[{1}] must have a name'.format(where, index))
+            spec['parameters'].append(BuildParameter(name=parameter['name'],
+                                                     default_value=parameter.get('default_value', '')))
+    return spec
+
+
+def jobs_from_specs(specs):
+    return dict((spec['name'], Job(**dict({'auth_token': None}, **spec))) for spec in specs)
+
+
+def _outcomes(value):
+    return isinstance(value, dict) and all(string(k) and non_negative_number(v) for k, v in value.items())
+
+
+JOB_OPTIONS = (
+    ('auth_token', optional(string), 'a string'),
+    ('max_builds', optional(positive_integer), 'a positive integer'),
+    ('max_build_age', optional(non_negative_number), 'a positive number'),
+    ('duration', duration, 'a number or a [min, max] pair'),
+    ('outcomes', optional(_outcomes), 'a mapping of results to weights'),
+    ('priority', integer, 'an integer'),
+    ('console', optional(strings), 'a list of lines'),
+    ('console_rate', optional(positive_integer), 'a positive integer'),
+    ('multibranch', boolean, 'a boolean'),
+    ('rate_limit', optional(positive_number), 'a positive number of builds per second'),
+    ('rate_burst', optional(positive_integer), 'an integer of at least 1'),
+)
+
+
+class InvalidManifest(FakeJenkinsError):
+    pass
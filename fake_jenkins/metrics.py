@@ -0,0 +1,166 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import cProfile
+import collections
+import io
+import pstats
+import random
+import threading
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics(object):
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback):
+        return self._register(Gauge(name, help, callback))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = collections.defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return ['{0}{1} {2}'.format(self.name, _labels(self.labels, key), _number(value)) for key, value in values]
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum of the observations
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, list(counts)) for key, counts in self.values.items())
+
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{0}_bucket{1} {2}'.format(self.name, _labels(self.labels + ('le',), key + (bound,)),
+                                                        cumulative))
+            lines.append('{0}_sum{1} {2}'.format(self.name, _labels(self.labels, key), _number(counts[-1])))
+            lines.append('{0}_count{1} {2}'.format(self.name, _labels(self.labels, key), cumulative))
+        return lines
+
+
+class Gauge(object):
+    type = 'gauge'
+
+    def __init__(self, name, help, callback):
+        self.name = name
+        self.help = help
+        self.callback = callback
+
+    def samples(self):
+        return ['{0} {1}'.format(self.name, _number(self.callback()))]
+
+
+class Profiler(object):
+    def __init__(self, rate=0.0):
+        self.rate = rate
+        self.stats = {}
+        self.samples = collections.defaultdict(int)
+        self.lock = threading.Lock()
+
+    def sampled(self):
+        return self.rate > 0 and random.random() < self.rate
+
+    def profile(self, endpoint, fn, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.samples[endpoint] += 1
+                if endpoint in self.stats:
+                    self.stats[endpoint].add(profile)
+                else:
+                    self.stats[endpoint] = pstats.Stats(profile)
+
+    def report(self, endpoint=None, limit=30):
+        # pstats writes native strings
+        output = io.BytesIO() if str is bytes else io.StringIO()
+        with self.lock:
+            for name in sorted(self.stats):
+                if endpoint is None or name == endpoint:
+                    output.write('{0}: {1} sampled requests\n'.format(name, self.samples[name]))
+                    self.stats[name].stream = output
+                    self.stats[name].sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value)) for name, value in zip(names, values)) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,45 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+PREFIX = '/ns/'
+
+
+class Namespaces(object):
+    def __init__(self, app, factory):
+        self.app = app
+        self.factory = factory
+        self.apps = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(PREFIX):
+            name, _, rest = path[len(PREFIX):].partition('/')
+            if name:
+                # The namespace looks like a Jenkins of its own, mounted under its prefix
+                environ = dict(environ, SCRIPT_NAME=environ.get('SCRIPT_NAME', '') + PREFIX + name,
+                               PATH_INFO='/' + rest)
+                return self.get(name)(environ, start_response)
+        return self.app(environ, start_response)
+
+    def get(self, name):
+        app = self.apps.get(name)
+        if app is None:
+            with self.lock:
+                app = self.apps.get(name)
+                if app is None:
+                    app = self.apps[name] = self.factory()
+        return app
@@ -0,0 +1,166 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import re
+import socket
+import sys
+import threading
+import time
+
+try:
+    import http.client as httplib
+    import queue
+except ImportError:
+    import httplib
+    import Queue as queue
+
+from fake_jenkins.bench import percentile, start_in_process, host_and_port
+from fake_jenkins.capture import read_capture
+
+NUMBER = re.compile(r'/\d+(?=/|$)')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='fake_jenkins-replay')
+    parser.add_argument('capture', help='file written by a server running with --capture')
+    parser.add_argument('--url', help='replay against an already running server instead of starting a fresh one')
+    parser.add_argument('--threads', type=int, default=8, help='request handling threads of the fresh server')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='number of concurrent clients, 1 sends the requests strictly in order')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed relative to the capture, 0 sends the requests as fast as possible')
+    parser.add_argument('--output', help='write the report to this file instead of stdout')
+
+    args = parser.parse_args(argv)
+    if args.concurrency < 1 or args.speed < 0:
+        parser.error('--concurrency must be at least 1 and --speed cannot be negative')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    # Records are written as requests complete, they are replayed as they started
+    records = sorted(read_capture(args.capture), key=lambda record: record['t'])
+
+    if args.url:
+        host, port = host_and_port(args.url)
+        stop = lambda: None
+    else:
+        host, port, stop = start_in_process(args.threads)
+
+    try:
+        results = replay(host, port, records, args.speed, args.concurrency)
+    finally:
+        stop()
+
+    report = compare(records, results)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    for divergence in report['divergences']:
+        sys.stderr.write('{index}: {method} {path} answered {replayed}, captured {captured}\n'.format(**divergence))
+    return 1 if report['divergences'] else 0
+
+
+def replay(host, port, records, speed=1.0, concurrency=8):
+    # Statuses and latencies, in the order of the records
+    results = [None] * len(records)
+    pending = queue.Queue()
+
+    def client():
+        connection = httplib.HTTPConnection(host, port)
+        while True:
+            index = pending.get()
+            if index is None:
+                break
+            record = records[index]
+            start = time.time()
+            try:
+                status = _request(connection, record)
+            except (socket.error, httplib.HTTPException):
+                connection.close()
+                status = None
+            results[index] = (status, time.time() - start)
+        connection.close()
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+
+    started = time.time()
+    first = records[0]['t'] if records else 0
+    for index, record in enumerate(records):
+        if speed > 0:
+            delay = started + (record['t'] - first) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        pending.put(index)
+
+    for _ in clients:
+        pending.put(None)
+    for thread in clients:
+        thread.join()
+    return results
+
+
+def compare(records, results):
+    divergences = []
+    captured = {}
+    replayed = {}
+    for index, (record, (status, latency)) in enumerate(zip(records, results)):
+        endpoint = '{0} {1}'.format(record['method'], NUMBER.sub('/<n>', record['path']))
+        captured.setdefault(endpoint, []).append(record['duration'])
+        replayed.setdefault(endpoint, []).append(latency)
+        if status != record['status']:
+            divergences.append({'index': index, 'method': record['method'], 'path': record['path'],
+                                'captured': record['status'], 'replayed': status})
+
+    return {
+        'requests': len(records),
+        'divergences': divergences,
+        'endpoints': dict((endpoint, summarize(captured[endpoint], replayed[endpoint])) for endpoint in captured),
+    }
+
+
+def summarize(captured, replayed):
+    captured, replayed = sorted(captured), sorted(replayed)
+    summary = {'requests': len(captured)}
+    for percent in (50, 99):
+        before = percentile(captured, percent) * 1000
+        after = percentile(replayed, percent) * 1000
+        summary['captured_p{0}_ms'.format(percent)] = before
+        summary['replayed_p{0}_ms'.format(percent)] = after
+        summary['change_p{0}_ms'.format(percent)] = after - before
+    return summary
+
+
+def _request(connection, record):
+    path = record['path'] + ('?' + record['query'] if record['query'] else '')
+    body = record['body'].encode('latin-1') if record['body'] else None
+    headers = dict((_native(name), _native(value)) for name, value in record['headers'].items())
+    connection.request(_native(record['method']), _native(path), body, headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def _native(text):
+    # httplib on Python 2 cannot mix unicode headers with a binary body
+    return text.encode('latin-1') if str is bytes else text
@@ -0,0 +1,80 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+
+class Scheduler(object):
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.timers = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.pid = None
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self._ensure_thread()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def call_later(self, delay, callback, *args):
+        self._ensure_thread()
+        with self.condition:
+            heapq.heappush(self.timers, (self.clock() + delay, next(self.sequence), callback, args))
+            self.condition.notify()
+
+    def run_pending(self):
+        while True:
+            with self.condition:
+                if not self.timers or self.timers[0][0] > self.clock():
+                    return
+                _, _, callback, args = heapq.heappop(self.timers)
+            try:
+                callback(*args)
+            except Exception:
+                logging.getLogger(__name__).exception('Scheduled callback failed')
+
+    def _ensure_thread(self):
+        # The timer thread does not survive a fork, each worker process starts its own
+        if self.running and self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.run_pending()
+            with self.condition:
+                if not self.running:
+                    return
+                if not self.timers:
+                    self.condition.wait()
+                else:
+                    delay = self.timers[0][0] - self.clock()
+                    if delay > 0:
+                        self.condition.wait(delay)
@@ -0,0 +1,185 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import socket
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from fake_jenkins.limits import HOLDING, Admission
+
+SHED_TIMEOUT = 1
+MAX_SHED_HEAD = 64 * 1024
+SHED_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 19\r\n'
+                 b'Retry-After: 1\r\nConnection: close\r\n\r\nService Unavailable')
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, threads=1, max_in_flight=None):
+        BaseWSGIServer.__init__(self, host, port, app, handler=RequestHandler)
+        self.threads = threads
+        self.multithread = threads > 1
+        self.pending = queue.Queue()
+        self.shed = queue.Queue()
+        self.admission = Admission(max_in_flight)
+        # Event streams and waits hold their thread, one is always left for the other requests
+        self.holding = Admission(threads - 1)
+        self.workers = []
+        self.shedder = None
+
+    def serve_forever(self):
+        # Pool threads are started here rather than in __init__ so that
+        # each forked worker gets its own pool.
+        if self.threads > 1:
+            for _ in range(self.threads):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+            if self.admission.limit is not None:
+                self.shedder = threading.Thread(target=self._shed)
+                self.shedder.daemon = True
+                self.shedder.start()
+        BaseWSGIServer.serve_forever(self)
+
+    def server_close(self):
+        BaseWSGIServer.server_close(self)
+        for _ in self.workers:
+            self.pending.put(None)
+        self.shed.put(None)
+        for thread in self.workers + [self.shedder]:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+        self.workers = []
+
+    def handle_error(self, request, client_address):
+        # Python 2 hands every exception of the main thread here, including the one of a terminating signal
+        if isinstance(sys.exc_info()[1], (SystemExit, KeyboardInterrupt)):
+            raise
+        BaseWSGIServer.handle_error(self, request, client_address)
+
+    def process_request(self, request, client_address):
+        if self.threads > 1:
+            # Connections waiting for a thread count as in flight, they are what makes latency collapse
+            if self.admission.enter():
+                self.pending.put((request, client_address))
+            else:
+                self.shed.put(request)
+        else:
+            BaseWSGIServer.process_request(self, request, client_address)
+
+    def _work(self):
+        while True:
+            pending = self.pending.get()
+            if pending is None:
+                return
+            request, client_address = pending
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.admission.leave()
+
+    def _shed(self):
+        # A single thread answers connections over the limit, reading their request first so that clients see
+        # the answer rather than a reset connection
+        while True:
+            request = self.shed.get()
+            if request is None:
+                return
+            try:
+                request.settimeout(SHED_TIMEOUT)
+                head = b''
+                while b'\r\n\r\n' not in head and len(head) < MAX_SHED_HEAD:
+                    chunk = request.recv(4096)
+                    if not chunk:
+                        break
+                    head += chunk
+                request.sendall(SHED_RESPONSE)
+            except socket.error:
+                pass
+            finally:
+                self.shutdown_request(request)
+
+
+class RequestHandler(WSGIRequestHandler):
+    def make_environ(self):
+        environ = WSGIRequestHandler.make_environ(self)
+        environ[HOLDING] = self.server.holding
+        return environ
+
+    def connection_dropped(self, error, environ=None):
+        # Including connections dropped on purpose by the application, which must not answer later requests
+        self.close_connection = True
+
+
+def serve(app, host, port, workers=1, threads=1, max_in_flight=None, on_exit=None):
+    server = PooledWSGIServer(host, port, app, threads=threads, max_in_flight=max_in_flight)
+    # Terminating unwinds the stack, so that buffered state is written on the way out
+    signal.signal(signal.SIGTERM, _exit)
+    if workers == 1:
+        server.serve_forever()
+        return
+
+    server.multiprocess = True
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                # Workers leave without running the exit handlers of the parent
+                try:
+                    if on_exit is not None:
+                        on_exit()
+                finally:
+                    os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        # Children write what they buffered on the way out, callers expect it to be there once we exited
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.socket.close()
+    for pid in children:
+        os.waitpid(pid, 0)
+
+
+def _exit(signum, frame):
+    raise SystemExit(0)
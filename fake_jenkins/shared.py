@@ -0,0 +1,491 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+from fake_jenkins.auth import HASH_PREFIX, hash_token
+from fake_jenkins.core import Core, Job, Build, BuildParameter, BuildQueue, ChangeLog, JobEvents, JobNotFound,\
+    QueueItem, QueueItemNotFound, UnsupportedOperation, check_views
+from fake_jenkins.views import Listing, Views
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    auth_token TEXT,
+    parameters TEXT NOT NULL,
+    next_build_number INTEGER NOT NULL,
+    max_builds INTEGER,
+    max_build_age REAL,
+    duration TEXT NOT NULL,
+    outcomes TEXT,
+    priority INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    multibranch INTEGER NOT NULL,
+    rate_limit REAL,
+    rate_burst INTEGER
+);
+CREATE TABLE IF NOT EXISTS builds (
+    job TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    parameters TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    building INTEGER NOT NULL,
+    result TEXT,
+    duration REAL NOT NULL,
+    PRIMARY KEY (job, number)
+);
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    build INTEGER,
+    cancelled INTEGER NOT NULL,
+    running INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('listings', 0);
+CREATE INDEX IF NOT EXISTS jobs_auth_token ON jobs (auth_token);
+CREATE INDEX IF NOT EXISTS queue_pending ON queue (build, cancelled, priority, id);
+CREATE INDEX IF NOT EXISTS queue_builds ON queue (job, build);
+CREATE INDEX IF NOT EXISTS queue_running ON queue (running);
+"""
+
+JOB_COLUMNS = 'name, auth_token, parameters, max_builds, max_build_age, duration, outcomes, priority, multibranch, ' \
+              'rate_limit, rate_burst'
+BUILD_COLUMNS = 'number, parameters, timestamp, building, result, duration'
+QUEUE_COLUMNS = 'id, job, parameters, priority, timestamp, build, cancelled'
+SHARED_POLL_INTERVAL = 0.1
+
+
+class Store(object):
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        # Connections must not cross a fork, so they are kept per thread and per process.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+            self.local.depth = 0
+        return self.local.connection
+
+    def execute(self, statement, *args):
+        return self.connection.execute(statement, args)
+
+    def transaction(self):
+        return Transaction(self)
+
+
+class Transaction(object):
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        connection = self.store.connection
+        if self.store.local.depth == 0:
+            connection.execute('BEGIN IMMEDIATE')
+        self.store.local.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.store.local.depth -= 1
+        if self.store.local.depth == 0:
+            self.store.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+class SharedCore(Core):
+    def __init__(self, path, jobs=None, scheduler=None, executors=None, views=None):
+        self.store = Store(path)
+        self.scheduler = scheduler
+        self.listeners = []
+        self.jobs = SharedJobs(self.store, scheduler, self.listeners)
+        self.views = SharedViews(self.jobs, check_views(views))
+        self.changes = ChangeLog()
+        self.lock = self.store.transaction()
+        with self.lock:
+            for job in (jobs or {}).values():
+                self.jobs.setdefault(job.name, job)
+        self.queue = SharedBuildQueue(self.store, self.jobs, executors=executors)
+        self.events = JobEvents()
+        self.listeners.append(self.queue.on_build_event)
+        self.listeners.append(self.events.on_event)
+
+    def snapshot(self):
+        raise UnsupportedOperation('snapshots are not supported with a state file')
+
+    def restore(self):
+        raise UnsupportedOperation('snapshots are not supported with a state file')
+
+    def _index_job(self, job):
+        # Tokens and folders are looked up in the jobs table, which other workers update too
+        pass
+
+    def find_job_by_token(self, token):
+        hashed = hash_token(token)
+        # Presenting a stored hash as is does not match, like in TokenIndex
+        raw = hashed if token.startswith(HASH_PREFIX) else token
+        names = [row[0] for row in self.store.execute('SELECT name FROM jobs WHERE auth_token IN (?, ?) LIMIT 2',
+                                                      raw, hashed)]
+        if len(names) != 1:
+            raise JobNotFound(token)
+        return self.get_job(names[0])
+
+    def _folder_children(self, name):
+        prefix = name + '/' if name else ''
+        children = set(prefix + job_name[len(prefix):].split('/', 1)[0] for job_name in self.find_jobs(prefix))
+        return sorted(children) or None
+
+    def find_jobs(self, prefix):
+        if not prefix:
+            return list(self.jobs)
+        # Names starting with the prefix sort between it and the prefix with its last character incremented
+        end = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        return [row[0] for row in self.store.execute('SELECT name FROM jobs WHERE name >= ? AND name < ? '
+                                                     'ORDER BY name', prefix, end)]
+
+
+class SharedViews(Views):
+    # Other workers change jobs too, so listings are rebuilt from the jobs table once they changed
+    def __init__(self, jobs, views=None):
+        Views.__init__(self, views)
+        self.jobs = jobs
+        self.built = {}
+
+    def create(self, name, include_regex, jobs):
+        Views.create(self, name, include_regex, ())
+
+    def add_job(self, job):
+        pass
+
+    def on_event(self, event, job, build):
+        pass
+
+    def get(self, name):
+        definition = Views.get(self, name)
+        if definition is None:
+            return None
+        # Read before the jobs, a change made meanwhile rebuilds the listing once more
+        version = self.jobs.store.execute("SELECT value FROM counters WHERE name = 'listings'").fetchone()[0]
+        built = self.built.get(name)
+        if built is not None and built[0] == version and built[1] is definition:
+            return built[2]
+        listing = Listing(definition.include_regex)
+        for job in self.jobs.values():
+            listing.add_job(job)
+        self.built[name] = (version, definition, listing)
+        return listing
+
+
+class SharedBuildQueue(BuildQueue):
+    # Items are numbered and dispatched across workers, executors are shared by all of them
+    def __init__(self, store, jobs, executors=None, max_left_items=10000):
+        self.store = store
+        self.jobs = jobs
+        self.executors = executors
+        self.max_left_items = max_left_items
+        self.lock = store.transaction()
+
+    def schedule(self, job, parameters=None, priority=None):
+        with self.lock:
+            item_id = self.store.execute('INSERT INTO queue (job, parameters, priority, timestamp, cancelled, running) '
+                                         'VALUES (?, ?, ?, ?, 0, 0)', job.name, json.dumps(parameters or {}),
+                                         job.priority if priority is None else priority, time.time()).lastrowid
+            self._dispatch()
+            return self.get_item(item_id)
+
+    def cancel(self, item_id):
+        with self.lock:
+            self.get_item(item_id)
+            self.store.execute('UPDATE queue SET cancelled = 1 WHERE id = ? AND build IS NULL', item_id)
+            self._trim(item_id)
+
+    def get_item(self, item_id):
+        row = self.store.execute('SELECT {0} FROM queue WHERE id = ?'.format(QUEUE_COLUMNS), item_id).fetchone()
+        item = None if row is None else self._item_from_row({}, *row)
+        if item is None:
+            raise QueueItemNotFound(item_id)
+        return item
+
+    def clear(self, rolled_back=()):
+        self.store.execute('DELETE FROM queue')
+
+    def get_pending_items(self):
+        jobs = {}
+        items = [self._item_from_row(jobs, *row)
+                 for row in self.store.execute('SELECT {0} FROM queue WHERE build IS NULL AND cancelled = 0 '
+                                               'ORDER BY priority, id'.format(QUEUE_COLUMNS))]
+        return [item for item in items if item is not None]
+
+    def count_pending_items(self):
+        return self.store.execute('SELECT COUNT(*) FROM queue WHERE build IS NULL AND cancelled = 0').fetchone()[0]
+
+    def on_build_event(self, event, job, build):
+        if event == 'build_completed' and self.executors is not None:
+            with self.lock:
+                if self.store.execute('UPDATE queue SET running = 0 WHERE job = ? AND build = ? AND running = 1',
+                                      job.name, build.number).rowcount:
+                    self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                if self.executors is not None and \
+                        self.store.execute('SELECT COUNT(*) FROM queue WHERE running = 1').fetchone()[0] >= \
+                        self.executors:
+                    return
+                row = self.store.execute('SELECT id, job, parameters FROM queue WHERE build IS NULL AND '
+                                         'cancelled = 0 ORDER BY priority, id LIMIT 1').fetchone()
+                if row is None:
+                    return
+                item_id, job_name, parameters = row
+                job = self.jobs.get(job_name)
+                if job is None:
+                    self.store.execute('UPDATE queue SET cancelled = 1 WHERE id = ?', item_id)
+                else:
+                    # Builds finishing on the scheduler thread wait for this transaction to mark them running
+                    build = job.create_build(**json.loads(parameters))
+                    self.store.execute('UPDATE queue SET build = ?, running = ? WHERE id = ?', build.number,
+                                       self.executors is not None and build.building, item_id)
+                self._trim(item_id)
+
+    def _trim(self, item_id):
+        self.store.execute('DELETE FROM queue WHERE id <= ? AND (build IS NOT NULL OR cancelled = 1) '
+                           'AND running = 0', item_id - self.max_left_items)
+
+    def _item_from_row(self, jobs, item_id, job_name, parameters, priority, timestamp, build, cancelled):
+        if job_name not in jobs:
+            jobs[job_name] = self.jobs.get(job_name)
+        job = jobs[job_name]
+        if job is None:
+            return None
+        item = QueueItem(item_id, job, json.loads(parameters), priority)
+        item.timestamp = timestamp
+        item.cancelled = bool(cancelled)
+        if build is not None:
+            item.executable = job.builds.get(build) or Build(build)
+        return item
+
+
+class SharedJobs(MutableMapping):
+    def __init__(self, store, scheduler=None, listeners=None):
+        self.store = store
+        self.scheduler = scheduler
+        self.listeners = [] if listeners is None else listeners
+
+    def __getitem__(self, name):
+        row = self.store.execute('SELECT {0} FROM jobs WHERE name = ?'.format(JOB_COLUMNS), name).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return self._job_from_row(*row)
+
+    def __setitem__(self, name, job):
+        with self.store.transaction():
+            touch_listings(self.store)
+            self._delete_builds(name)
+            self.store.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               name, job.auth_token,
+                               json.dumps([(p.name, p.default_value) for p in job.parameters]),
+                               job.next_build_number, job.max_builds, job.max_build_age,
+                               json.dumps(job.duration), json.dumps(job.outcomes), job.priority, new_version(),
+                               job.multibranch, job.rate_limit, job.rate_burst)
+
+    def __delitem__(self, name):
+        with self.store.transaction():
+            if self.store.execute('DELETE FROM jobs WHERE name = ?', name).rowcount == 0:
+                raise KeyError(name)
+            touch_listings(self.store)
+            self._delete_builds(name)
+
+    def _delete_builds(self, name):
+        self.store.execute('DELETE FROM builds WHERE job = ?', name)
+        # Their completions are ignored, they would never give their executor back
+        self.store.execute('UPDATE queue SET running = 0 WHERE job = ?', name)
+
+    def __iter__(self):
+        return iter([row[0] for row in self.store.execute('SELECT name FROM jobs ORDER BY name')])
+
+    def __len__(self):
+        return self.store.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def _job_from_row(self, name, auth_token, parameters, max_builds, max_build_age, duration, outcomes, priority,
+                      multibranch, rate_limit, rate_burst):
+        return SharedJob(self.store, name=name, auth_token=auth_token,
+                         parameters=[BuildParameter(name=p, default_value=v) for p, v in json.loads(parameters)],
+                         max_builds=max_builds, max_build_age=max_build_age,
+                         duration=json.loads(duration), outcomes=json.loads(outcomes), priority=priority,
+                         multibranch=bool(multibranch), rate_limit=rate_limit, rate_burst=rate_burst,
+                         scheduler=self.scheduler, listeners=self.listeners)
+
+
+class SharedJob(Job):
+    def __init__(self, store, name, auth_token, parameters=None, max_builds=None, max_build_age=None,
+                 duration=0, outcomes=None, priority=0, scheduler=None, listeners=None, multibranch=False,
+                 rate_limit=None, rate_burst=None):
+        self.name = name
+        self.auth_token = auth_token
+        self.parameters = parameters or []
+        self.max_builds = max_builds
+        self.max_build_age = max_build_age
+        self.duration = duration
+        self.outcomes = outcomes
+        self.priority = priority
+        self.console = None
+        self.console_rate = None
+        self.multibranch = multibranch
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.scheduler = scheduler
+        self.listeners = [] if listeners is None else listeners
+        self.changes = None
+        self.store = store
+        self.builds = SharedBuilds(store, name)
+        self.lock = store.transaction()
+
+    @property
+    def next_build_number(self):
+        return self.store.execute('SELECT next_build_number FROM jobs WHERE name = ?', self.name).fetchone()[0]
+
+    @next_build_number.setter
+    def next_build_number(self, value):
+        self.store.execute('UPDATE jobs SET next_build_number = ? WHERE name = ?', value, self.name)
+
+    def get_builds(self, start=0, end=None):
+        with self.lock:
+            self._discard_old_builds(time.time())
+            limit = -1 if end is None else max(end - start, 0)
+            return [_build_from_row(*row)
+                    for row in self.store.execute('SELECT {0} FROM builds WHERE job = ? '
+                                                  'ORDER BY number DESC LIMIT ? OFFSET ?'.format(BUILD_COLUMNS),
+                                                  self.name, limit, start)]
+
+    def wait_for_build(self, number, timeout):
+        # Builds may come from other processes, which cannot notify this one
+        deadline = time.time() + timeout
+        while self.next_build_number <= number:
+            if time.time() >= deadline:
+                return False
+            time.sleep(min(SHARED_POLL_INTERVAL, max(deadline - time.time(), 0)))
+        return True
+
+    def _wake_waiters(self):
+        pass
+
+    def _save_completed_build(self, build):
+        # Only timestamps tell builds apart from those of the same number of a re-created job
+        if not self.store.execute('UPDATE builds SET building = 0, result = ?, duration = ? '
+                                  'WHERE job = ? AND number = ? AND timestamp = ?',
+                                  build.result, build.duration, self.name, build.number, build.timestamp).rowcount:
+            return self._discarded(build)
+        self._touch()
+        return True
+
+    @property
+    def version(self):
+        return self.store.execute('SELECT version FROM jobs WHERE name = ?', self.name).fetchone()[0]
+
+    def _discard_old_builds(self, now):
+        discarded = 0
+        if self.max_builds is not None:
+            discarded += self.store.execute('DELETE FROM builds WHERE job = ? AND number <= ?',
+                                            self.name, self.next_build_number - 1 - self.max_builds).rowcount
+        if self.max_build_age is not None:
+            discarded += self.store.execute('DELETE FROM builds WHERE job = ? AND timestamp < ?',
+                                            self.name, now - self.max_build_age).rowcount
+        if discarded:
+            self._touch()
+
+    def _touch(self):
+        self.store.execute('UPDATE jobs SET version = ? WHERE name = ?', new_version(), self.name)
+        touch_listings(self.store)
+
+
+def new_version():
+    # Versions must not collide between processes, unlike the in-memory counter
+    return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+
+def touch_listings(store):
+    # Listings show the last builds of jobs, any change to jobs or builds may change them
+    store.execute("UPDATE counters SET value = value + 1 WHERE name = 'listings'")
+
+
+class SharedBuilds(MutableMapping):
+    def __init__(self, store, job_name):
+        self.store = store
+        self.job_name = job_name
+
+    def __getitem__(self, number):
+        row = self.store.execute('SELECT {0} FROM builds WHERE job = ? AND number = ?'.format(BUILD_COLUMNS),
+                                 self.job_name, number).fetchone()
+        if row is None:
+            raise KeyError(number)
+        return _build_from_row(*row)
+
+    def __setitem__(self, number, build):
+        self.store.execute('INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           self.job_name, number, json.dumps(build.parameters), build.timestamp,
+                           build.building, build.result, build.duration)
+
+    def __delitem__(self, number):
+        if self.store.execute('DELETE FROM builds WHERE job = ? AND number = ?',
+                              self.job_name, number).rowcount == 0:
+            raise KeyError(number)
+
+    def __contains__(self, number):
+        return self.store.execute('SELECT 1 FROM builds WHERE job = ? AND number = ?',
+                                  self.job_name, number).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self.store.execute('SELECT number FROM builds WHERE job = ? ORDER BY number',
+                                                          self.job_name)])
+
+    def __len__(self):
+        return self.store.execute('SELECT COUNT(*) FROM builds WHERE job = ?', self.job_name).fetchone()[0]
+
+    def values(self):
+        return [_build_from_row(*row)
+                for row in self.store.execute('SELECT {0} FROM builds WHERE job = ? '
+                                              'ORDER BY number'.format(BUILD_COLUMNS), self.job_name)]
+
+
+def _build_from_row(number, parameters, timestamp, building, result, duration):
+    return Build(number, parameters=json.loads(parameters), timestamp=timestamp,
+                 building=bool(building), result=result, duration=duration)
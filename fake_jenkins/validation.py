@@ -0,0 +1,56 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numbers
+
+STRING_TYPES = (type(b''), type(u''))
+
+
+def string(value):
+    return isinstance(value, STRING_TYPES)
+
+
+def strings(value):
+    return isinstance(value, list) and all(string(item) for item in value)
+
+
+def optional(check):
+    return lambda value: value is None or check(value)
+
+
+def boolean(value):
+    return isinstance(value, bool)
+
+
+def integer(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+
+def positive_integer(value):
+    return integer(value) and value >= 1
+
+
+def non_negative_number(value):
+    # Infinity and NaN are JSON to Python, but no count of seconds or rate
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and 0 <= value < float('inf')
+
+
+def positive_number(value):
+    return non_negative_number(value) and value > 0
+
+
+def duration(value):
+    if isinstance(value, (list, tuple)):
+        return len(value) == 2 and all(non_negative_number(bound) for bound in value) and value[0] <= value[1]
+    return non_negative_number(value)
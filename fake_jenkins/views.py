@@ -0,0 +1,161 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import itertools
+import json
+import re
+import threading
+
+ALL_VIEW = 'all'
+
+JOB_CLASS = 'hudson.model.FreeStyleProject'
+FOLDER_CLASS = 'com.cloudbees.hudson.plugins.folder.Folder'
+MULTIBRANCH_CLASS = 'org.jenkinsci.plugins.workflow.multibranch.WorkflowMultiBranchProject'
+
+COLORS = {'SUCCESS': 'blue', 'UNSTABLE': 'yellow', 'FAILURE': 'red', 'ABORTED': 'aborted', 'NOT_BUILT': 'notbuilt'}
+
+
+class Views(object):
+    def __init__(self, views=None):
+        self.listings = {ALL_VIEW: Listing()}
+        for name, include_regex in (views or {}).items():
+            self.listings[name] = Listing(include_regex)
+        self.version = next(_versions)
+        self.lock = threading.Lock()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.listings)
+
+    def get(self, name):
+        return self.listings.get(name)
+
+    def create(self, name, include_regex, jobs):
+        listing = Listing(include_regex)
+        for job in jobs:
+            listing.add_job(job)
+        with self.lock:
+            self.listings[name] = listing
+            self.version = next(_versions)
+
+    def add_job(self, job):
+        with self.lock:
+            listings = list(self.listings.values())
+        for listing in listings:
+            listing.add_job(job)
+
+    def remove_job(self, name, exists):
+        with self.lock:
+            listings = list(self.listings.values())
+        for listing in listings:
+            listing.remove_job(name, exists)
+
+    def on_event(self, event, job, build):
+        # New jobs are added once they can be looked up, by Core._index_job
+        if event != 'job_created':
+            with self.lock:
+                listings = list(self.listings.values())
+            for listing in listings:
+                listing.update_job(job)
+
+
+class Listing(object):
+    def __init__(self, include_regex=None):
+        self.include_regex = include_regex
+        # Without a regex, the top level items like the "all" view, otherwise the matching jobs at any depth
+        self.include = None if include_regex is None else re.compile('(?:{0})\\Z'.format(include_regex))
+        self.names = []
+        self.entries = {}
+        self.version = next(_versions)
+        self.lock = threading.Lock()
+
+    def add_job(self, job):
+        if self.include is None:
+            top, _, rest = job.name.partition('/')
+            if not rest:
+                self._set(top, job_entry(job))
+            elif top not in self.entries:
+                self._set(top, folder_entry(top))
+        elif self.include.match(job.name):
+            self._set(job.name, job_entry(job))
+
+    def update_job(self, job):
+        if job.name in self.entries:
+            self._set(job.name, job_entry(job))
+
+    def remove_job(self, name, exists):
+        if self.include is None:
+            name = name.partition('/')[0]
+            if exists(name):
+                return
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                del self.names[bisect.bisect_left(self.names, name)]
+                self.version = next(_versions)
+
+    def _set(self, name, entry):
+        with self.lock:
+            previous = self.entries.get(name)
+            if previous == entry:
+                return
+            if previous is None:
+                bisect.insort(self.names, name)
+            self.entries[name] = entry
+            self.version = next(_versions)
+
+    def render(self, url_root):
+        with self.lock:
+            entries = [self.entries[name] for name in self.names]
+        root = json.dumps(url_root)[1:-1].encode('utf-8')
+        return b','.join(head + root + tail for head, tail in entries)
+
+
+def job_color(job):
+    build = job.last_build
+    if build is None:
+        return 'notbuilt'
+    if not build.building:
+        return COLORS.get(build.result, 'notbuilt')
+    previous = job.builds.get(build.number - 1)
+    if previous is None or previous.building:
+        return 'notbuilt_anime'
+    return COLORS.get(previous.result, 'notbuilt') + '_anime'
+
+
+def job_entry(job):
+    if job.multibranch:
+        return _entry(MULTIBRANCH_CLASS, job.name)
+    return _entry(JOB_CLASS, job.name, job_color(job))
+
+
+def folder_entry(name):
+    return _entry(FOLDER_CLASS, name)
+
+
+def _entry(item_class, name, color=None):
+    # Serialized ahead of time around the URL root, which depends on the request
+    head = json.dumps({'_class': item_class, 'name': name.rpartition('/')[2], 'fullName': name},
+                      sort_keys=True)[:-1] + ', "url": "'
+    tail = json.dumps('job/{0}/'.format(name.replace('/', '/job/')))[1:]
+    if color is not None:
+        tail += ', "color": ' + json.dumps(color)
+    return head.encode('utf-8'), (tail + '}').encode('utf-8')
+
+
+def listing_body(data, jobs):
+    return json.dumps(data)[:-1].encode('utf-8') + b', "jobs": [' + jobs + b']}'
+
+
+_versions = itertools.count(1)
@@ -0,0 +1,202 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import socket
+import threading
+import time
+import unittest
+
+import flask
+import mock
+from fake_jenkins import aio
+from fake_jenkins.api import Api
+from fake_jenkins.core import Core
+from fake_jenkins.faults import Faults
+from hamcrest import assert_that, is_, has_entry, less_than, greater_than_or_equal_to, contains_string
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+
+@unittest.skipIf(aio.asyncio is None, 'the asyncio frontend requires Python 3')
+class AsyncServerTest(unittest.TestCase):
+    def setUp(self):
+        self.core = Core()
+        self.core.create_job(name='myJob', auth_token='token')
+        app = flask.Flask(__name__)
+        self.faults = Faults()
+        Api(self.core, faults=self.faults).hook_to(app)
+        self.server = aio.AsyncServer(app, self.core, threads=4, faults=self.faults)
+        self.port = self.server.bind('127.0.0.1', 0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        self.server.close()
+
+    def request(self, method, path, body=None, connection=None):
+        connection = connection or httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def test_injected_delays_do_not_hold_threads(self):
+        self.faults.set_rules([{'endpoints': ['get_job'], 'latency': 0.5}])
+        results = []
+
+        def poll():
+            results.append(self.request('GET', '/job/myJob/api/json')[0])
+
+        start = time.time()
+        clients = [threading.Thread(target=poll) for _ in range(12)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+        assert_that(results, is_([200] * 12))
+        assert_that(time.time() - start, less_than(1.2))
+        assert_that(self.request('GET', '/job/myJob/1/api/json')[0], is_(404))
+
+    def test_injected_errors_and_dropped_connections(self):
+        self.faults.set_rules([{'endpoints': ['get_job'], 'throttle_rate': 1, 'retry_after': 5},
+                               {'endpoints': ['get_build'], 'drop_rate': 1}])
+
+        connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        connection.request('GET', '/job/myJob/api/json')
+        response = connection.getresponse()
+        response.read()
+        assert_that(response.status, is_(429))
+        assert_that(response.getheader('Retry-After'), is_('5'))
+
+        with self.assertRaises((httplib.HTTPException, socket.error)):
+            self.request('GET', '/job/myJob/1/api/json', connection=connection)
+
+    def test_requests_over_the_limit_are_answered_503(self):
+        self.server.admission.limit = 2
+        self.faults.set_rules([{'endpoints': ['get_job'], 'latency': 0.5}])
+        clients = [threading.Thread(target=self.request, args=('GET', '/job/myJob/api/json')) for _ in range(2)]
+        for thread in clients:
+            thread.start()
+        time.sleep(0.2)
+
+        status, _ = self.request('GET', '/job/myJob/1/api/json')
+        assert_that(status, is_(503))
+
+        for thread in clients:
+            thread.join()
+        assert_that(self.request('GET', '/job/myJob/1/api/json')[0], is_(404))
+
+    def test_serves_the_api_routes(self):
+        status, _ = self.request('POST', '/job/newJob', json.dumps({'auth_token': 'other'}))
+        assert_that(status, is_(201))
+
+        status, body = self.request('GET', '/job/newJob/api/json')
+        assert_that(status, is_(200))
+        assert_that(json.loads(body.decode('utf-8')), has_entry('name', 'newJob'))
+
+        status, _ = self.request('GET', '/job/unknownJob/api/json')
+        assert_that(status, is_(404))
+
+    def test_keeps_connections_alive(self):
+        connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        for _ in range(3):
+            status, _ = self.request('GET', '/job/myJob/api/json', connection=connection)
+            assert_that(status, is_(200))
+
+    def test_wait_for_a_build(self):
+        def trigger():
+            time.sleep(0.2)
+            self.core.get_job('myJob').create_build()
+
+        threading.Thread(target=trigger).start()
+        started = time.time()
+        status, body = self.request('GET', '/job/myJob/1/api/json?wait=10')
+
+        assert_that(status, is_(200))
+        assert_that(json.loads(body.decode('utf-8')), has_entry('number', 1))
+        assert_that(time.time() - started, less_than(5))
+
+    def test_wait_for_a_build_times_out(self):
+        started = time.time()
+        status, _ = self.request('GET', '/job/myJob/1/api/json?wait=0.2')
+
+        assert_that(status, is_(404))
+        assert_that(time.time() - started, greater_than_or_equal_to(0.2))
+
+    def test_wait_must_be_a_finite_number_of_seconds(self):
+        for wait in ('soon', 'nan', 'inf'):
+            status, _ = self.request('GET', '/job/myJob/1/api/json?wait=' + wait)
+
+            assert_that(status, is_(400))
+
+    def test_idle_connections_do_not_hold_threads(self):
+        idle = [socket.create_connection(('127.0.0.1', self.port)) for _ in range(50)]
+        try:
+            status, _ = self.request('GET', '/job/myJob/api/json')
+            assert_that(status, is_(200))
+        finally:
+            for connection in idle:
+                connection.close()
+
+    def test_streams_job_events(self):
+        connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        connection.request('GET', '/job/myJob/events')
+        response = connection.getresponse()
+        assert_that(response.status, is_(200))
+        assert_that(response.getheader('Content-Type'), contains_string('text/event-stream'))
+        assert_that(response.readline(), is_(b'retry: 1000\n'))
+
+        self.core.get_job('myJob').create_build()
+
+        lines = [response.readline() for _ in range(4)]
+        assert_that(lines[1:3], is_([b'id: 2\n', b'event: build_created\n']))
+        connection.close()
+
+    @mock.patch('fake_jenkins.aio.EVENTS_HEARTBEAT', 1.5)
+    @mock.patch('fake_jenkins.api.EVENTS_HEARTBEAT', 1.5)
+    def test_event_streams_are_kept_alive(self):
+        connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request('GET', '/job/myJob/events')
+        response = connection.getresponse()
+        response.readline()
+        response.readline()
+
+        started = time.time()
+        assert_that(response.readline(), is_(b': keep-alive\n'))
+        assert_that(time.time() - started, less_than(3))
+
+    def test_event_streams_do_not_hold_threads(self):
+        responses = []
+        for _ in range(8):
+            connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=10)
+            self.addCleanup(connection.close)
+            connection.request('GET', '/job/myJob/events')
+            responses.append(connection.getresponse())
+            assert_that(responses[-1].readline(), is_(b'retry: 1000\n'))
+
+        started = time.time()
+        assert_that(self.request('GET', '/job/myJob/api/json')[0], is_(200))
+        assert_that(time.time() - started, less_than(1))
+
+        self.core.get_job('myJob').create_build()
+        for response in responses:
+            lines = [response.readline() for _ in range(4)]
+            assert_that(lines[1:3], is_([b'id: 2\n', b'event: build_created\n']))
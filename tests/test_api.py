@@ -12,15 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
 import json
+import threading
 import unittest
 
 import flask
 import mock
 from fake_jenkins import api
-from fake_jenkins.core import JobNotFound, BuildParameter, Job, Build, BuildNotFound
+from fake_jenkins.auth import hash_token
+from fake_jenkins.core import Core, JobNotFound, BuildParameter, Job, Build, BuildNotFound, BuildQueue, JobEvents, \
+    InvalidJobName, SnapshotNotFound, UnsupportedOperation
 from hamcrest import assert_that, is_, has_entry, has_key, has_length, has_item, has_entries, equal_to, \
-    contains_string, has_properties
+    contains_string, has_properties, contains, none, not_, has_items
 
 
 class FakeJenkinsServerTest(unittest.TestCase):
@@ -28,6 +32,8 @@ class FakeJenkinsServerTest(unittest.TestCase):
         self.app = flask.Flask(__name__)
         self.client = self.app.test_client()
         self.core = mock.Mock()
+        self.core.queue = BuildQueue()
+        self.core.list_folder.side_effect = JobNotFound
         self.api = api.Api(self.core)
         self.api.hook_to(self.app)
 
@@ -43,6 +49,230 @@ class FakeJenkinsServerTest(unittest.TestCase):
         self.core.get_job.assert_called_with('myJob')
         job_mock.create_build.assert_called_with()
 
+    def test_build_batch(self):
+        jobs = {'first': Job(name='first', auth_token='one',
+                             parameters=[BuildParameter(name='hello', default_value='')]),
+                'second': Job(name='second', auth_token='two')}
+        self.core.get_job.side_effect = lambda name: jobs[name]
+
+        response = self.client.post('/buildByToken/batch', data=json.dumps({'builds': [
+            {'job': 'first', 'token': 'one', 'parameters': {'hello': 'world'}},
+            {'job': 'second', 'token': 'two', 'count': 1000},
+            {'job': 'first', 'token': 'one', 'count': 2},
+        ]}))
+
+        assert_that(response.status_code, is_(201))
+        assert_that(json.loads(response.data)['builds'], is_([
+            {'job': 'first', 'number': 1, 'count': 1},
+            {'job': 'second', 'number': 1, 'count': 1000},
+            {'job': 'first', 'number': 2, 'count': 2},
+        ]))
+        assert_that(jobs['first'].get_build(1).parameters, has_entry('hello', 'world'))
+        assert_that(jobs['second'].next_build_number, is_(1001))
+
+    def test_build_batch_with_an_invalid_token_creates_no_builds(self):
+        job = Job(name='myJob', auth_token='validToken')
+        self.core.get_job.return_value = job
+
+        response = self.client.post('/buildByToken/batch', data=json.dumps([
+            {'job': 'myJob', 'token': 'validToken'},
+            {'job': 'myJob', 'token': 'invalidToken'},
+        ]))
+
+        assert_that(response.status_code, is_(403))
+        assert_that(job.next_build_number, is_(1))
+
+    def test_build_batch_requires_a_list_of_builds(self):
+        for data in ({'job': 'myJob'}, ['myJob'], [{'job': 5}], [{'job': 'myJob', 'count': 0}],
+                     [{'job': 'myJob', 'parameters': ['hello']}]):
+            response = self.client.post('/buildByToken/batch', data=json.dumps(data))
+
+            assert_that(response.status_code, is_(400))
+        assert_that(self.core.get_job.called, is_(False))
+
+    def test_build_batch_is_limited_in_size(self):
+        job = Job(name='myJob', auth_token=None)
+        self.core.get_job.return_value = job
+
+        response = self.client.post('/buildByToken/batch', data=json.dumps([
+            {'job': 'myJob', 'count': api.MAX_BATCH_BUILDS},
+            {'job': 'myJob'},
+        ]))
+
+        assert_that(response.status_code, is_(400))
+        assert_that(job.next_build_number, is_(1))
+
+    def test_get_build_waits_for_the_build(self):
+        job = Job(name='myJob', auth_token=None)
+        self.core.get_job.return_value = job
+        threading.Timer(0.1, job.create_build).start()
+
+        response = self.client.get('/job/myJob/1/api/json?wait=10')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(json.loads(response.data), has_entry('number', 1))
+
+    def test_get_build_wait_times_out(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token=None)
+
+        assert_that(self.client.get('/job/myJob/1/api/json?wait=0.05').status_code, is_(404))
+        assert_that(self.client.get('/job/myJob/1/api/json?wait=soon').status_code, is_(400))
+        for wait in ('nan', 'inf', '-inf'):
+            assert_that(self.client.get('/job/myJob/1/api/json?wait=' + wait).status_code, is_(400))
+        assert_that(self.client.get('/job/myJob/1/api/json?wait=-10').status_code, is_(404))
+
+    def test_job_events_stream(self):
+        self.core.events = JobEvents()
+        job = Job(name='myJob', auth_token=None, listeners=[self.core.events.on_event])
+        self.core.get_job.return_value = job
+        job.create_build()
+
+        response = self.client.get('/job/myJob/events?since=0', buffered=False)
+        chunks = iter(response.response)
+
+        assert_that(response.content_type, contains_string('text/event-stream'))
+        assert_that(next(chunks), is_('retry: 1000\n\n'))
+        event = next(chunks).splitlines()
+        assert_that(event[:2], is_(['id: 1', 'event: build_created']))
+        assert_that(json.loads(event[2][len('data: '):]), has_entries(job='myJob', number=1))
+        response.close()
+
+    def test_metrics(self):
+        self.core.jobs = {'myJob': Job(name='myJob', auth_token='validToken')}
+        self.core.get_job.side_effect = self.core.jobs.__getitem__
+        self.core.get_job('myJob').create_build()
+        self.client.get('/job/myJob/api/json')
+        self.client.get('/job/myJob/api/json')
+        self.core.get_job.side_effect = JobNotFound()
+        self.client.get('/job/otherJob/api/json')
+
+        response = self.client.get('/metrics')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(response.data.decode('utf-8').splitlines(), has_items(
+            'fake_jenkins_requests_total{endpoint="get_job",method="GET",status="200"} 2',
+            'fake_jenkins_requests_total{endpoint="get_job",method="GET",status="404"} 1',
+            'fake_jenkins_request_duration_seconds_count{endpoint="get_job"} 3',
+            'fake_jenkins_jobs 1',
+            'fake_jenkins_builds 1',
+            'fake_jenkins_queue_items 0',
+        ))
+
+    def test_sampled_requests_are_profiled(self):
+        self.api.profiler.rate = 1
+        self.core.get_job.return_value = Job(name='myJob', auth_token=None)
+        self.client.get('/job/myJob/api/json')
+
+        response = self.client.get('/metrics/profile?endpoint=get_job')
+
+        assert_that(response.data, contains_string('get_job: 1 sampled requests'))
+        assert_that(response.data, contains_string('job_to_api_dict'))
+
+    def test_build_by_token_only(self):
+        self.core.find_job_by_token.return_value = Job(name='myJob', auth_token='validToken')
+
+        response = self.client.get('/buildByToken/build?token=validToken')
+
+        assert_that(response.status_code, is_(200))
+        self.core.find_job_by_token.assert_called_with('validToken')
+
+    def test_build_with_a_hashed_token(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token=hash_token('validToken'))
+
+        assert_that(self.client.get('/buildByToken/build?job=myJob&token=validToken').status_code, is_(200))
+        assert_that(self.client.get('/buildByToken/build?job=myJob&token=' + hash_token('validToken')).status_code,
+                    is_(403))
+
+    def test_users_must_authenticate(self):
+        self.api.auth.users = {'alice': 'secret'}
+        self.core.get_job.return_value = Job(name='myJob', auth_token='validToken')
+        credentials = 'Basic ' + base64.b64encode(b'alice:secret').decode('ascii')
+        wrong_credentials = 'Basic ' + base64.b64encode(b'alice:wrong').decode('ascii')
+
+        response = self.client.get('/job/myJob/api/json')
+        assert_that(response.status_code, is_(401))
+        assert_that(response.headers['WWW-Authenticate'], contains_string('Basic'))
+        assert_that(self.client.get('/job/myJob/api/json', headers={'Authorization': wrong_credentials})
+                    .status_code, is_(401))
+        assert_that(self.client.get('/job/myJob/api/json', headers={'Authorization': credentials})
+                    .status_code, is_(200))
+        assert_that(self.client.get('/buildByToken/build?job=myJob&token=validToken').status_code, is_(200))
+
+    def test_crumbs(self):
+        self.api.auth.require_crumb = True
+
+        crumb = json.loads(self.client.get('/crumbIssuer/api/json').data)
+        assert_that(crumb, has_entries(crumbRequestField='Jenkins-Crumb', crumb=has_length(64)))
+
+        assert_that(self.client.post('/job/newJob').status_code, is_(403))
+        assert_that(self.client.post('/job/newJob', headers={'Jenkins-Crumb': 'forged'}).status_code, is_(403))
+        assert_that(self.client.post('/job/newJob', headers={'Jenkins-Crumb': crumb['crumb']}).status_code,
+                    is_(201))
+
+    def test_build_returns_the_queue_item_location(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token='validToken')
+
+        response = self.client.get('/buildByToken/build?job=myJob&token=validToken')
+
+        assert_that(response.headers['Location'], is_('http://localhost/queue/item/1/'))
+
+    def test_get_queue_item(self):
+        job = Job(name='myJob', auth_token='validToken', parameters=[BuildParameter(name='hello', default_value='')])
+        self.core.get_job.return_value = job
+        self.client.get('/buildByToken/buildWithParameters?job=myJob&token=validToken&hello=you')
+
+        response = self.client.get('/queue/item/1/api/json')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(json.loads(response.data), has_entries(
+            id=1,
+            task=has_entries(name='myJob'),
+            params='\nhello=you',
+            cancelled=False,
+            executable=has_entries(number=1, url='http://localhost/job/myJob/1/')))
+
+    def test_get_pending_queue_item(self):
+        self.core.queue = BuildQueue(executors=0)
+        self.core.get_job.return_value = Job(name='myJob', auth_token='validToken')
+        self.client.get('/buildByToken/build?job=myJob&token=validToken')
+
+        item = json.loads(self.client.get('/queue/item/1/api/json').data)
+        items = json.loads(self.client.get('/queue/api/json').data)['items']
+
+        assert_that(item, has_entries(buildable=True, why='Waiting for next available executor'))
+        assert_that(item, is_(not_(has_key('executable'))))
+        assert_that(items, contains(has_entries(id=1)))
+
+    def test_cancel_queue_item(self):
+        self.core.queue = BuildQueue(executors=0)
+        self.core.get_job.return_value = Job(name='myJob', auth_token='validToken')
+        self.client.get('/buildByToken/build?job=myJob&token=validToken')
+
+        response = self.client.post('/queue/cancelItem?id=1')
+
+        assert_that(response.status_code, is_(204))
+        assert_that(json.loads(self.client.get('/queue/item/1/api/json').data), has_entries(cancelled=True))
+
+    def test_snapshot_and_restore(self):
+        assert_that(self.client.post('/snapshot').status_code, is_(204))
+        self.core.snapshot.assert_called_with()
+
+        assert_that(self.client.post('/snapshot/restore').status_code, is_(204))
+        self.core.restore.assert_called_with()
+
+    def test_restore_errors(self):
+        self.core.restore.side_effect = SnapshotNotFound
+        assert_that(self.client.post('/snapshot/restore').status_code, is_(404))
+
+        self.core.snapshot.side_effect = UnsupportedOperation('not supported')
+        response = self.client.post('/snapshot')
+        assert_that(response.status_code, is_(400))
+        assert_that(response.data, is_(b'not supported'))
+
+    def test_get_queue_item_does_not_exist(self):
+        response = self.client.get('/queue/item/42/api/json')
+        assert_that(response.status_code, is_(404))
+
     def test_build_invalid_token(self):
         self.core.get_job.return_value = Job(name='myJob', auth_token='validToken')
 
@@ -70,6 +300,8 @@ class FakeJenkinsServerTest(unittest.TestCase):
         job_mock.name = 'myJob'
         job_mock.auth_token = 'validToken'
         job_mock.parameters = [BuildParameter(name='hello', default_value='')]
+        job_mock.multibranch = False
+        job_mock.rate_limit = None
         self.core.get_job.return_value = job_mock
 
         response = self.client.get('/buildByToken/buildWithParameters?job=myJob&token=validToken&hello=you')
@@ -107,6 +339,53 @@ class FakeJenkinsServerTest(unittest.TestCase):
         response = self.client.get('/job/missingJob/api/json')
         assert_that(response.status_code, is_(404))
 
+    def test_get_job_in_a_folder(self):
+        job = Job(name='team/service/main', auth_token=None)
+        job.create_build()
+        self.core.get_job.return_value = job
+
+        response = self.client.get('/job/team/job/service/job/main/api/json')
+
+        self.core.get_job.assert_called_with('team/service/main')
+        assert_that(json.loads(response.data), has_entries(
+            name='main', fullName='team/service/main', url='http://localhost/job/team/job/service/job/main/',
+            lastBuild=has_entries(url='http://localhost/job/team/job/service/job/main/1/')))
+
+    def test_get_folder(self):
+        self.core.get_job.side_effect = JobNotFound
+        self.core.list_folder.side_effect = None
+        self.core.list_folder.return_value = ['team/service', 'team/tools']
+
+        response = self.client.get('/job/team/api/json')
+
+        self.core.list_folder.assert_called_with('team')
+        assert_that(json.loads(response.data), is_({
+            '_class': 'com.cloudbees.hudson.plugins.folder.Folder',
+            'name': 'team',
+            'fullName': 'team',
+            'url': 'http://localhost/job/team/',
+            'jobs': [{'name': 'service', 'url': 'http://localhost/job/team/job/service/'},
+                     {'name': 'tools', 'url': 'http://localhost/job/team/job/tools/'}],
+        }))
+
+    def test_get_multibranch_project(self):
+        self.core.get_job.return_value = Job(name='service', auth_token=None, multibranch=True)
+        self.core.list_folder.side_effect = None
+        self.core.list_folder.return_value = ['service/main']
+
+        response = self.client.get('/job/service/api/json?tree=_class,jobs[name]')
+
+        assert_that(json.loads(response.data), is_({
+            '_class': 'org.jenkinsci.plugins.workflow.multibranch.WorkflowMultiBranchProject',
+            'jobs': [{'name': 'main'}]}))
+
+    def test_multibranch_projects_are_not_built(self):
+        self.core.get_job.return_value = Job(name='service', auth_token='token', multibranch=True)
+
+        response = self.client.get('/buildByToken/build?job=service&token=token')
+
+        assert_that(response.status_code, is_(400))
+
     def test_get_job_with_builds(self):
         job = Job(name='myJob', auth_token=None)
         job.create_build()
@@ -116,12 +395,121 @@ class FakeJenkinsServerTest(unittest.TestCase):
         assert_that(builds, has_length(1))
         assert_that(builds, has_item(has_entries(number=equal_to(1), url=equal_to('http://localhost/job/myJob/1/'))))
 
+    def test_get_job_lists_newest_builds_first(self):
+        job = Job(name='myJob', auth_token=None)
+        for _ in range(3):
+            job.create_build()
+        self.core.get_job.return_value = job
+
+        decoded_response = json.loads(self.client.get('/job/myJob/api/json').data)
+
+        assert_that([b['number'] for b in decoded_response['builds']], contains(3, 2, 1))
+        assert_that(decoded_response, has_entries(url='http://localhost/job/myJob/',
+                                                  nextBuildNumber=4,
+                                                  lastBuild=has_entries(number=3)))
+
+    def test_get_job_without_builds_has_no_last_build(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token=None)
+
+        decoded_response = json.loads(self.client.get('/job/myJob/api/json').data)
+
+        assert_that(decoded_response, has_entries(lastBuild=none(), nextBuildNumber=1))
+
+    def test_get_job_lists_at_most_100_builds_unless_all_builds_are_requested(self):
+        job = Job(name='myJob', auth_token=None)
+        for _ in range(150):
+            job.create_build()
+        self.core.get_job.return_value = job
+
+        builds = json.loads(self.client.get('/job/myJob/api/json').data)['builds']
+        all_builds = json.loads(self.client.get('/job/myJob/api/json?tree=allBuilds[number]').data)['allBuilds']
+
+        assert_that(builds, has_length(100))
+        assert_that(builds[-1], has_entry('number', 51))
+        assert_that(all_builds, has_length(150))
+
+    def test_get_job_with_tree(self):
+        job = Job(name='myJob', auth_token=None)
+        for _ in range(5):
+            job.create_build()
+        self.core.get_job.return_value = job
+
+        response = self.client.get('/job/myJob/api/json?tree=name,builds[number]{1,3}')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(json.loads(response.data), is_({'name': 'myJob',
+                                                    'builds': [{'number': 4}, {'number': 3}]}))
+
+    def test_get_job_with_invalid_tree(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token=None)
+
+        response = self.client.get('/job/myJob/api/json?tree=builds[number')
+
+        assert_that(response.status_code, is_(400))
+
+    def test_get_build_with_tree(self):
+        job_mock = mock.Mock()
+        job_mock.get_build.return_value = Build(1, parameters={'hello2': 'world2'})
+        self.core.get_job.return_value = job_mock
+
+        response = self.client.get('/job/myJob/1/api/json?tree=actions[parameters[name]]')
+
+        assert_that(json.loads(response.data), is_({'actions': [{}, {'parameters': [{'name': 'hello2'}]}]}))
+
+    def test_get_job_response_is_cached_until_the_job_changes(self):
+        job = Job(name='myJob', auth_token=None)
+        job.create_build()
+        self.core.get_job.return_value = job
+
+        first = self.client.get('/job/myJob/api/json')
+        with mock.patch('fake_jenkins.api.job_to_api_dict') as job_to_api_dict:
+            second = self.client.get('/job/myJob/api/json')
+            assert_that(job_to_api_dict.called, is_(False))
+        job.create_build()
+        third = self.client.get('/job/myJob/api/json')
+
+        assert_that(second.data, is_(first.data))
+        assert_that(json.loads(third.data)['builds'], has_length(2))
+        assert_that(third.headers['ETag'], is_(not_(first.headers['ETag'])))
+
+    def test_get_job_with_matching_etag_is_not_modified(self):
+        self.core.get_job.return_value = Job(name='myJob', auth_token=None)
+        etag = self.client.get('/job/myJob/api/json').headers['ETag']
+
+        response = self.client.get('/job/myJob/api/json', headers={'If-None-Match': etag})
+
+        assert_that(response.status_code, is_(304))
+        assert_that(response.data, is_(''))
+
+    def test_get_build_with_matching_etag_is_not_modified(self):
+        job = Job(name='myJob', auth_token=None)
+        job.create_build()
+        self.core.get_job.return_value = job
+        etag = self.client.get('/job/myJob/1/api/json').headers['ETag']
+
+        response = self.client.get('/job/myJob/1/api/json', headers={'If-None-Match': etag})
+
+        assert_that(response.status_code, is_(304))
+
     def test_create_job(self):
         response = self.client.post('/job/newJob')
         assert_that(response.status_code, is_(201))
 
         self.core.create_job.assert_called_with(name='newJob')
 
+    def test_create_job_in_a_folder(self):
+        response = self.client.post('/job/team/job/newJob')
+        assert_that(response.status_code, is_(201))
+
+        self.core.create_job.assert_called_with(name='team/newJob')
+
+    def test_create_job_with_an_invalid_name(self):
+        self.core.create_job.side_effect = InvalidJobName('team is a job, not a folder')
+        response = self.client.post('/job/team/job/newJob')
+
+        assert_that(response.status_code, is_(400))
+        assert_that(response.data, is_('team is a job, not a folder'))
+
     def test_create_job_with_auth_token(self):
         response = self.client.post('/job/newJob', data=json.dumps({
             'auth_token': 'myToken'
@@ -144,9 +532,68 @@ class FakeJenkinsServerTest(unittest.TestCase):
         assert_that(self.core.create_job.call_args[1]['parameters'][0], has_properties(name='hello', default_value='world'))
 
 
+    def test_create_job_with_retention(self):
+        response = self.client.post('/job/newJob', data=json.dumps({
+            'max_builds': 10,
+            'max_build_age': 3600
+        }))
+        assert_that(response.status_code, is_(201))
+
+        self.core.create_job.assert_called_with(name='newJob', max_builds=10, max_build_age=3600)
+
+    def test_create_job_with_invalid_options(self):
+        response = self.client.post('/job/newJob', data=json.dumps({'max_builds': 'many'}))
+
+        assert_that(response.status_code, is_(400))
+        assert_that(self.core.create_job.called, is_(False))
+
+    def test_create_job_with_an_invalid_body(self):
+        for data in ('{"max_builds":', '5', '[]', b'{"auth_token": "\xff"}'):
+            response = self.client.post('/job/newJob', data=data)
+
+            assert_that(response.status_code, is_(400))
+        assert_that(self.core.create_job.called, is_(False))
+
+    def test_create_jobs(self):
+        response = self.client.post('/jobs', data=json.dumps({'jobs': [
+            {'name': 'first', 'auth_token': 'myToken'},
+            {'name': 'second', 'parameters': [{'name': 'hello', 'default_value': 'world'}]},
+        ]}))
+        assert_that(response.status_code, is_(201))
+
+        specs = self.core.create_jobs.call_args[0][0]
+        assert_that(specs[0], is_({'name': 'first', 'auth_token': 'myToken'}))
+        assert_that(specs[1]['parameters'][0], has_properties(name='hello', default_value='world'))
+
+    def test_create_jobs_from_invalid_utf8(self):
+        response = self.client.post('/jobs', data=b'[{"name": "\xff"}]')
+
+        assert_that(response.status_code, is_(400))
+        assert_that(response.data, contains_string('UTF-8'))
+
+    def test_create_jobs_rejects_the_whole_batch_when_a_job_is_invalid(self):
+        response = self.client.post('/jobs', data=json.dumps([
+            {'name': 'first'},
+            {'name': 'second', 'duration': [20, 10]},
+        ]))
+
+        assert_that(response.status_code, is_(400))
+        assert_that(response.data, contains_string('jobs[1].duration'))
+        assert_that(self.core.create_jobs.called, is_(False))
+
+    def test_create_job_with_simulated_builds(self):
+        response = self.client.post('/job/newJob', data=json.dumps({
+            'duration': [10, 20],
+            'outcomes': {'SUCCESS': 9, 'FAILURE': 1}
+        }))
+        assert_that(response.status_code, is_(201))
+
+        self.core.create_job.assert_called_with(name='newJob', duration=[10, 20],
+                                                outcomes={'SUCCESS': 9, 'FAILURE': 1})
+
     def test_get_build(self):
         job_mock = mock.Mock()
-        job_mock.get_build.return_value = Build(1, parameters={'hello2': 'world2'})
+        job_mock.get_build.return_value = Build(1, parameters={'hello2': 'world2'}, timestamp=1234.5)
         self.core.get_job.return_value = job_mock
 
         response = self.client.get('/job/{job}/{build}/api/json'.format(job='myJob', build=1))
@@ -157,10 +604,54 @@ class FakeJenkinsServerTest(unittest.TestCase):
 
         decoded_response = json.loads(response.data)
 
+        assert_that(decoded_response, has_entries(number=1, timestamp=1234500, building=False, result='SUCCESS'))
         assert_that(decoded_response, has_entry('actions', has_item(has_entry('causes', has_item(has_key('shortDescription'))))))
         assert_that(decoded_response, has_entry('actions', has_item(has_entry('parameters', has_item(has_entry('name', 'hello2'))))))
         assert_that(decoded_response, has_entry('actions', has_item(has_entry('parameters', has_item(has_entry('value', 'world2'))))))
 
+    def test_get_progressive_text(self):
+        job = Job(name='myJob', auth_token=None, console=['hello'])
+        job.create_build()
+        self.core.get_job.return_value = job
+
+        response = self.client.get('/job/myJob/1/logText/progressiveText?start=23')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(response.data, is_('hello\nFinished: SUCCESS\n'))
+        assert_that(response.headers['X-Text-Size'], is_('47'))
+        assert_that(response.headers.get('X-More-Data'), is_(none()))
+
+    def test_get_progressive_text_from_an_invalid_offset(self):
+        job = Job(name='myJob', auth_token=None, console=['hello'])
+        job.create_build()
+        self.core.get_job.return_value = job
+
+        for start in ('-5', 'abc'):
+            response = self.client.get('/job/myJob/1/logText/progressiveText?start=' + start)
+
+            assert_that(response.status_code, is_(400))
+
+    def test_get_progressive_text_of_a_running_build(self):
+        job = Job(name='myJob', auth_token=None)
+        job.create_build().building = True
+        self.core.get_job.return_value = job
+
+        response = self.client.get('/job/myJob/1/logText/progressiveText')
+
+        assert_that(response.data, is_('Started by remote host\n'))
+        assert_that(response.headers['X-Text-Size'], is_('23'))
+        assert_that(response.headers['X-More-Data'], is_('true'))
+
+    def test_get_console_text(self):
+        job = Job(name='myJob', auth_token=None, console=['x' * 100000])
+        job.create_build()
+        self.core.get_job.return_value = job
+
+        response = self.client.get('/job/myJob/1/consoleText')
+
+        assert_that(response.status_code, is_(200))
+        assert_that(response.data, is_('Started by remote host\n' + 'x' * 100000 + '\nFinished: SUCCESS\n'))
+
     def test_get_build_job_does_not_exist(self):
         self.core.get_job.side_effect = JobNotFound
         response = self.client.get('/job/missingJob/1/api/json')
@@ -172,3 +663,93 @@ class FakeJenkinsServerTest(unittest.TestCase):
         self.core.get_job.return_value = job_mock
         response = self.client.get('/job/myJob/42/api/json')
         assert_that(response.status_code, is_(404))
+
+
+class ListingTest(unittest.TestCase):
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.client = self.app.test_client()
+        self.core = Core(views={'services': '.*-service'})
+        api.Api(self.core).hook_to(self.app)
+
+    def test_get_root(self):
+        self.core.create_jobs([{'name': 'a-service'}, {'name': 'team/b-service'}])
+        self.core.get_job('a-service').create_build()
+
+        response = self.client.get('/api/json')
+
+        assert_that(json.loads(response.data), has_entries(
+            _class='hudson.model.Hudson',
+            jobs=[{'_class': 'hudson.model.FreeStyleProject', 'name': 'a-service', 'fullName': 'a-service',
+                   'url': 'http://localhost/job/a-service/', 'color': 'blue'},
+                  {'_class': 'com.cloudbees.hudson.plugins.folder.Folder', 'name': 'team', 'fullName': 'team',
+                   'url': 'http://localhost/job/team/'}],
+            primaryView=has_entries(name='all', url='http://localhost/'),
+            views=contains(has_entries(name='all'), has_entries(name='services',
+                                                                url='http://localhost/view/services/'))))
+
+    def test_build_by_token_without_job_nor_token(self):
+        for endpoint in ('build', 'buildWithParameters'):
+            response = self.client.get('/buildByToken/' + endpoint)
+
+            assert_that(response.status_code, is_(404))
+
+    def test_get_view(self):
+        self.core.create_jobs([{'name': 'a-service'}, {'name': 'team/b-service'}, {'name': 'other'}])
+
+        response = self.client.get('/view/services/api/json?tree=name,jobs[name,color]')
+
+        assert_that(json.loads(response.data), is_({'name': 'services', 'jobs': [
+            {'name': 'a-service', 'color': 'notbuilt'}, {'name': 'b-service', 'color': 'notbuilt'}]}))
+        assert_that(self.client.get('/view/missing/api/json').status_code, is_(404))
+
+    def test_listings_are_cached_until_a_job_changes(self):
+        self.core.create_job(name='a-service', outcomes={'FAILURE': 1})
+        etag = self.client.get('/view/services/api/json').headers['ETag']
+
+        response = self.client.get('/view/services/api/json', headers={'If-None-Match': etag})
+        assert_that(response.status_code, is_(304))
+
+        self.core.get_job('a-service').create_build()
+        response = self.client.get('/view/services/api/json', headers={'If-None-Match': etag})
+        assert_that(response.status_code, is_(200))
+        assert_that(json.loads(response.data)['jobs'][0], has_entries(color='red'))
+
+    def test_create_view(self):
+        self.core.create_job(name='other')
+
+        assert_that(self.client.post('/view/others', data=json.dumps({'include_regex': 'oth.*'})).status_code,
+                    is_(201))
+        assert_that(self.client.post('/view/broken', data=json.dumps({'include_regex': '('})).status_code, is_(400))
+        assert_that(self.client.post('/view/broken', data=json.dumps({})).status_code, is_(400))
+        assert_that(self.client.post('/view/broken', data='{"include_regex":').status_code, is_(400))
+        assert_that(self.client.post('/view/broken', data='["oth.*"]').status_code, is_(400))
+
+        response = self.client.get('/view/others/api/json')
+        assert_that(json.loads(response.data), has_entries(_class='hudson.model.ListView',
+                                                           jobs=contains(has_entries(name='other'))))
+
+
+class TreeTest(unittest.TestCase):
+    def test_parse_tree(self):
+        tree = api.parse_tree('name,builds[number,url]{0,10},lastBuild[number]')
+
+        assert_that(list(tree), contains('name', 'builds', 'lastBuild'))
+        assert_that(tree['name'], has_properties(tree=None, range=None))
+        assert_that(list(tree['builds'].tree), contains('number', 'url'))
+        assert_that(tree['builds'].range, is_((0, 10)))
+
+    def test_parse_tree_ranges(self):
+        assert_that(api.parse_tree('builds{5,}')['builds'].range, is_((5, None)))
+        assert_that(api.parse_tree('builds{,5}')['builds'].range, is_((0, 5)))
+        assert_that(api.parse_tree('builds{3}')['builds'].range, is_((3, 4)))
+
+    def test_parse_invalid_tree(self):
+        for expression in ['', 'builds[number', 'builds]', 'builds{a}', 'builds{}', 'name,']:
+            with self.assertRaises(api.InvalidTree):
+                api.parse_tree(expression)
+
+    def test_apply_tree(self):
+        value = {'a': [{'b': 1, 'c': 2}, {'b': 3, 'c': 4}], 'd': 5}
+
+        assert_that(api.apply_tree(value, api.parse_tree('a[b]{1,},e')), is_({'a': [{'b': 3}]}))
@@ -0,0 +1,73 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fake_jenkins.auth import check_token, hash_token, TokenIndex, Authenticator
+from hamcrest import assert_that, is_, none, starts_with
+
+
+class AuthTest(unittest.TestCase):
+    def test_check_token(self):
+        assert_that(check_token('token', 'token'), is_(True))
+        assert_that(check_token('token', u'token'), is_(True))
+        assert_that(check_token('token', 'other'), is_(False))
+        assert_that(check_token('token', None), is_(False))
+        assert_that(check_token(None, None), is_(True))
+        assert_that(check_token(None, 'token'), is_(False))
+
+    def test_check_hashed_token(self):
+        hashed = hash_token('token')
+
+        assert_that(hashed, starts_with('sha256:'))
+        assert_that(check_token(hashed, 'token'), is_(True))
+        assert_that(check_token(hashed, hashed), is_(False))
+
+    def test_token_index(self):
+        index = TokenIndex()
+        index.set('first', 'one')
+        index.set('second', hash_token('two'))
+        index.set('third', 'shared')
+        index.set('fourth', 'shared')
+
+        assert_that(index.find('one'), is_('first'))
+        assert_that(index.find('two'), is_('second'))
+        assert_that(index.find(hash_token('two')), none())
+        assert_that(index.find('shared'), none())
+        assert_that(index.find('unknown'), none())
+
+    def test_token_index_forgets_replaced_tokens(self):
+        index = TokenIndex()
+        index.set('first', 'one')
+        index.set('first', 'two')
+
+        assert_that(index.find('one'), none())
+        assert_that(index.find('two'), is_('first'))
+
+    def test_users(self):
+        auth = Authenticator(users={'alice': 'secret', 'bob': hash_token('api-token')})
+
+        assert_that(auth.check_user('alice', 'secret'), is_(True))
+        assert_that(auth.check_user('bob', 'api-token'), is_(True))
+        assert_that(auth.check_user('alice', 'wrong'), is_(False))
+        assert_that(auth.check_user('mallory', 'secret'), is_(False))
+
+    def test_crumbs_are_bound_to_the_client(self):
+        auth = Authenticator()
+        crumb = auth.crumb('10.0.0.1')
+
+        assert_that(auth.check_crumb('10.0.0.1', crumb), is_(True))
+        assert_that(auth.check_crumb('10.0.0.2', crumb), is_(False))
+        assert_that(auth.check_crumb('10.0.0.1', None), is_(False))
+        assert_that(Authenticator().check_crumb('10.0.0.1', crumb), is_(False))
@@ -0,0 +1,72 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fake_jenkins import bench
+from hamcrest import assert_that, is_, has_entries, has_key, greater_than, less_than, contains_string, has_length
+
+
+class BenchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_bench_in_process(self):
+        code = bench.main(['--duration', '0.5', '--concurrency', '2', '--output', self.output])
+
+        with open(self.output) as f:
+            results = json.load(f)
+        assert_that(code, is_(0))
+        assert_that(results, has_entries(server='in-process', concurrency=2))
+        for name in bench.ENDPOINTS:
+            assert_that(results['endpoints'][name], has_entries(requests=greater_than(0), errors=0))
+            assert_that(results['endpoints'][name], has_key('p99_ms'))
+        assert_that(results['total']['rps'], greater_than(0))
+
+    def test_parse_mix(self):
+        assert_that(bench.parse_mix('trigger=1,job=2.5'), is_({'trigger': 1, 'job': 2.5}))
+        with self.assertRaises(SystemExit):
+            bench.parse_args(['--mix', 'delete=1'])
+
+    def test_percentile(self):
+        assert_that(bench.percentile(list(range(1, 101)), 50), is_(50))
+        assert_that(bench.percentile(list(range(1, 101)), 99), is_(99))
+        assert_that(bench.percentile([], 99), is_(0))
+
+    def test_compare_reports_regressions(self):
+        baseline = {'endpoints': {'job': {'rps': 1000, 'p99_ms': 10}}}
+        results = {'endpoints': {'job': {'rps': 800, 'p99_ms': 10.5}}}
+
+        regressions = bench.compare(baseline, results, tolerance=0.1)
+
+        assert_that(regressions, has_length(1))
+        assert_that(regressions[0], contains_string('down from 1000'))
+
+    def test_memory_taken_by_builds(self):
+        code = bench.main(['--memory', '20000', '--output', self.output])
+
+        with open(self.output) as f:
+            results = json.load(f)
+        assert_that(code, is_(0))
+        assert_that(results, has_entries(builds=20000, parameters=3))
+        # A build with its attributes in a __dict__ took about 950 bytes
+        assert_that(results['bytes_per_build'], is_(less_than(900)))
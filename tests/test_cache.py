@@ -0,0 +1,51 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fake_jenkins.cache import ResponseCache
+from hamcrest import assert_that, is_, none, has_properties, has_length
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(size=2)
+
+    def test_get_missing_entry(self):
+        assert_that(self.cache.get('key', 1), is_(none()))
+
+    def test_get_entry_with_same_version(self):
+        self.cache.put('key', 1, b'body')
+
+        assert_that(self.cache.get('key', 1), has_properties(version=1, body=b'body'))
+
+    def test_get_entry_with_other_version(self):
+        self.cache.put('key', 1, b'body')
+
+        assert_that(self.cache.get('key', 2), is_(none()))
+
+    def test_etag_depends_on_body(self):
+        assert_that(self.cache.put('a', 1, b'body').etag, is_(self.cache.put('b', 1, b'body').etag))
+        assert_that(self.cache.put('a', 1, b'other').etag == self.cache.put('b', 1, b'body').etag, is_(False))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put('a', 1, b'a')
+        self.cache.put('b', 1, b'b')
+        self.cache.get('a', 1)
+
+        self.cache.put('c', 1, b'c')
+
+        assert_that(self.cache.entries, has_length(2))
+        assert_that(self.cache.get('b', 1), is_(none()))
+        assert_that(self.cache.get('a', 1), has_properties(body=b'a'))
@@ -0,0 +1,89 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fake_jenkins import replay
+from fake_jenkins.capture import read_capture
+from fake_jenkins.main import create_app, close_app
+from hamcrest import assert_that, is_, has_entries, contains, has_key, has_length
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.capture = os.path.join(self.directory, 'capture.jsonl')
+        self.app = create_app(capture_file=self.capture)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        close_app(self.app)
+        shutil.rmtree(self.directory)
+
+    def test_requests_are_captured_with_their_status_and_duration(self):
+        self.client.post('/job/my%20job', data=json.dumps({'auth_token': 'token'}),
+                         headers={'Content-Type': 'application/json'})
+        self.client.get('/buildByToken/build?job=my+job&token=token')
+        self.client.get('/job/missing/api/json')
+        self.app.wsgi_app.flush()
+
+        records = list(read_capture(self.capture))
+        assert_that(records, contains(
+            has_entries(method='POST', path='/job/my%20job', query='', body='{"auth_token": "token"}', status=201,
+                        headers=has_entries({'Content-Type': 'application/json'})),
+            has_entries(method='GET', path='/buildByToken/build', query='job=my+job&token=token', status=200),
+            has_entries(method='GET', path='/job/missing/api/json', body='', status=404)))
+        assert_that(records[0]['t'] <= records[1]['t'] <= records[2]['t'], is_(True))
+        assert_that(records[0], has_key('duration'))
+
+    def test_close_writes_what_is_left_and_stops_flushing(self):
+        self.client.get('/job/missing/api/json')
+        thread = self.app.wsgi_app.thread
+
+        self.app.wsgi_app.close()
+
+        assert_that(thread.is_alive(), is_(False))
+        assert_that(list(read_capture(self.capture)), has_length(1))
+
+    def test_replay_against_a_fresh_server(self):
+        self.client.post('/job/myJob', data=json.dumps({'auth_token': 'token'}))
+        for _ in range(3):
+            self.client.get('/buildByToken/build?job=myJob&token=token')
+        self.client.get('/job/myJob/3/api/json')
+        self.client.get('/job/myJob/4/api/json')
+        self.app.wsgi_app.flush()
+        output = os.path.join(self.directory, 'report.json')
+
+        code = replay.main([self.capture, '--speed', '0', '--concurrency', '1', '--output', output])
+
+        with open(output) as f:
+            report = json.load(f)
+        assert_that(code, is_(0))
+        assert_that(report, has_entries(requests=6, divergences=[]))
+        assert_that(report['endpoints']['GET /job/myJob/<n>/api/json'], has_entries(requests=2))
+
+    def test_compare_reports_divergences(self):
+        records = [{'method': 'GET', 'path': '/job/myJob/1/api/json', 'status': 200, 'duration': 0.001},
+                   {'method': 'GET', 'path': '/job/myJob/2/api/json', 'status': 200, 'duration': 0.003}]
+
+        report = replay.compare(records, [(200, 0.002), (404, 0.004)])
+
+        assert_that(report['divergences'], contains(has_entries(index=1, captured=200, replayed=404)))
+        assert_that(report['endpoints'], has_length(1))
+        assert_that(report['endpoints']['GET /job/myJob/<n>/api/json'], has_entries(
+            captured_p50_ms=1.0, replayed_p50_ms=2.0, change_p99_ms=1.0))
@@ -0,0 +1,50 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fake_jenkins.console import ConsoleLog
+from hamcrest import assert_that, is_, none, not_
+
+
+class ConsoleLogTest(unittest.TestCase):
+    def setUp(self):
+        self.log = ConsoleLog(spill_size=16)
+
+    def test_empty_log(self):
+        assert_that(self.log.read(), is_(b''))
+        assert_that(self.log.size, is_(0))
+
+    def test_read_from_offset(self):
+        self.log.write(b'hello ')
+        self.log.write(b'world')
+
+        assert_that(self.log.read(), is_(b'hello world'))
+        assert_that(self.log.read(3), is_(b'lo world'))
+        assert_that(self.log.read(6, 3), is_(b'wor'))
+        assert_that(self.log.read(11), is_(b''))
+        assert_that(self.log.size, is_(11))
+
+    def test_large_log_spills_to_a_file(self):
+        self.log.write(b'0123456789')
+        self.log.write(b'abcdefghij')
+
+        assert_that(self.log.file, is_(not_(none())))
+        assert_that(self.log.chunks, is_([]))
+        assert_that(self.log.read(8, 4), is_(b'89ab'))
+
+        self.log.write(b'KLMNOP')
+
+        assert_that(self.log.read(18), is_(b'ijKLMNOP'))
+        assert_that(self.log.size, is_(26))
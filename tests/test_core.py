@@ -12,11 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
 import unittest
 
+import mock
 from fake_jenkins import core
-from fake_jenkins.core import BuildParameter, JobNotFound, BuildNotFound, Job
-from hamcrest import assert_that, is_, has_entry, has_length
+from fake_jenkins.core import BuildParameter, JobNotFound, BuildNotFound, Job, BuildQueue, QueueItemNotFound, \
+    InvalidJobName, SnapshotNotFound
+from fake_jenkins.scheduler import Scheduler
+from hamcrest import assert_that, is_, has_entry, has_length, same_instance, has_properties, not_, all_of, \
+    greater_than_or_equal_to, less_than_or_equal_to, greater_than, less_than
+from tests.test_scheduler import FakeClock
 
 
 class CoreTest(unittest.TestCase):
@@ -36,10 +43,201 @@ class CoreTest(unittest.TestCase):
         assert_that(job.name, is_('test_job'))
         assert_that(job.auth_token, is_(None))
 
+    def test_create_builds_reserves_a_contiguous_block_of_numbers(self):
+        self.core.create_job(name='test_job', parameters=[BuildParameter(name='hello', default_value='')])
+        job = self.core.get_job('test_job')
+        job.create_build()
+
+        builds = job.create_builds([{'hello': 'world'}, {}])
+
+        assert_that([b.number for b in builds], is_([2, 3]))
+        assert_that(job.get_build(2).parameters, has_entry('hello', 'world'))
+        assert_that(job.get_build(3).parameters, has_entry('hello', ''))
+        assert_that(job.next_build_number, is_(4))
+
+    def test_wait_for_build(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        threading.Timer(0.1, job.create_build).start()
+
+        assert_that(job.wait_for_build(1, timeout=10), is_(True))
+        assert_that(job.wait_for_build(2, timeout=0.05), is_(False))
+
+    def test_job_events(self):
+        self.core.create_job(name='test_job')
+        self.core.create_job(name='other_job')
+        self.core.get_job('test_job').create_build()
+
+        events = self.core.events.wait('test_job', after=1, timeout=0)
+
+        assert_that([(e.event, e.number, e.building) for e in events],
+                    is_([('build_created', 1, False), ('build_completed', 1, False)]))
+        assert_that(self.core.events.wait('test_job', after=self.core.events.last_id, timeout=0.05), is_([]))
+
+    def test_jobs_in_folders(self):
+        c = core.Core(jobs={'team/configured': Job('team/configured', auth_token=None)})
+        c.create_jobs([{'name': 'team/service/main'}, {'name': 'team/service/release'}, {'name': 'other'}])
+
+        assert_that(c.get_job('team/service/main').name, is_('team/service/main'))
+        assert_that(c.list_folder(), is_(['other', 'team']))
+        assert_that(c.list_folder('team'), is_(['team/configured', 'team/service']))
+        assert_that(c.list_folder('team/service'), is_(['team/service/main', 'team/service/release']))
+        assert_that(c.find_jobs('team/serv'), is_(['team/service/main', 'team/service/release']))
+        assert_that(c.find_jobs('team/service/r'), is_(['team/service/release']))
+        assert_that(c.find_jobs(''), has_length(4))
+        with self.assertRaises(JobNotFound):
+            c.get_job('team')
+        with self.assertRaises(JobNotFound):
+            c.list_folder('other')
+
+    def test_jobs_and_folders_cannot_share_a_name(self):
+        self.core.create_jobs([{'name': 'team/service'}])
+
+        with self.assertRaises(InvalidJobName):
+            self.core.create_job(name='team')
+        with self.assertRaises(InvalidJobName):
+            self.core.create_job(name='team/service/main')
+        with self.assertRaises(InvalidJobName):
+            self.core.create_jobs([{'name': 'other'}, {'name': 'other/main'}])
+        with self.assertRaises(InvalidJobName):
+            self.core.create_job(name='team//service')
+        assert_that(self.core.find_jobs(''), is_(['team/service']))
+
+    def test_branches_of_a_multibranch_project_are_created_when_asked_for(self):
+        self.core.create_job(name='team/service', auth_token='token', multibranch=True,
+                             parameters=[BuildParameter(name='hello', default_value='world')])
+        assert_that(self.core.list_folder('team/service'), is_([]))
+
+        branch = self.core.get_job('team/service/feature-1')
+        branch.create_build()
+
+        assert_that(branch, has_properties(auth_token='token', multibranch=False))
+        assert_that(branch.get_build(1).parameters, has_entry('hello', 'world'))
+        assert_that(self.core.get_job('team/service/feature-1'), same_instance(branch))
+        assert_that(self.core.list_folder('team/service'), is_(['team/service/feature-1']))
+        assert_that(self.core.events.wait('team/service/feature-1', after=0, timeout=0)[0].event, is_('job_created'))
+        with self.assertRaises(JobNotFound):
+            self.core.get_job('team/service/feature-1/nested')
+        with self.assertRaises(InvalidJobName):
+            self.core.create_job(name='team/service')
+
+    def test_jobs_without_a_name_do_not_exist(self):
+        self.core.create_job(name='service', multibranch=True)
+
+        with self.assertRaises(JobNotFound):
+            self.core.get_job(None)
+
+    def test_find_job_by_token(self):
+        c = core.Core(jobs={'myJob': Job('myJob', auth_token='yes')})
+        c.create_job(name='test_job', auth_token='token')
+        c.create_job(name='test_job', auth_token='new_token')
+
+        assert_that(c.find_job_by_token('yes').name, is_('myJob'))
+        assert_that(c.find_job_by_token('new_token').name, is_('test_job'))
+        with self.assertRaises(JobNotFound):
+            c.find_job_by_token('token')
+
     def test_job_doesnt_exist(self):
         with self.assertRaises(JobNotFound):
             self.core.get_job('test_job')
 
+    def test_restore_undoes_changes_since_the_snapshot(self):
+        self.core.create_job(name='kept', auth_token='kept', max_builds=2)
+        self.core.create_job(name='replaced', auth_token='before')
+        kept = self.core.get_job('kept')
+        kept.create_build()
+        kept.create_build()
+        replaced = self.core.get_job('replaced')
+
+        self.core.snapshot()
+        kept.create_builds([{}, {}, {}])
+        kept.get_builds()
+        self.core.create_job(name='replaced', auth_token='after')
+        self.core.create_job(name='team/new', auth_token='new')
+        self.core.restore()
+
+        assert_that([build.number for build in kept.get_builds()], is_([2, 1]))
+        assert_that(kept.next_build_number, is_(3))
+        assert_that(self.core.get_job('replaced'), same_instance(replaced))
+        assert_that(self.core.find_job_by_token('before'), same_instance(replaced))
+        with self.assertRaises(JobNotFound):
+            self.core.find_job_by_token('after')
+        with self.assertRaises(JobNotFound):
+            self.core.get_job('team/new')
+        assert_that(self.core.list_folder(''), is_(['kept', 'replaced']))
+        with self.assertRaises(JobNotFound):
+            self.core.list_folder('team')
+
+    def test_restore_can_be_repeated_until_the_next_snapshot(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        self.core.snapshot()
+
+        job.create_build()
+        self.core.restore()
+        job.create_build()
+        self.core.restore()
+
+        assert_that(job.get_builds(), is_([]))
+        assert_that(job.create_build().number, is_(1))
+
+    def test_builds_rolled_back_while_running_are_gone_for_good(self):
+        clock = FakeClock()
+        c = core.Core(scheduler=Scheduler(clock=clock), executors=1)
+        c.create_job(name='test_job', duration=4)
+        job = c.get_job('test_job')
+        c.snapshot()
+
+        c.queue.schedule(job)
+        clock.now += 2
+        c.restore()
+        again = c.queue.schedule(job)
+        waiting = c.queue.schedule(job)
+        clock.now += 2
+        c.scheduler.run_pending()
+
+        assert_that(job.get_build(1), same_instance(again.executable))
+        assert_that(job.get_build(1), has_properties(building=True, result=None))
+        assert_that(waiting.executable, is_(None))
+
+        clock.now += 2
+        c.scheduler.run_pending()
+
+        assert_that(job.get_build(1), has_properties(building=False, result='SUCCESS'))
+        assert_that(waiting.executable, has_properties(number=2))
+
+    def test_builds_running_since_before_the_snapshot_keep_their_executor(self):
+        clock = FakeClock()
+        c = core.Core(scheduler=Scheduler(clock=clock), executors=1)
+        c.create_job(name='test_job', duration=4)
+        job = c.get_job('test_job')
+        c.queue.schedule(job)
+        c.snapshot()
+
+        c.restore()
+        waiting = c.queue.schedule(job)
+
+        assert_that(waiting.executable, is_(None))
+
+        clock.now += 4
+        c.scheduler.run_pending()
+
+        assert_that(waiting.executable, has_properties(number=2))
+
+    def test_restore_without_snapshot(self):
+        with self.assertRaises(SnapshotNotFound):
+            self.core.restore()
+
+    def test_create_jobs_in_one_batch(self):
+        seen = []
+        self.core.listeners.append(lambda event, job, build: seen.append((job.name, len(self.core.jobs))))
+
+        self.core.create_jobs([{'name': 'first', 'auth_token': 'yes'}, {'name': 'second', 'max_builds': 3}])
+
+        assert_that(self.core.get_job('first').auth_token, is_('yes'))
+        assert_that(self.core.get_job('second'), has_properties(auth_token=None, max_builds=3))
+        assert_that(seen, is_([('first', 0), ('second', 0)]))
+
     def test_job_with_token(self):
         self.core.create_job(name='test_job_with_token', auth_token='myToken')
 
@@ -75,6 +273,24 @@ class CoreTest(unittest.TestCase):
         assert_that(build.parameters, has_length(1))
         assert_that(build.parameters, has_entry('hello', 'world'))
 
+    def test_builds_share_parameter_names_and_defaults(self):
+        self.core.create_job(name='test_job', parameters=[BuildParameter(name='hello',
+                                                                         default_value='world')])
+        job = self.core.get_job('test_job')
+
+        first = job.create_build()
+        second = job.create_build(hello='you')
+
+        assert_that(first.parameter_names, is_(same_instance(second.parameter_names)))
+        assert_that(first.parameter_values[0], is_(same_instance(job.parameters[0].default_value)))
+        assert_that(hasattr(first, '__dict__'), is_(False))
+
+    def test_build_from_parameters_dict(self):
+        build = core.Build(1, parameters={'hello': 'world'})
+
+        assert_that(build.parameters, is_({'hello': 'world'}))
+        assert_that(build.parameter_names, is_(same_instance(core.Build(2, parameters={'hello': 'you'}).parameter_names)))
+
     def test_build_with_parameters_fallback_to_defaults(self):
         self.core.create_job(name='test_job', parameters=[BuildParameter(name='hello',
                                                                          default_value='')])
@@ -105,9 +321,273 @@ class CoreTest(unittest.TestCase):
 
         new_build = job.get_build(build_number)
 
+    def test_job_get_builds_newest_first(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        for _ in range(5):
+            job.create_build()
+
+        assert_that([b.number for b in job.get_builds()], is_([5, 4, 3, 2, 1]))
+        assert_that([b.number for b in job.get_builds(1, 3)], is_([4, 3]))
+        assert_that([b.number for b in job.get_builds(4)], is_([1]))
+
+    def test_job_last_build(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        assert_that(job.last_build, is_(None))
+
+        job.create_build()
+        build = job.create_build()
+
+        assert_that(job.last_build, is_(build))
+
+    def test_job_keeps_at_most_max_builds(self):
+        self.core.create_job(name='test_job', max_builds=10)
+        job = self.core.get_job('test_job')
+
+        for _ in range(1000):
+            job.create_build()
+
+        assert_that(job.builds, has_length(10))
+        assert_that([b.number for b in job.get_builds()], is_(list(range(1000, 990, -1))))
+        with self.assertRaises(BuildNotFound):
+            job.get_build(990)
+
+    @mock.patch('time.time')
+    def test_job_discards_builds_older_than_max_build_age(self, time_mock):
+        self.core.create_job(name='test_job', max_build_age=60)
+        job = self.core.get_job('test_job')
+
+        time_mock.return_value = 1000
+        job.create_build()
+        time_mock.return_value = 1030
+        job.create_build()
+
+        time_mock.return_value = 1061
+        with self.assertRaises(BuildNotFound):
+            job.get_build(1)
+        assert_that(job.get_build(2).number, is_(2))
+        assert_that([b.number for b in job.get_builds()], is_([2]))
+        assert_that(job.builds, has_length(1))
+
+    def test_build_without_duration_completes_immediately(self):
+        self.core.create_job(name='test_job')
+
+        build = self.core.get_job('test_job').create_build()
+
+        assert_that(build, has_properties(building=False, result='SUCCESS', duration=0))
+
+    def test_build_runs_for_the_job_duration(self):
+        clock = FakeClock()
+        c = core.Core(scheduler=Scheduler(clock=clock))
+        c.create_job(name='test_job', duration=30, outcomes={'FAILURE': 1})
+        job = c.get_job('test_job')
+        version = job.version
+
+        build = job.create_build()
+        assert_that(build, has_properties(building=True, result=None))
+
+        clock.now += 30
+        c.scheduler.run_pending()
+
+        assert_that(job.get_build(1), has_properties(building=False, result='FAILURE', duration=30))
+        assert_that(job.version, is_(not_(version)))
+
+    def test_build_duration_can_be_a_range(self):
+        self.core.create_job(name='test_job', duration=(5, 10))
+
+        build = self.core.get_job('test_job').create_build()
+
+        assert_that(build.duration, is_(all_of(greater_than_or_equal_to(5), less_than_or_equal_to(10))))
+
+    def test_build_results_follow_outcome_weights(self):
+        self.core.create_job(name='test_job', outcomes={'SUCCESS': 3, 'FAILURE': 1})
+        job = self.core.get_job('test_job')
+
+        results = [job.create_build().result for _ in range(400)]
+
+        assert_that(results.count('FAILURE'), is_(all_of(greater_than(50), less_than(150))))
+        assert_that(results.count('SUCCESS') + results.count('FAILURE'), is_(400))
+
+    def test_discarded_build_stays_discarded_when_completed(self):
+        clock = FakeClock()
+        c = core.Core(scheduler=Scheduler(clock=clock))
+        c.create_job(name='test_job', duration=30, max_builds=1)
+        job = c.get_job('test_job')
+        job.create_build()
+        job.create_build()
+
+        clock.now += 30
+        c.scheduler.run_pending()
+
+        assert_that(list(job.builds), is_([2]))
+
+    def test_build_console_defaults_to_start_and_result(self):
+        self.core.create_job(name='test_job', outcomes={'FAILURE': 1})
+
+        build = self.core.get_job('test_job').create_build()
+
+        assert_that(build.read_console(), is_((b'Started by remote host\nFinished: FAILURE\n', 41)))
+        assert_that(build.read_console(23, 8), is_((b'Finished', 41)))
+
+    def test_build_console_is_written_while_building(self):
+        clock = FakeClock()
+        c = core.Core(scheduler=Scheduler(clock=clock))
+        c.create_job(name='test_job', duration=10, console=['line {0}'.format(i) for i in range(5)], console_rate=2)
+        build = c.get_job('test_job').create_build()
+
+        assert_that(build.read_console()[0], is_(b'Started by remote host\n'))
+        clock.now += 1
+        c.scheduler.run_pending()
+        assert_that(build.read_console()[0], is_(b'Started by remote host\nline 0\nline 1\n'))
+
+        clock.now += 9
+        c.scheduler.run_pending()
+        assert_that(build.read_console()[0], is_(b'Started by remote host\nline 0\nline 1\nline 2\nline 3\n'
+                                                 b'line 4\nFinished: SUCCESS\n'))
+
+    def test_build_console_from_a_generator(self):
+        self.core.create_job(name='test_job', console=lambda build: ('build {0}'.format(build.number),))
+
+        build = self.core.get_job('test_job').create_build()
+
+        assert_that(build.read_console()[0], is_(b'Started by remote host\nbuild 1\nFinished: SUCCESS\n'))
+
     def test_job_get_build_not_found(self):
         self.core.create_job(name='test_job')
         job = self.core.get_job('test_job')
 
         with self.assertRaises(BuildNotFound):
             job.get_build(42)
+
+    def test_concurrent_builds_are_numbered_without_gaps(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        numbers = []
+
+        def trigger():
+            for _ in range(250):
+                numbers.append(job.create_build().number)
+
+        threads = [threading.Thread(target=trigger) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_that(sorted(numbers), is_(list(range(1, 4001))))
+        assert_that(job.builds, has_length(4000))
+        assert_that(job.next_build_number, is_(4001))
+
+
+class BuildQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.core = core.Core(scheduler=Scheduler(clock=self.clock), executors=2)
+        self.core.create_job(name='test_job', duration=10,
+                             parameters=[BuildParameter(name='hello', default_value='')])
+        self.job = self.core.get_job('test_job')
+
+    def test_schedule_creates_build_when_an_executor_is_free(self):
+        item = self.core.queue.schedule(self.job, {'hello': 'you'})
+
+        assert_that(item.executable, has_properties(number=1, parameters={'hello': 'you'}))
+        assert_that(self.core.queue.get_item(item.id), is_(item))
+
+    def test_items_wait_for_a_free_executor(self):
+        items = [self.core.queue.schedule(self.job) for _ in range(3)]
+
+        assert_that([item.executable is None for item in items], is_([False, False, True]))
+        assert_that(self.core.queue.get_pending_items(), is_([items[2]]))
+
+        self.clock.now += 10
+        self.core.scheduler.run_pending()
+
+        assert_that(items[2].executable, has_properties(number=3))
+        assert_that(self.core.queue.get_pending_items(), is_([]))
+
+    def test_builds_completing_while_being_dispatched_free_their_executor(self):
+        self.core.queue.executors = 1
+        self.core.queue.running = CompletingBuildsOnAdd(self.job)
+
+        items = [self.core.queue.schedule(self.job) for _ in range(2)]
+
+        for _ in range(100):
+            if items[1].executable is not None:
+                break
+            time.sleep(0.05)
+        assert_that(items[1].executable, has_properties(number=2))
+
+    def test_builds_of_a_recreated_job_hold_their_own_executor(self):
+        self.core.queue.schedule(self.job)
+        self.core.create_job(name='test_job', duration=20)
+        second = self.core.queue.schedule(self.core.get_job('test_job'))
+        third = self.core.queue.schedule(self.core.get_job('test_job'))
+
+        assert_that(second.executable, has_properties(number=1, building=True))
+        assert_that(third.executable, is_(None))
+
+        self.clock.now += 10
+        self.core.scheduler.run_pending()
+
+        assert_that(third.executable, has_properties(number=2))
+        assert_that(self.core.get_job('test_job').get_build(1), has_properties(building=True))
+
+    def test_builds_discarded_while_running_give_their_executor_back(self):
+        self.core.create_job(name='test_job', duration=10, max_builds=1)
+        job = self.core.get_job('test_job')
+        self.core.queue.schedule(job)
+        self.core.queue.schedule(job)
+
+        self.clock.now += 10
+        self.core.scheduler.run_pending()
+        items = [self.core.queue.schedule(job) for _ in range(2)]
+
+        assert_that([item.executable.number for item in items], is_([3, 4]))
+
+    def test_items_are_dispatched_by_priority_then_in_order(self):
+        queue = BuildQueue(executors=0)
+        low = queue.schedule(self.job, priority=5)
+        first = queue.schedule(self.job)
+        second = queue.schedule(self.job)
+
+        queue.executors = 3
+        queue._dispatch()
+
+        assert_that([item.executable.number for item in (first, second, low)], is_([1, 2, 3]))
+
+    def test_cancelled_items_are_not_built(self):
+        queue = BuildQueue(executors=0)
+        item = queue.schedule(self.job)
+
+        queue.cancel(item.id)
+        queue.executors = 1
+        queue._dispatch()
+
+        assert_that(item, has_properties(cancelled=True, executable=None))
+        assert_that(self.job.builds, has_length(0))
+
+    def test_get_item_not_found(self):
+        with self.assertRaises(QueueItemNotFound):
+            self.core.queue.get_item(42)
+
+    def test_many_pending_items(self):
+        queue = BuildQueue(executors=0)
+        for i in range(100000):
+            queue.schedule(self.job, priority=i % 7)
+
+        assert_that(queue.pending, has_length(100000))
+        assert_that(queue.get_item(100000).priority, is_(99999 % 7))
+
+
+class CompletingBuildsOnAdd(set):
+    # Builds complete on another thread right before the queue records them as running
+    def __init__(self, job):
+        set.__init__(self)
+        self.job = job
+
+    def add(self, build):
+        thread = threading.Thread(target=self.job._complete_build, args=(build, 0))
+        thread.start()
+        thread.join(0.2)
+        set.add(self, build)
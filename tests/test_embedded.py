@@ -0,0 +1,65 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import requests
+from fake_jenkins.core import Job
+from fake_jenkins.embedded import FakeJenkins
+from hamcrest import assert_that, is_, has_entry
+
+
+class FakeJenkinsTest(unittest.TestCase):
+    def test_serves_on_an_ephemeral_port(self):
+        with FakeJenkins(config={'FAKE_JENKINS_JOBS': {'myJob': Job('myJob', auth_token='token')}}) as jenkins:
+            assert_that(jenkins.ready.is_set(), is_(True))
+
+            response = requests.get('{0}buildByToken/build?job=myJob&token=token'.format(jenkins.url))
+            assert_that(response.status_code, is_(200))
+            assert_that(jenkins.core.get_job('myJob').next_build_number, is_(2))
+
+        # A request rather than a bare connection, which can land on itself once the port is free
+        with self.assertRaises(requests.ConnectionError):
+            requests.get(jenkins.url, timeout=1)
+
+    def test_client_without_sockets(self):
+        with FakeJenkins() as jenkins:
+            client = jenkins.client()
+            assert_that(client.post('/job/myJob').status_code, is_(201))
+
+            response = client.get('/job/myJob/api/json')
+
+            assert_that(json.loads(response.data.decode('utf-8')), has_entry('name', 'myJob'))
+
+    def test_instances_are_independent(self):
+        with FakeJenkins() as first, FakeJenkins() as second:
+            first.client().post('/job/myJob')
+
+            assert_that(second.client().get('/job/myJob/api/json').status_code, is_(404))
+            assert_that(first.port == second.port, is_(False))
+
+    def test_stop_ends_background_threads(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        threads = threading.active_count()
+
+        for _ in range(2):
+            with FakeJenkins(state_dir=directory) as jenkins:
+                assert_that(requests.post('{0}job/myJob'.format(jenkins.url)).status_code, is_(201))
+
+        assert_that(threading.active_count(), is_(threads))
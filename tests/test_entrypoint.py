@@ -16,6 +16,8 @@ import random
 import time
 
 import os
+import shutil
+import tempfile
 import unittest
 
 import subprocess
@@ -24,13 +26,23 @@ import sys
 
 import pkg_resources
 import requests
-from hamcrest import assert_that
+from fake_jenkins.capture import read_capture
+from fake_jenkins.main import parse_args
+from hamcrest import assert_that, has_properties, has_length, greater_than
 from hamcrest import is_
 
 
 class EntrypointTest(unittest.TestCase):
     def setUp(self):
         self.port = random.randrange(10000, 20000)
+        self.process = None
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+
+    def start(self, *args):
         provider = pkg_resources.get_provider(__name__)
         demo_config_path = provider.get_resource_filename(None, 'demo_config.py')
         self.process = subprocess.Popen([
@@ -38,19 +50,68 @@ class EntrypointTest(unittest.TestCase):
                          'fake_jenkins'),
             '0.0.0.0',
             str(self.port)
-        ], env={'FAKE_JENKINS_CONFIG_FILE': demo_config_path})
+        ] + list(args), env={'FAKE_JENKINS_CONFIG_FILE': demo_config_path})
 
-    def tearDown(self):
-        self.process.terminate()
-
-    def test_entry_point(self):
-        for i in xrange(30):
+    def wait_until_ready(self):
+        for i in xrange(300):
             try:
                 result = requests.get('http://127.0.0.1:{0}/'.format(self.port))
                 assert_that(result.status_code, is_(404))
                 break
             except Exception:
-                time.sleep(1)
+                time.sleep(0.1)
+
+    def test_entry_point(self):
+        self.start()
+        self.wait_until_ready()
 
         result = requests.get('http://127.0.0.1:{0}/job/demoJob/api/json'.format(self.port))
         assert_that(result.status_code, is_(200))
+
+    def test_entry_point_with_workers_and_threads(self):
+        self.start('--workers', '2', '--threads', '4')
+        self.wait_until_ready()
+
+        for i in xrange(10):
+            result = requests.get('http://127.0.0.1:{0}/buildByToken/buildWithParameters?job=demoJob&token=token'
+                                  .format(self.port))
+            assert_that(result.status_code, is_(200))
+
+        for i in xrange(10):
+            result = requests.get('http://127.0.0.1:{0}/job/demoJob/api/json'.format(self.port))
+            assert_that(result.json()['builds'], has_length(10))
+
+    def test_captured_requests_are_written_when_terminated(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        capture = os.path.join(directory, 'capture.jsonl')
+        for args in ([], ['--workers', '2']):
+            self.start('--capture', capture, *args)
+            self.wait_until_ready()
+
+            self.process.terminate()
+            self.process.wait()
+
+            assert_that(list(read_capture(capture)), has_length(greater_than(0)))
+            os.remove(capture)
+
+
+class ArgumentsTest(unittest.TestCase):
+    def test_defaults(self):
+        args = parse_args(['127.0.0.1', '8080'])
+
+        assert_that(args, has_properties(host='127.0.0.1', port=8080, workers=1, threads=1, debug=False))
+
+    def test_workers_and_threads(self):
+        args = parse_args(['127.0.0.1', '8080', '--workers', '4', '--threads', '8'])
+
+        assert_that(args, has_properties(workers=4, threads=8))
+
+    def test_debug_cannot_be_combined_with_threads(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['127.0.0.1', '8080', '--debug', '--threads', '8'])
+
+    def test_state_dir_cannot_be_combined_with_workers(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['127.0.0.1', '8080', '--state-dir', '/tmp/state', '--workers', '2'])
+
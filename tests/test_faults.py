@@ -0,0 +1,163 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import socket
+import threading
+import time
+import unittest
+
+from fake_jenkins.faults import ConnectionDropped, Faults, InvalidFaults
+from fake_jenkins.main import create_app
+from fake_jenkins.server import PooledWSGIServer
+from hamcrest import assert_that, is_, has_properties, none, greater_than_or_equal_to, less_than, contains_string
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+
+class FaultsTest(unittest.TestCase):
+    def test_the_first_matching_rule_decides(self):
+        faults = Faults([{'endpoints': ['get_job'], 'methods': ['GET'], 'error_rate': 1, 'error_status': 502},
+                         {'latency': [0.1, 0.2]}])
+
+        assert_that(faults.decide('get_job', 'GET'), has_properties(status=502, drop=False))
+        fault = faults.decide('build', 'GET')
+        assert_that(fault, has_properties(status=None, drop=False))
+        assert_that(0.1 <= fault.delay <= 0.2, is_(True))
+        assert_that(faults.decide('set_faults', 'POST'), is_(none()))
+
+    def test_rates_split_the_requests(self):
+        faults = Faults([{'drop_rate': 0.25, 'throttle_rate': 0.25, 'error_rate': 0.25}])
+
+        outcomes = [faults.decide('get_job', 'GET') for _ in range(2000)]
+
+        assert_that(len([fault for fault in outcomes if fault is None]), greater_than_or_equal_to(400))
+        assert_that(len([fault for fault in outcomes if fault is not None and fault.drop]), greater_than_or_equal_to(400))
+        assert_that(len([fault for fault in outcomes if fault is not None and fault.status == 429]),
+                    greater_than_or_equal_to(400))
+        assert_that(len([fault for fault in outcomes if fault is not None and fault.status == 503]),
+                    greater_than_or_equal_to(400))
+
+    def test_invalid_rules(self):
+        for rules in ({}, [{'latency': -1}], [{'error_status': 404}], [{'drop_rate': 0.6, 'error_rate': 0.6}],
+                      [{'endpoint': 'get_job'}]):
+            with self.assertRaises(InvalidFaults):
+                Faults(rules)
+
+
+class FaultInjectionTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config={'FAKE_JENKINS_FAULTS': [{'endpoints': ['get_job'], 'throttle_rate': 1}]})
+        self.client = self.app.test_client()
+        self.client.post('/job/myJob')
+
+    def tearDown(self):
+        self.app.extensions['fake_jenkins'].scheduler.stop()
+
+    def test_faults_from_the_configuration(self):
+        response = self.client.get('/job/myJob/api/json')
+
+        assert_that(response.status_code, is_(429))
+        assert_that(response.headers['Retry-After'], is_('1'))
+        assert_that(self.client.get('/job/myJob/1/api/json').status_code, is_(404))
+
+    def test_faults_are_changed_at_runtime(self):
+        response = self.client.post('/faults', data=json.dumps({'rules': [
+            {'endpoints': ['get_build'], 'error_rate': 1, 'latency': 0.1}]}))
+        assert_that(response.status_code, is_(204))
+        assert_that(json.loads(self.client.get('/faults').data),
+                    is_({'rules': [{'endpoints': ['get_build'], 'error_rate': 1, 'latency': 0.1}]}))
+
+        start = time.time()
+        assert_that(self.client.get('/job/myJob/1/api/json').status_code, is_(503))
+        assert_that(time.time() - start, greater_than_or_equal_to(0.1))
+        assert_that(self.client.get('/job/myJob/api/json').status_code, is_(200))
+
+        assert_that(self.client.delete('/faults').status_code, is_(204))
+        assert_that(self.client.get('/job/myJob/1/api/json').status_code, is_(404))
+
+    def test_delayed_requests_are_not_limited_by_default(self):
+        self.client.post('/faults', data=json.dumps([{'endpoints': ['get_job'], 'latency': 0.2}]))
+        statuses = []
+
+        def poll():
+            statuses.append(self.app.test_client().get('/job/myJob/api/json').status_code)
+
+        clients = [threading.Thread(target=poll) for _ in range(8)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+        assert_that(statuses, is_([200] * 8))
+
+    def test_only_a_few_requests_are_delayed_at_once_when_asked_for(self):
+        app = create_app(config={'FAKE_JENKINS_FAULTS': [{'endpoints': ['get_job'], 'latency': 0.5}],
+                                 'FAKE_JENKINS_MAX_DELAYED_REQUESTS': 2})
+        self.addCleanup(app.extensions['fake_jenkins'].scheduler.stop)
+        app.test_client().post('/job/myJob')
+        statuses = []
+
+        def poll():
+            statuses.append(app.test_client().get('/job/myJob/api/json').status_code)
+
+        clients = [threading.Thread(target=poll) for _ in range(2)]
+        for thread in clients:
+            thread.start()
+        time.sleep(0.1)
+        start = time.time()
+        response = app.test_client().get('/job/myJob/api/json')
+        elapsed = time.time() - start
+        for thread in clients:
+            thread.join()
+
+        assert_that(response.status_code, is_(503))
+        assert_that(response.headers['Retry-After'], is_('1'))
+        assert_that(elapsed, less_than(0.3))
+        assert_that(statuses, is_([200, 200]))
+
+    def test_invalid_faults_are_rejected(self):
+        response = self.client.post('/faults', data=json.dumps({'rules': [{'drop_rate': 2}]}))
+
+        assert_that(response.status_code, is_(400))
+        assert_that(response.data.decode('utf-8'), contains_string('rules[0].drop_rate'))
+        assert_that(self.client.get('/job/myJob/api/json').status_code, is_(429))
+
+    def test_malformed_faults_are_rejected(self):
+        for body in (b'{"rules": [', b'\xff', b'42', b'"rules"', b'{}'):
+            response = self.client.post('/faults', data=body)
+
+            assert_that(response.status_code, is_(400))
+        assert_that(self.client.get('/job/myJob/api/json').status_code, is_(429))
+
+    def test_dropped_connections_are_not_answered(self):
+        self.client.post('/faults', data=json.dumps([{'endpoints': ['get_job'], 'drop_rate': 1}]))
+        with self.assertRaises(ConnectionDropped):
+            self.client.get('/job/myJob/api/json')
+
+        server = PooledWSGIServer('127.0.0.1', 0, self.app, threads=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', server.server_port, timeout=5)
+            with self.assertRaises((httplib.HTTPException, socket.error)):
+                connection.request('GET', '/job/myJob/api/json')
+                connection.getresponse()
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,146 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fake_jenkins.core import Core, Job, BuildParameter
+from fake_jenkins.journal import Journal, LOG_FILE, SNAPSHOT_FILE
+from fake_jenkins.scheduler import Scheduler
+from hamcrest import assert_that, is_, has_entry, has_properties
+from tests.test_scheduler import FakeClock
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            journal.stop()
+        shutil.rmtree(self.directory)
+
+    def start(self, core=None, flush_interval=60, **kwargs):
+        core = core or Core()
+        journal = Journal(self.directory, flush_interval=flush_interval, **kwargs)
+        journal.recover(core)
+        journal.attach(core)
+        self.journals.append(journal)
+        return core, journal
+
+    def test_jobs_and_builds_are_recovered(self):
+        core, journal = self.start()
+        core.create_job(name='test_job', auth_token='yes', max_builds=10,
+                        parameters=[BuildParameter(name='hello', default_value='')])
+        core.get_job('test_job').create_build(hello='world')
+        core.get_job('test_job').create_build(hello='you')
+        journal.flush()
+
+        recovered, _ = self.start()
+
+        job = recovered.get_job('test_job')
+        assert_that(job, has_properties(auth_token='yes', max_builds=10, next_build_number=3))
+        assert_that(job.get_build(2), has_properties(building=False, result='SUCCESS'))
+        assert_that(job.get_build(2).parameters, has_entry('hello', 'you'))
+
+    def test_folders_and_branches_are_recovered(self):
+        core, journal = self.start()
+        core.create_job(name='team/service', multibranch=True)
+        core.get_job('team/service/main').create_build()
+        journal.flush()
+
+        recovered, _ = self.start()
+
+        assert_that(recovered.get_job('team/service').multibranch, is_(True))
+        assert_that(recovered.list_folder('team/service'), is_(['team/service/main']))
+        assert_that(recovered.get_job('team/service/main').next_build_number, is_(2))
+
+    def test_builds_are_recovered_from_the_snapshot_and_the_log(self):
+        core, journal = self.start()
+        core.create_job(name='test_job')
+        core.get_job('test_job').create_build()
+        journal.compact()
+        core.get_job('test_job').create_build()
+        journal.flush()
+
+        recovered, _ = self.start()
+
+        assert_that(os.path.exists(os.path.join(self.directory, SNAPSHOT_FILE)), is_(True))
+        assert_that(list(recovered.get_job('test_job').builds), is_([1, 2]))
+        assert_that(recovered.get_job('test_job').next_build_number, is_(3))
+
+    def test_compaction_happens_after_enough_records(self):
+        core, journal = self.start(flush_interval=0.01, snapshot_every=3)
+        core.create_job(name='test_job')
+        for _ in range(3):
+            core.get_job('test_job').create_build()
+
+        deadline = time.time() + 5
+        while not os.path.exists(os.path.join(self.directory, SNAPSHOT_FILE)) and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert_that(os.path.exists(os.path.join(self.directory, SNAPSHOT_FILE)), is_(True))
+
+    def test_a_torn_last_record_is_ignored(self):
+        core, journal = self.start()
+        core.create_job(name='test_job')
+        core.get_job('test_job').create_build()
+        journal.flush()
+        with open(os.path.join(self.directory, LOG_FILE), 'ab') as log:
+            log.write(b'["build","test_job",2,')
+
+        recovered, _ = self.start()
+
+        assert_that(list(recovered.get_job('test_job').builds), is_([1]))
+
+    def test_running_builds_are_aborted_on_recovery(self):
+        clock = FakeClock()
+        core, journal = self.start(Core(scheduler=Scheduler(clock=clock)))
+        core.create_job(name='test_job', duration=30)
+        core.get_job('test_job').create_build()
+        journal.flush()
+
+        recovered, _ = self.start()
+
+        assert_that(recovered.get_job('test_job').get_build(1), has_properties(building=False, result='ABORTED'))
+
+    def test_configured_jobs_keep_their_configuration(self):
+        core, journal = self.start(Core(jobs={'test_job': Job('test_job', auth_token='old')}))
+        core.get_job('test_job').create_build()
+        journal.compact()
+
+        recovered, _ = self.start(Core(jobs={'test_job': Job('test_job', auth_token='new')}))
+
+        assert_that(recovered.get_job('test_job'), has_properties(auth_token='new', next_build_number=2))
+
+    def test_retention_is_applied_on_recovery(self):
+        core, journal = self.start()
+        core.create_job(name='test_job', max_build_age=60)
+        core.get_job('test_job').create_build()
+        journal.flush()
+        with open(os.path.join(self.directory, LOG_FILE), 'rb') as log:
+            content = log.read()
+        with open(os.path.join(self.directory, LOG_FILE), 'wb') as log:
+            timestamp = json.dumps(core.get_job('test_job').get_build(1).timestamp).encode('ascii')
+            log.write(content.replace(timestamp, b'0'))
+
+        recovered, _ = self.start()
+
+        assert_that(len(recovered.get_job('test_job').builds), is_(0))
+        assert_that(recovered.get_job('test_job').next_build_number, is_(2))
@@ -0,0 +1,181 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+import unittest
+
+import mock
+import requests
+from fake_jenkins.core import Job
+from fake_jenkins.embedded import FakeJenkins
+from fake_jenkins.limits import Admission, InvalidRateLimit, RateLimiter
+from fake_jenkins.main import create_app
+from fake_jenkins.server import PooledWSGIServer
+from hamcrest import assert_that, is_, close_to
+from tests.test_scheduler import FakeClock
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(rate=2, burst=3, clock=self.clock)
+
+    def test_buckets_refill_at_their_rate(self):
+        assert_that([self.limiter.take([('a', 2, 3, 1)]) for _ in range(4)], is_([0, 0, 0, 0.5]))
+
+        self.clock.now += 0.5
+        assert_that(self.limiter.take([('a', 2, 3, 1)]), is_(0))
+        assert_that(self.limiter.take([('b', 2, 3, 1)]), is_(0))
+
+        self.clock.now += 100
+        assert_that([self.limiter.take([('a', 2, 3, 1)]) for _ in range(4)], is_([0, 0, 0, 0.5]))
+
+    def test_all_demands_are_taken_or_none(self):
+        assert_that(self.limiter.take([('a', 1, 1, 1)]), is_(0))
+
+        assert_that(self.limiter.take([('b', 1, 5, 2), ('a', 1, 1, 1)]), is_(1))
+        assert_that(self.limiter.buckets['b'].tokens, is_(5))
+
+    def test_demands_over_the_burst_go_through_a_full_bucket_and_are_owed(self):
+        assert_that(self.limiter.take([('a', 2, 3, 7)]), is_(0))
+        assert_that(self.limiter.take([('a', 2, 3, 1)]), is_(2.5))
+
+    def test_buckets_are_bounded_and_evicted_least_recently_used_first(self):
+        limiter = RateLimiter(max_clients=2, clock=self.clock)
+        limiter.take([('a', 1, 1, 1)])
+        limiter.take([('b', 1, 1, 1)])
+        limiter.take([('a', 1, 1, 0)])
+        limiter.take([('c', 1, 1, 1)])
+
+        assert_that(list(limiter.buckets), is_(['a', 'c']))
+
+    def test_client_keys(self):
+        assert_that(RateLimiter(rate=1, key='token').client_key('10.0.0.1', 'secret', 'myJob'), is_('secret'))
+        assert_that(RateLimiter(rate=1, key='token').client_key('10.0.0.1', None, 'myJob'), is_('10.0.0.1'))
+        assert_that(RateLimiter(rate=1, key='job').client_key('10.0.0.1', 'secret', 'myJob'), is_('myJob'))
+        assert_that(RateLimiter(rate=2.5).burst, is_(3))
+        for options in ({'rate': 0}, {'rate': float('inf')}, {'rate': 1, 'burst': 0}, {'rate': 1, 'key': 'user'}):
+            with self.assertRaises(InvalidRateLimit):
+                RateLimiter(**options)
+
+    def test_admission(self):
+        admission = Admission(limit=2)
+        assert_that([admission.enter() for _ in range(3)], is_([True, True, False]))
+        admission.leave()
+        assert_that(admission.enter(), is_(True))
+        assert_that(all(Admission().enter() for _ in range(100)), is_(True))
+
+
+class RateLimitedTriggersTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config={
+            'FAKE_JENKINS_JOBS': {'limited': Job('limited', auth_token='token', rate_limit=0.01, rate_burst=2),
+                                  'free': Job('free', auth_token='token')},
+            'FAKE_JENKINS_RATE_LIMIT': {'rate': 0.01, 'burst': 5, 'key': 'token'},
+        })
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app.extensions['fake_jenkins'].scheduler.stop()
+
+    def test_jobs_and_clients_are_limited(self):
+        statuses = [self.client.get('/buildByToken/build?job=limited&token=token').status_code for _ in range(3)]
+        assert_that(statuses, is_([200, 200, 429]))
+        response = self.client.get('/buildByToken/buildWithParameters?job=limited&token=token')
+        assert_that(response.status_code, is_(429))
+        assert_that(int(response.headers['Retry-After']), close_to(100, 1))
+
+        statuses = [self.client.get('/buildByToken/build?job=free&token=token').status_code for _ in range(4)]
+        assert_that(statuses, is_([200, 200, 200, 429]))
+        assert_that(self.client.get('/buildByToken/build?job=free&token=other').status_code, is_(403))
+
+    def test_batches_are_limited_as_a_whole(self):
+        response = self.client.post('/buildByToken/batch', data=json.dumps([
+            {'job': 'free', 'token': 'token', 'count': 3}, {'job': 'limited', 'token': 'token', 'count': 3}]))
+        assert_that(response.status_code, is_(201))
+
+        response = self.client.post('/buildByToken/batch', data=json.dumps([{'job': 'free', 'token': 'token'}]))
+        assert_that(response.status_code, is_(429))
+        assert_that(self.app.extensions['fake_jenkins'].get_job('free').next_build_number, is_(4))
+
+
+class AdmissionControlTest(unittest.TestCase):
+    def test_connections_over_the_limit_are_answered_503(self):
+        release = threading.Event()
+        handling = threading.Semaphore(0)
+
+        def app(environ, start_response):
+            handling.release()
+            release.wait(10)
+            start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+            return [b'ok']
+
+        server = PooledWSGIServer('127.0.0.1', 0, app, threads=4, max_in_flight=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+        try:
+            statuses = []
+            clients = [threading.Thread(target=lambda: statuses.append(requests.get(url, timeout=10).status_code))
+                       for _ in range(2)]
+            for client in clients:
+                client.start()
+            handling.acquire()
+            handling.acquire()
+
+            response = requests.get(url, timeout=10)
+            assert_that(response.status_code, is_(503))
+            assert_that(response.headers['Retry-After'], is_('1'))
+
+            release.set()
+            for client in clients:
+                client.join()
+            assert_that(statuses, is_([200, 200]))
+            assert_that(requests.get(url, timeout=10).status_code, is_(200))
+        finally:
+            release.set()
+            server.shutdown()
+            server.server_close()
+
+    @mock.patch('fake_jenkins.api.EVENTS_HEARTBEAT', 0.2)
+    def test_event_streams_and_waits_leave_a_thread_for_other_requests(self):
+        with FakeJenkins(threads=2) as jenkins:
+            requests.post('{0}job/myJob'.format(jenkins.url))
+            stream = requests.get('{0}job/myJob/events'.format(jenkins.url), stream=True, timeout=10)
+            try:
+                assert_that(stream.status_code, is_(200))
+
+                response = requests.get('{0}job/myJob/events'.format(jenkins.url), timeout=10)
+                assert_that(response.status_code, is_(503))
+                assert_that(response.headers['Retry-After'], is_('1'))
+                response = requests.get('{0}job/myJob/1/api/json?wait=10'.format(jenkins.url), timeout=10)
+                assert_that(response.status_code, is_(503))
+                assert_that(requests.get('{0}job/myJob/api/json'.format(jenkins.url), timeout=10).status_code,
+                            is_(200))
+            finally:
+                stream.close()
+
+    def test_a_single_thread_is_never_held_by_event_streams_and_waits(self):
+        with FakeJenkins(threads=1) as jenkins:
+            requests.post('{0}job/myJob'.format(jenkins.url))
+
+            assert_that(requests.get('{0}job/myJob/events'.format(jenkins.url), timeout=10).status_code, is_(503))
+            assert_that(requests.get('{0}job/myJob/1/api/json?wait=10'.format(jenkins.url),
+                                     timeout=10).status_code, is_(503))
+
+            jenkins.core.get_job('myJob').create_build()
+            assert_that(requests.get('{0}job/myJob/1/api/json?wait=10'.format(jenkins.url),
+                                     timeout=10).status_code, is_(200))
@@ -0,0 +1,88 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from fake_jenkins.manifest import InvalidManifest, load_manifest, load_manifest_file, jobs_from_specs
+from hamcrest import assert_that, is_, has_length, has_properties, contains_string
+
+
+class ManifestTest(unittest.TestCase):
+    def test_load_a_json_list_of_jobs(self):
+        specs = load_manifest(json.dumps([
+            {'name': 'myJob', 'auth_token': 'yes', 'duration': [1, 2], 'outcomes': {'SUCCESS': 1}},
+        ]))
+
+        assert_that(specs, is_([{'name': 'myJob', 'auth_token': 'yes', 'duration': [1, 2],
+                                 'outcomes': {'SUCCESS': 1}}]))
+
+    def test_parameters_default_to_an_empty_value(self):
+        specs = load_manifest(json.dumps({'jobs': [{'name': 'myJob', 'parameters': [{'name': 'hello'}]}]}))
+
+        assert_that(specs[0]['parameters'][0], has_properties(name='hello', default_value=''))
+
+    @unittest.skipIf(yaml is None, 'PyYAML is not installed')
+    def test_load_yaml(self):
+        specs = load_manifest('jobs:\n  - name: myJob\n    max_builds: 10\n')
+
+        assert_that(specs, is_([{'name': 'myJob', 'max_builds': 10}]))
+
+    def test_yaml_is_only_imported_for_yaml_manifests(self):
+        code = 'import sys, fake_jenkins.main; sys.exit("yaml" in sys.modules)'
+
+        assert_that(subprocess.call([sys.executable, '-c', code]), is_(0))
+
+    def test_invalid_manifests(self):
+        for data, message in [
+            ({'jobs': {}}, 'must be a list'),
+            ([{'name': ''}], 'jobs[0].name'),
+            ([{'name': 'a'}, {'name': 'a'}], 'duplicate'),
+            ([{'name': 'a', 'max_build': 10}], 'unknown options: max_build'),
+            ([{'name': 'a', 'max_builds': -1}], 'jobs[0].max_builds'),
+            ([{'name': 'a', 'max_builds': 0}], 'jobs[0].max_builds'),
+            ([{'name': 'a', 'priority': True}], 'jobs[0].priority'),
+            ([{'name': 'a', 'multibranch': 'yes'}], 'jobs[0].multibranch'),
+            ([{'name': 'a', 'rate_limit': 0}], 'jobs[0].rate_limit'),
+            ([{'name': 'a', 'rate_limit': float('inf')}], 'jobs[0].rate_limit'),
+            ([{'name': 'a', 'duration': [1, float('inf')]}], 'jobs[0].duration'),
+            ([{'name': 'a', 'rate_burst': 0}], 'jobs[0].rate_burst'),
+            ([{'name': 'a', 'outcomes': {'SUCCESS': 'often'}}], 'jobs[0].outcomes'),
+            ([{'name': 'a', 'parameters': [{'default_value': 'x'}]}], 'jobs[0].parameters[0]'),
+        ]:
+            with self.assertRaises(InvalidManifest) as context:
+                load_manifest(json.dumps(data))
+            assert_that(str(context.exception), contains_string(message))
+
+    def test_load_manifest_file_into_jobs(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'jobs.json')
+        with open(path, 'w') as f:
+            f.write(json.dumps([{'name': 'job{0}'.format(i)} for i in range(1000)]))
+
+        jobs = jobs_from_specs(load_manifest_file(path))
+
+        assert_that(jobs, has_length(1000))
+        assert_that(jobs['job42'], has_properties(name='job42', auth_token=None))
@@ -0,0 +1,73 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fake_jenkins.metrics import Metrics, Profiler
+from hamcrest import assert_that, is_, contains_string, has_items
+
+
+class MetricsTest(unittest.TestCase):
+    def test_counter(self):
+        metrics = Metrics()
+        counter = metrics.counter('requests_total', 'Requests', labels=('endpoint', 'status'))
+        counter.inc(('get_job', 200))
+        counter.inc(('get_job', 200))
+        counter.inc(('get_job', 404))
+
+        assert_that(metrics.render().splitlines(), is_([
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{endpoint="get_job",status="200"} 2',
+            'requests_total{endpoint="get_job",status="404"} 1',
+        ]))
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = Metrics()
+        histogram = metrics.histogram('latency_seconds', 'Latency', labels=('endpoint',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(('get_job',), value)
+
+        assert_that(metrics.render().splitlines(), has_items(
+            'latency_seconds_bucket{endpoint="get_job",le="0.1"} 2',
+            'latency_seconds_bucket{endpoint="get_job",le="1"} 3',
+            'latency_seconds_bucket{endpoint="get_job",le="+Inf"} 4',
+            'latency_seconds_sum{endpoint="get_job"} 2.65',
+            'latency_seconds_count{endpoint="get_job"} 4',
+        ))
+
+    def test_gauge(self):
+        metrics = Metrics()
+        metrics.gauge('jobs', 'Jobs', lambda: 3)
+
+        assert_that(metrics.render(), contains_string('\njobs 3\n'))
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.counter('total', 'Total', labels=('name',)).inc(('a "b"',))
+
+        assert_that(metrics.render(), contains_string('total{name="a \\"b\\""} 1'))
+
+    def test_profiler_samples_at_its_rate(self):
+        assert_that(Profiler(rate=0).sampled(), is_(False))
+        assert_that(Profiler(rate=1).sampled(), is_(True))
+
+    def test_profiler_report(self):
+        profiler = Profiler(rate=1)
+        result = profiler.profile('get_job', sorted, [3, 1, 2])
+        profiler.profile('get_job', sorted, [2, 1])
+
+        assert_that(result, is_([1, 2, 3]))
+        assert_that(profiler.report(), contains_string('get_job: 2 sampled requests'))
+        assert_that(profiler.report('get_build'), is_(''))
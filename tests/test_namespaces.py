@@ -0,0 +1,55 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from fake_jenkins.core import Job
+from fake_jenkins.main import create_app
+from hamcrest import assert_that, is_, has_entries
+
+
+class NamespacesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config={'FAKE_JENKINS_JOBS': {'myJob': Job('myJob', auth_token='token')}})
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app.extensions['fake_jenkins'].scheduler.stop()
+
+    def test_namespaces_are_isolated(self):
+        assert_that(self.client.get('/ns/worker-1/buildByToken/build?job=myJob&token=token').status_code, is_(200))
+        assert_that(self.client.post('/ns/worker-1/job/created').status_code, is_(201))
+
+        job = json.loads(self.client.get('/ns/worker-1/job/myJob/api/json').data)
+        assert_that(job, has_entries(nextBuildNumber=2, url='http://localhost/ns/worker-1/job/myJob/'))
+        assert_that(self.client.get('/ns/worker-2/job/myJob/1/api/json').status_code, is_(404))
+        assert_that(self.client.get('/ns/worker-2/job/created/api/json').status_code, is_(404))
+        assert_that(self.client.get('/job/myJob/1/api/json').status_code, is_(404))
+
+    def test_namespaces_start_from_the_configured_jobs(self):
+        self.client.post('/job/created')
+        self.client.get('/buildByToken/build?job=myJob&token=token')
+
+        assert_that(self.client.get('/ns/worker-1/job/myJob/api/json').status_code, is_(200))
+        assert_that(self.client.get('/ns/worker-1/job/myJob/1/api/json').status_code, is_(404))
+        assert_that(self.client.get('/ns/worker-1/job/created/api/json').status_code, is_(404))
+
+    def test_namespaces_snapshot_and_restore_on_their_own(self):
+        assert_that(self.client.post('/ns/worker-1/snapshot').status_code, is_(204))
+        self.client.get('/ns/worker-1/buildByToken/build?job=myJob&token=token')
+        assert_that(self.client.post('/snapshot/restore').status_code, is_(404))
+
+        assert_that(self.client.post('/ns/worker-1/snapshot/restore').status_code, is_(204))
+        assert_that(self.client.get('/ns/worker-1/job/myJob/1/api/json').status_code, is_(404))
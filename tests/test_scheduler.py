@@ -0,0 +1,75 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+
+from fake_jenkins.scheduler import Scheduler
+from hamcrest import assert_that, is_
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock)
+        self.calls = []
+
+    def test_callbacks_run_when_due(self):
+        self.scheduler.call_later(10, self.calls.append, 'a')
+
+        self.scheduler.run_pending()
+        assert_that(self.calls, is_([]))
+
+        self.clock.now += 10
+        self.scheduler.run_pending()
+        assert_that(self.calls, is_(['a']))
+
+    def test_callbacks_run_in_deadline_order(self):
+        self.scheduler.call_later(5, self.calls.append, 'late')
+        self.scheduler.call_later(1, self.calls.append, 'early')
+        self.scheduler.call_later(1, self.calls.append, 'early too')
+
+        self.clock.now += 5
+        self.scheduler.run_pending()
+
+        assert_that(self.calls, is_(['early', 'early too', 'late']))
+
+    def test_failing_callback_does_not_stop_the_others(self):
+        def fail():
+            raise ValueError()
+        self.scheduler.call_later(1, fail)
+        self.scheduler.call_later(1, self.calls.append, 'a')
+
+        self.clock.now += 1
+        self.scheduler.run_pending()
+
+        assert_that(self.calls, is_(['a']))
+
+    def test_started_scheduler_runs_callbacks_in_background(self):
+        scheduler = Scheduler()
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        done = threading.Event()
+
+        scheduler.call_later(0.01, done.set)
+
+        assert_that(done.wait(5), is_(True))
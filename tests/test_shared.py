@@ -0,0 +1,283 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from fake_jenkins.auth import hash_token
+from fake_jenkins.core import BuildParameter, JobNotFound, BuildNotFound, Job, Build, QueueItemNotFound
+from fake_jenkins.scheduler import Scheduler
+from fake_jenkins.shared import SharedCore
+from hamcrest import assert_that, is_, has_entry, has_entries, has_length, contains, has_properties, \
+    same_instance, not_
+from tests.test_scheduler import FakeClock
+
+
+class SharedCoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.sqlite')
+        self.core = SharedCore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_core_can_take_jobs(self):
+        c = SharedCore(self.path, jobs={'myJob': Job('myJob', auth_token='yes',
+                                                     parameters=[BuildParameter(name='hello', default_value='')])})
+        job = c.get_job('myJob')
+
+        assert_that(job, has_properties(name='myJob', auth_token='yes'))
+        assert_that(job.parameters[0], has_properties(name='hello', default_value=''))
+
+    def test_configured_jobs_do_not_reset_existing_state(self):
+        SharedCore(self.path, jobs={'myJob': Job('myJob', auth_token=None)}).get_job('myJob').create_build()
+
+        c = SharedCore(self.path, jobs={'myJob': Job('myJob', auth_token=None)})
+
+        assert_that(c.get_job('myJob').next_build_number, is_(2))
+
+    def test_job_doesnt_exist(self):
+        with self.assertRaises(JobNotFound):
+            self.core.get_job('test_job')
+
+    def test_build_with_parameters(self):
+        self.core.create_job(name='test_job', parameters=[BuildParameter(name='hello',
+                                                                         default_value='')])
+        job = self.core.get_job('test_job')
+
+        build = job.create_build(hello='world')
+        assert_that(build.number, is_(1))
+        assert_that(job.get_build(1).parameters, has_entry('hello', 'world'))
+        assert_that(job.next_build_number, is_(2))
+
+    def test_job_get_builds_newest_first(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        for _ in range(5):
+            job.create_build()
+
+        assert_that([b.number for b in job.get_builds()], is_([5, 4, 3, 2, 1]))
+        assert_that([b.number for b in job.get_builds(1, 3)], is_([4, 3]))
+        assert_that(job.last_build.number, is_(5))
+
+    def test_job_keeps_at_most_max_builds(self):
+        self.core.create_job(name='test_job', max_builds=3)
+        job = self.core.get_job('test_job')
+
+        for _ in range(10):
+            job.create_build()
+
+        assert_that([b.number for b in job.get_builds()], is_([10, 9, 8]))
+        with self.assertRaises(BuildNotFound):
+            job.get_build(7)
+
+    def test_job_discards_builds_older_than_max_build_age(self):
+        self.core.create_job(name='test_job', max_build_age=60)
+        job = self.core.get_job('test_job')
+        job.builds[1] = Build(1, timestamp=time.time() - 120)
+        job.next_build_number = 2
+        job.create_build()
+
+        assert_that(list(job.builds), is_([2]))
+
+    def test_build_runs_for_the_job_duration(self):
+        clock = FakeClock()
+        c = SharedCore(self.path, scheduler=Scheduler(clock=clock))
+        c.create_job(name='test_job', duration=30, outcomes={'FAILURE': 1})
+
+        c.get_job('test_job').create_build()
+        assert_that(c.get_job('test_job').get_build(1), has_properties(building=True, result=None))
+
+        clock.now += 30
+        c.scheduler.run_pending()
+        assert_that(c.get_job('test_job').get_build(1), has_properties(building=False, result='FAILURE', duration=30))
+
+    def test_job_get_build_not_found(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+
+        with self.assertRaises(BuildNotFound):
+            job.get_build(42)
+
+    def test_recreating_a_job_discards_its_builds(self):
+        self.core.create_job(name='test_job')
+        self.core.get_job('test_job').create_build()
+
+        self.core.create_job(name='test_job')
+
+        assert_that(self.core.get_job('test_job').builds, has_length(0))
+        assert_that(self.core.get_job('test_job').next_build_number, is_(1))
+
+    def test_job_version_changes_with_builds(self):
+        self.core.create_job(name='test_job')
+        job = self.core.get_job('test_job')
+        version = job.version
+
+        SharedCore(self.path).get_job('test_job').create_build()
+
+        assert_that(job.version == version, is_(False))
+
+    def test_state_is_shared_between_cores(self):
+        other = SharedCore(self.path)
+        self.core.create_job(name='test_job')
+
+        other.get_job('test_job').create_build()
+        self.core.get_job('test_job').create_build()
+
+        assert_that([b.number for b in other.get_job('test_job').builds.values()], contains(1, 2))
+
+    def test_concurrent_processes_number_builds_without_gaps(self):
+        self.core.create_job(name='test_job')
+
+        children = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    job = self.core.get_job('test_job')
+                    for _ in range(50):
+                        job.create_build()
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        job = self.core.get_job('test_job')
+        assert_that(list(job.builds), is_(list(range(1, 201))))
+        assert_that(job.next_build_number, is_(201))
+
+    def test_wait_for_a_build_from_another_core(self):
+        self.core.create_job(name='test_job')
+        other = SharedCore(self.path)
+        threading.Timer(0.1, lambda: other.get_job('test_job').create_build()).start()
+
+        assert_that(self.core.get_job('test_job').wait_for_build(1, timeout=10), is_(True))
+        assert_that(self.core.get_job('test_job').wait_for_build(2, timeout=0.05), is_(False))
+
+    def test_find_job_by_token(self):
+        self.core.create_job(name='test_job', auth_token=hash_token('token'))
+
+        assert_that(SharedCore(self.path).find_job_by_token('token').name, is_('test_job'))
+        with self.assertRaises(JobNotFound):
+            self.core.find_job_by_token(hash_token('token'))
+
+    def test_jobs_in_folders(self):
+        self.core.create_jobs([{'name': 'team/service/main'}, {'name': 'team/service/release'}, {'name': 'team-b'}])
+        self.core.create_job(name='team/multi', multibranch=True)
+        other = SharedCore(self.path)
+        other.get_job('team/multi/feature').create_build()
+
+        assert_that(self.core.list_folder(), is_(['team', 'team-b']))
+        assert_that(self.core.list_folder('team'), is_(['team/multi', 'team/service']))
+        assert_that(self.core.list_folder('team/multi'), is_(['team/multi/feature']))
+        assert_that(self.core.find_jobs('team/service/'), is_(['team/service/main', 'team/service/release']))
+        assert_that(self.core.get_job('team/multi/feature').next_build_number, is_(2))
+        with self.assertRaises(JobNotFound):
+            self.core.list_folder('team-b')
+
+    def test_views_see_the_jobs_of_other_cores(self):
+        c = SharedCore(self.path, views={'services': '.*-service'})
+        SharedCore(self.path).create_jobs([{'name': 'a-service', 'outcomes': {'FAILURE': 1}}, {'name': 'other'}])
+        SharedCore(self.path).get_job('a-service').create_build()
+
+        assert_that(json.loads(c.get_view('services').render('/').decode('utf-8')),
+                    has_entries(name='a-service', url='/job/a-service/', color='red'))
+
+    def test_queue_items_are_numbered_across_processes(self):
+        self.core.create_job(name='test_job')
+
+        children = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    job = self.core.get_job('test_job')
+                    for _ in range(20):
+                        self.core.queue.schedule(job)
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        items = [SharedCore(self.path).queue.get_item(item_id) for item_id in range(1, 81)]
+        assert_that(sorted(item.executable.number for item in items), is_(list(range(1, 81))))
+
+    def test_executors_are_shared_between_cores(self):
+        clock = FakeClock()
+        c = SharedCore(self.path, scheduler=Scheduler(clock=clock), executors=1)
+        other = SharedCore(self.path, executors=1)
+        c.create_job(name='test_job', duration=10, parameters=[BuildParameter(name='hello', default_value='')])
+
+        first = c.queue.schedule(c.get_job('test_job'))
+        second = other.queue.schedule(other.get_job('test_job'), {'hello': 'you'})
+        third = other.queue.schedule(other.get_job('test_job'))
+        other.queue.cancel(third.id)
+
+        assert_that(first.executable, has_properties(number=1))
+        assert_that(second.executable, is_(None))
+        assert_that([item.id for item in c.queue.get_pending_items()], is_([second.id]))
+
+        clock.now += 10
+        c.scheduler.run_pending()
+
+        assert_that(other.queue.get_item(second.id).executable, has_properties(number=2,
+                                                                                parameters={'hello': 'you'}))
+        assert_that(other.queue.get_item(third.id), has_properties(cancelled=True, executable=None))
+        assert_that(c.queue.count_pending_items(), is_(0))
+
+    def test_builds_of_a_recreated_job_are_not_replaced_by_the_previous_ones(self):
+        clock = FakeClock()
+        c = SharedCore(self.path, scheduler=Scheduler(clock=clock), executors=1)
+        c.create_job(name='test_job', duration=10)
+        c.queue.schedule(c.get_job('test_job'))
+
+        clock.now += 5
+        c.create_job(name='test_job', duration=10)
+        second = c.queue.schedule(c.get_job('test_job'))
+        third = c.queue.schedule(c.get_job('test_job'))
+        clock.now += 5
+        c.scheduler.run_pending()
+
+        assert_that(second.executable, has_properties(number=1))
+        assert_that(c.get_job('test_job').get_build(1), has_properties(building=True, result=None))
+        assert_that(c.queue.get_item(third.id).executable, is_(None))
+
+        clock.now += 5
+        c.scheduler.run_pending()
+
+        assert_that(c.get_job('test_job').get_build(1), has_properties(building=False, result='SUCCESS'))
+        assert_that(c.queue.get_item(third.id).executable, has_properties(number=2))
+
+    def test_queue_item_not_found(self):
+        with self.assertRaises(QueueItemNotFound):
+            self.core.queue.get_item(42)
+
+    def test_listings_are_rebuilt_once_jobs_or_builds_change(self):
+        self.core.create_job(name='test_job')
+        listing = self.core.get_view('all')
+
+        assert_that(self.core.get_view('all'), is_(same_instance(listing)))
+
+        SharedCore(self.path).get_job('test_job').create_build()
+
+        assert_that(self.core.get_view('all'), is_(not_(same_instance(listing))))
+        assert_that(json.loads(self.core.get_view('all').render('/').decode('utf-8')), has_entries(color='blue'))
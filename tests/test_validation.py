@@ -0,0 +1,44 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fake_jenkins.validation import duration, integer, non_negative_number, optional, positive_integer, \
+    positive_number, string, strings
+from hamcrest import assert_that, is_
+
+
+class ValidationTest(unittest.TestCase):
+    def test_booleans_are_not_numbers(self):
+        for check in (integer, positive_integer, non_negative_number, positive_number, duration):
+            assert_that(check(True), is_(False))
+
+    def test_bounds(self):
+        assert_that([positive_integer(value) for value in (0, 1, 1.0)], is_([False, True, False]))
+        assert_that([non_negative_number(value) for value in (-0.5, 0, 0.5)], is_([False, True, True]))
+        assert_that([positive_number(value) for value in (0, 0.5)], is_([False, True]))
+
+    def test_numbers_are_finite(self):
+        for check in (non_negative_number, positive_number, duration):
+            assert_that([check(value) for value in (float('inf'), float('nan'))], is_([False, False]))
+        assert_that(duration([0, float('inf')]), is_(False))
+
+    def test_durations_are_a_number_or_an_ordered_pair(self):
+        assert_that([duration(value) for value in (0, [1, 2], (1, 1), [2, 1], [1, -1], [1])],
+                    is_([True, True, True, False, False, False]))
+
+    def test_strings_and_optional_values(self):
+        assert_that([string(value) for value in (u'a', b'a', 1)], is_([True, True, False]))
+        assert_that([strings(value) for value in ([], [u'a'], [u'a', 1], u'a')], is_([True, True, False, False]))
+        assert_that([optional(string)(value) for value in (None, u'a', 1)], is_([True, True, False]))
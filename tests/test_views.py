@@ -0,0 +1,88 @@
+# Copyright 2016 Internap
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from fake_jenkins.core import Build, Core, InvalidView, Job, ViewNotFound
+from fake_jenkins.views import job_color
+from hamcrest import assert_that, is_, contains, has_entries
+
+
+class ViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.core = Core(jobs={'configured': Job('configured', auth_token=None)}, views={'services': '.*service.*'})
+
+    def render(self, name):
+        return json.loads(b'[' + self.core.get_view(name).render('http://jenkins/') + b']')
+
+    def test_the_all_view_lists_top_level_items(self):
+        self.core.create_jobs([{'name': 'team/service/main'}, {'name': 'b-service', 'outcomes': {'FAILURE': 1}}])
+        self.core.get_job('b-service').create_build()
+
+        assert_that(self.render('all'), contains(
+            has_entries(name='b-service', color='red', url='http://jenkins/job/b-service/'),
+            has_entries(name='configured', color='notbuilt'),
+            {'_class': 'com.cloudbees.hudson.plugins.folder.Folder', 'name': 'team', 'fullName': 'team',
+             'url': 'http://jenkins/job/team/'}))
+
+    def test_views_list_matching_jobs_at_any_depth(self):
+        self.core.create_jobs([{'name': 'team/service/main'}, {'name': 'b-service'}, {'name': 'other'}])
+
+        assert_that([job['fullName'] for job in self.render('services')], is_(['b-service', 'team/service/main']))
+
+        self.core.create_view('others', 'oth.*')
+        assert_that([job['name'] for job in self.render('others')], is_(['other']))
+
+    def test_listings_only_change_with_the_state_of_their_jobs(self):
+        self.core.create_jobs([{'name': 'a-service'}, {'name': 'other'}])
+        services = self.core.get_view('services')
+        version = services.version
+
+        self.core.get_job('other').create_build()
+        assert_that(services.version, is_(version))
+        self.core.get_job('a-service').create_build()
+        assert_that(services.version == version, is_(False))
+
+        version = services.version
+        self.core.get_job('a-service').create_build()
+        assert_that(services.version, is_(version))
+
+    def test_restore_removes_new_jobs_from_listings(self):
+        self.core.create_jobs([{'name': 'team/a-service'}])
+        self.core.snapshot()
+        self.core.create_jobs([{'name': 'team/b-service'}, {'name': 'c-service'}, {'name': 'other/job'}])
+        self.core.get_job('team/a-service').create_build()
+
+        self.core.restore()
+
+        assert_that(self.render('all'), contains(has_entries(name='configured'), has_entries(name='team')))
+        assert_that(self.render('services'), contains(has_entries(fullName='team/a-service', color='notbuilt')))
+
+    def test_job_color(self):
+        job = Job('test_job', auth_token=None)
+        assert_that(job_color(job), is_('notbuilt'))
+        job.create_build()
+        assert_that(job_color(job), is_('blue'))
+        job.builds[2] = Build(2, building=True, result=None)
+        job.next_build_number = 3
+        assert_that(job_color(job), is_('blue_anime'))
+
+    def test_unknown_and_invalid_views(self):
+        with self.assertRaises(ViewNotFound):
+            self.core.get_view('missing')
+        with self.assertRaises(InvalidView):
+            self.core.create_view('broken', '(')
+        with self.assertRaises(InvalidView):
+            self.core.create_view('all', '.*')